@@ -9,21 +9,44 @@ set -e  # Exit script if any command fails
 # Logging Setup
 LOG_DATE=$(date +"%d-%m-%Y")
 
-# Find the highest existing index in logs/$LOG_DATE
 LOG_BASE="logs/$LOG_DATE/KG_Agent_MK2"
-LAST_INDEX=$(ls -d ${LOG_BASE}_* 2>/dev/null | awk -F'_' '{print $NF}' | sort -n | tail -1)
 
-# Increment index or start from 1
-if [[ -z "$LAST_INDEX" ]]; then
-    RUN_INDEX=1
+# Resume an interrupted run, or atomically claim the next free index in logs/$LOG_DATE
+# (runs started at the same time get different indexes)
+if [[ -n "$RESUME_RUN_INDEX" ]]; then
+    RUN_INDEX=$RESUME_RUN_INDEX
+    RESUME="True"
 else
-    RUN_INDEX=$((LAST_INDEX + 1))
+    RUN_INDEX=$(python run_allocator.py allocate --log_base "$LOG_BASE")
 fi
+RESUME="${RESUME:-False}"
 
 # Define indexed log directory
 LOG_DIR="${LOG_BASE}_${RUN_INDEX}"
 TEMP_OUTPUT_DIR="$LOG_DIR/misc/temp"
+mkdir -p "$LOG_DIR"
+
+# Only one process may work on a run directory, e.g. when the same run is resumed twice
+exec 9>"$LOG_DIR/run.lock"
+if ! flock -n 9; then
+    echo "ERROR: Run $RUN_INDEX ($LOG_DIR) is already running."
+    exit 1
+fi
+
+# Per-run temp directory, so temporary files of parallel runs (shexer, rdflib) never collide
+export TMPDIR="$LOG_DIR/misc/tmp"
+mkdir -p "$TMPDIR"
+trap 'rm -rf "$TMPDIR"' EXIT
+
+# Parallel runs share the LLM and endpoint budgets (HOST_LLM_CONCURRENCY, HOST_ENDPOINT_CONCURRENCY) and throttles
+export HOST_GOVERNOR_DIR="${HOST_GOVERNOR_DIR:-./cache/governor}"
 JSON_PATH_FILE_NAME="$TEMP_OUTPUT_DIR/experiment_nr_${RUN_INDEX}.json"
+RESULTS_DB="${RESULTS_DB:-/root/KG_Agent/KG_Agent_MK2/Experiment_Results/results.db}"
+RESULTS_CSV="/root/KG_Agent/KG_Agent_MK2/Experiment_Results/results.csv"
+# Per-run Chrome traces of all stages; the latency tables in the summary are computed from them
+TRACE_DIR="$LOG_DIR/trace"
+# Structured JSONL log records of all stages (prompts, queries and results only at LOG_LEVEL=debug, for a sample of questions)
+EVENT_LOG_DIR="$LOG_DIR/events"
 
 mkdir -p "$LOG_DIR/misc/meta"
 mkdir -p $TEMP_OUTPUT_DIR
@@ -32,7 +55,7 @@ exec > >(tee -a "$LOG_DIR/6_job.out") 2> >(tee -a "$LOG_DIR/6_job.err" >&2)
 
 # Extended Logging for `track_files.py`
 python "track_files.py" \
-  --root-dir "./" --output "$LOG_DIR/misc/meta" \
+  --root-dir "./" --output "$LOG_DIR/misc/meta" --store "./logs/.objects" \
   > "$LOG_DIR/5_track_files.log" 2> "$LOG_DIR/5_track_files.err"
 
 if [ $? -ne 0 ]; then
@@ -44,6 +67,7 @@ echo ""  # Blank line for separation
 
 echo "🔧 Running KG_Agent_MK2.sh with the following parameters:"
 echo "NUM_QUESTIONS                         = $NUM_QUESTIONS" #if set to 0, it will process all questions
+echo "LANGUAGES                             = ${LANGUAGES:-None}"
 echo "MAX_CONSECUTIVE_RETRIES               = $MAX_CONSECUTIVE_RETRIES"
 echo "LOG_DIR                               = $LOG_DIR"
 echo "JSON_PATH_FILE_NAME                   = $JSON_PATH_FILE_NAME"
@@ -61,101 +85,208 @@ echo "LOCAL_GRAPH_LOCATION                  = $LOCAL_GRAPH_LOCATION"
 echo "SPARQL_ENDPOINT_URL                   = $SPARQL_ENDPOINT_URL"
 echo "EXISTING_SHAPE_PATH                   = $EXISTING_SHAPE_PATH"
 echo "SHAPE_TYPE                            = $SHAPE_TYPE"
+echo "SHAPE_FORMAT                          = ${SHAPE_FORMAT:-native}"
 echo "DATASET_TYPE                          = $DATASET_TYPE"
 echo "ANNOTATION                            = $ANNOTATION"
 echo "BASELINE_RUN                          = $BASELINE_RUN"
+echo "SINGLE_PROCESS_PIPELINE               = $SINGLE_PROCESS_PIPELINE"
+echo "STREAMING_PIPELINE                    = $STREAMING_PIPELINE"
+echo "RESUME                                = $RESUME"
+echo "SHARD                                 = ${SHARD_INDEX:-0}/${SHARD_COUNT:-1}"
+echo "RESULTS_DB                            = $RESULTS_DB"
+echo "TRACE_DIR                             = $TRACE_DIR"
+echo "HOST_GOVERNOR_DIR                     = $HOST_GOVERNOR_DIR (LLM: ${HOST_LLM_CONCURRENCY:-unlimited}, endpoints: ${HOST_ENDPOINT_CONCURRENCY:-unlimited})"
+echo "EVENT_LOG_DIR                         = $EVENT_LOG_DIR (${LOG_LEVEL:-info}, sample ${LOG_SAMPLE_RATE:-0.1})"
+echo "GOLD_ANSWERS                          = ${GOLD_ANSWERS:-False} (drift check: ${GOLD_DRIFT_CHECK:-False})"
+echo "LABEL_INDEX                           = ${LABEL_INDEX:-None} (endpoint fallback: ${LABEL_INDEX_FALLBACK:-True})"
+echo "SPARQL_ENDPOINT_POOL                  = ${SPARQL_ENDPOINT_POOL:-None}"
+echo "CASSETTE_PATH                         = ${CASSETTE_PATH:-None} (${CASSETTE_MODE:-replay})"
 echo ""  # Blank line for separation
 
 set -x  # Enable debugging
 
-python ./extract_entity_list.py \
-  --benchmark_dataset $BENCHMARK_DATASET \
-  --output_file $JSON_PATH_FILE_NAME \
-  --api_key $API_KEY_ENTITY_EXTRACTION \
-  --num_questions $NUM_QUESTIONS \
-  --model $MODEL_ENTITY_EXTRACTION \
-  --llm_provider $LLM_PROVIDER_ENTITY_EXTRACTION \
-  --max_tokens $MAX_TOKENS_ENTITY_EXTRACTION \
-  --temperature $TEMPERATURE_ENTITY_EXTRACTION \
-  --is_local_graph $IS_LOCAL_GRAPH \
-  --system_prompt_path $SYSTEM_PROMPT_ENTITY_EXTRACTION \
-  --dataset_type $DATASET_TYPE \
-  --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
-  --local_graph_location $LOCAL_GRAPH_LOCATION \
-  --baseline_run $BASELINE_RUN \
-  > "$LOG_DIR/1_extract_entity_list.out" 2> "$LOG_DIR/1_extract_entity_list.err"
-echo ""  # Blank line for separation
+# A new results store starts with the runs of the existing summaries, which results.csv was built from before
+python results_store.py import \
+  --db "$RESULTS_DB" \
+  --base "$(dirname "$RESULTS_CSV")" \
+  --if_new \
+  > "$LOG_DIR/misc/meta/results_store_backfill.out" 2> "$LOG_DIR/misc/meta/results_store_backfill.err"
 
-python generate_shape.py \
-  --shape_output_path "$TEMP_OUTPUT_DIR/shapes" \
-  --target_json_file $JSON_PATH_FILE_NAME \
-  --is_local_graph $IS_LOCAL_GRAPH \
-  --local_graph_location $LOCAL_GRAPH_LOCATION \
-  --shape_type $SHAPE_TYPE \
-  --existing_shape_path $EXISTING_SHAPE_PATH \
-  --dataset_type $DATASET_TYPE \
-  --annotation $ANNOTATION \
-  --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
-  --baseline_run $BASELINE_RUN \
-  > "$LOG_DIR/2_generate_shape.out" 2> "$LOG_DIR/2_generate_shape.err"
-echo ""  # Blank line for separation
+if [[ "${SINGLE_PROCESS_PIPELINE,,}" == "true" ]]; then
+  # Run all stages in one interpreter with warm clients and in-memory handoff
+  python pipeline.py \
+    --benchmark_dataset $BENCHMARK_DATASET \
+    --json_path $JSON_PATH_FILE_NAME \
+    --shape_output_path "$TEMP_OUTPUT_DIR/shapes" \
+    --num_questions $NUM_QUESTIONS \
+    --llm_provider_entity_extraction $LLM_PROVIDER_ENTITY_EXTRACTION \
+    --llm_provider_sparql_generation $LLM_PROVIDER_SPARQL_GENERATION \
+    --model_entity_extraction $MODEL_ENTITY_EXTRACTION \
+    --model_sparql_generation $MODEL_SPARQL_GENERATION \
+    --api_key_entity_extraction $API_KEY_ENTITY_EXTRACTION \
+    --api_key_sparql_generation $API_KEY_SPARQL_GENERATION \
+    --max_tokens_entity_extraction $MAX_TOKENS_ENTITY_EXTRACTION \
+    --temperature_entity_extraction $TEMPERATURE_ENTITY_EXTRACTION \
+    --batch_size_entity_extraction ${BATCH_SIZE_ENTITY_EXTRACTION:-1} \
+    --languages ${LANGUAGES:-None} \
+    --max_tokens_sparql_generation $MAX_TOKENS_SPARQL_GENERATION \
+    --temperature_sparql_generation $TEMPERATURE_SPARQL_GENERATION \
+    --system_prompt_entity_extraction $SYSTEM_PROMPT_ENTITY_EXTRACTION \
+    --system_prompt_sparql_generation $SYSTEM_PROMPT_SPARQL_GENERATION \
+    --system_prompt_sparql_generation_baseline_run $SYSTEM_PROMPT_SPARQL_GENERATION_BASELINE_RUN \
+    --is_local_graph $IS_LOCAL_GRAPH \
+    --local_graph_location $LOCAL_GRAPH_LOCATION \
+    --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
+    --existing_shape_path $EXISTING_SHAPE_PATH \
+    --shape_type $SHAPE_TYPE \
+    --shape_format ${SHAPE_FORMAT:-native} \
+    --dataset_type $DATASET_TYPE \
+    --annotation $ANNOTATION \
+    --baseline_run $BASELINE_RUN \
+    --max_retries $MAX_CONSECUTIVE_RETRIES \
+    --log_dir $LOG_DIR \
+    --run_index $RUN_INDEX \
+    --streaming ${STREAMING_PIPELINE:-False} \
+    --resume $RESUME \
+    --shard_index ${SHARD_INDEX:-0} \
+    --shard_count ${SHARD_COUNT:-1} \
+    --results_db $RESULTS_DB \
+    --gold_answers ${GOLD_ANSWERS:-False} \
+    --gold_drift_check ${GOLD_DRIFT_CHECK:-False} \
+    --label_index ${LABEL_INDEX:-None} \
+    --label_index_fallback ${LABEL_INDEX_FALLBACK:-True} \
+    --trace_dir "$TRACE_DIR" \
+    --event_log_dir "$EVENT_LOG_DIR" \
+    --log_level ${LOG_LEVEL:-info} \
+    --log_sample_rate ${LOG_SAMPLE_RATE:-0.1} \
+    > "$LOG_DIR/0_pipeline.out" 2> "$LOG_DIR/0_pipeline.err"
+else
+  python ./extract_entity_list.py \
+    --benchmark_dataset $BENCHMARK_DATASET \
+    --output_file $JSON_PATH_FILE_NAME \
+    --api_key $API_KEY_ENTITY_EXTRACTION \
+    --num_questions $NUM_QUESTIONS \
+    --model $MODEL_ENTITY_EXTRACTION \
+    --llm_provider $LLM_PROVIDER_ENTITY_EXTRACTION \
+    --max_tokens $MAX_TOKENS_ENTITY_EXTRACTION \
+    --temperature $TEMPERATURE_ENTITY_EXTRACTION \
+    --batch_size ${BATCH_SIZE_ENTITY_EXTRACTION:-1} \
+    --languages ${LANGUAGES:-None} \
+    --is_local_graph $IS_LOCAL_GRAPH \
+    --system_prompt_path $SYSTEM_PROMPT_ENTITY_EXTRACTION \
+    --dataset_type $DATASET_TYPE \
+    --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
+    --local_graph_location $LOCAL_GRAPH_LOCATION \
+    --baseline_run $BASELINE_RUN \
+    --resume $RESUME \
+    --shard_index ${SHARD_INDEX:-0} \
+    --shard_count ${SHARD_COUNT:-1} \
+    --gold_answers ${GOLD_ANSWERS:-False} \
+    --label_index ${LABEL_INDEX:-None} \
+    --label_index_fallback ${LABEL_INDEX_FALLBACK:-True} \
+    --trace_dir "$TRACE_DIR" \
+    --event_log_dir "$EVENT_LOG_DIR" \
+    --log_level ${LOG_LEVEL:-info} \
+    --log_sample_rate ${LOG_SAMPLE_RATE:-0.1} \
+    > "$LOG_DIR/1_extract_entity_list.out" 2> "$LOG_DIR/1_extract_entity_list.err"
+  echo ""  # Blank line for separation
 
-  # Generate SPARQL with LLM
-python call_llm_api.py \
-  --json_path $JSON_PATH_FILE_NAME \
-  --system_prompt_path $SYSTEM_PROMPT_SPARQL_GENERATION \
-  --shape_path $TEMP_OUTPUT_DIR/shapes \
-  --model $MODEL_SPARQL_GENERATION \
-  --api_key $API_KEY_SPARQL_GENERATION \
-  --max_tokens $MAX_TOKENS_SPARQL_GENERATION \
-  --temperature $TEMPERATURE_SPARQL_GENERATION \
-  --llm_provider $LLM_PROVIDER_SPARQL_GENERATION \
-  --is_local_graph $IS_LOCAL_GRAPH \
-  --max_retries $MAX_CONSECUTIVE_RETRIES \
-  --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
-  --local_graph_path $LOCAL_GRAPH_LOCATION \
-  --shape_type $SHAPE_TYPE \
-  --dataset_type $DATASET_TYPE \
-  --baseline_run $BASELINE_RUN \
-  --system_prompt_path_baseline_run $SYSTEM_PROMPT_SPARQL_GENERATION_BASELINE_RUN \
-  > "$LOG_DIR/3_call_llm_api.out" 2> "$LOG_DIR/3_call_llm_api.err"
-echo ""  # Blank line for separation
+  python generate_shape.py \
+    --shape_output_path "$TEMP_OUTPUT_DIR/shapes" \
+    --target_json_file $JSON_PATH_FILE_NAME \
+    --is_local_graph $IS_LOCAL_GRAPH \
+    --local_graph_location $LOCAL_GRAPH_LOCATION \
+    --shape_type $SHAPE_TYPE \
+    --existing_shape_path $EXISTING_SHAPE_PATH \
+    --dataset_type $DATASET_TYPE \
+    --annotation $ANNOTATION \
+    --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
+    --baseline_run $BASELINE_RUN \
+    --resume $RESUME \
+    --trace_dir "$TRACE_DIR" \
+    --event_log_dir "$EVENT_LOG_DIR" \
+    --log_level ${LOG_LEVEL:-info} \
+    --log_sample_rate ${LOG_SAMPLE_RATE:-0.1} \
+    > "$LOG_DIR/2_generate_shape.out" 2> "$LOG_DIR/2_generate_shape.err"
+  echo ""  # Blank line for separation
+
+    # Generate SPARQL with LLM
+  python call_llm_api.py \
+    --json_path $JSON_PATH_FILE_NAME \
+    --system_prompt_path $SYSTEM_PROMPT_SPARQL_GENERATION \
+    --shape_path $TEMP_OUTPUT_DIR/shapes \
+    --model $MODEL_SPARQL_GENERATION \
+    --api_key $API_KEY_SPARQL_GENERATION \
+    --max_tokens $MAX_TOKENS_SPARQL_GENERATION \
+    --temperature $TEMPERATURE_SPARQL_GENERATION \
+    --llm_provider $LLM_PROVIDER_SPARQL_GENERATION \
+    --is_local_graph $IS_LOCAL_GRAPH \
+    --max_retries $MAX_CONSECUTIVE_RETRIES \
+    --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
+    --local_graph_path $LOCAL_GRAPH_LOCATION \
+    --shape_type $SHAPE_TYPE \
+    --shape_format ${SHAPE_FORMAT:-native} \
+    --dataset_type $DATASET_TYPE \
+    --baseline_run $BASELINE_RUN \
+    --system_prompt_path_baseline_run $SYSTEM_PROMPT_SPARQL_GENERATION_BASELINE_RUN \
+    --resume $RESUME \
+    --trace_dir "$TRACE_DIR" \
+    --event_log_dir "$EVENT_LOG_DIR" \
+    --log_level ${LOG_LEVEL:-info} \
+    --log_sample_rate ${LOG_SAMPLE_RATE:-0.1} \
+    > "$LOG_DIR/3_call_llm_api.out" 2> "$LOG_DIR/3_call_llm_api.err"
+  echo ""  # Blank line for separation
+
+  python verify_sparql.py \
+    --json_path $JSON_PATH_FILE_NAME \
+    --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
+    --is_local_graph $IS_LOCAL_GRAPH \
+    --local_graph_location $LOCAL_GRAPH_LOCATION \
+    --num_questions $NUM_QUESTIONS \
+    --max_retries $MAX_CONSECUTIVE_RETRIES \
+    --log_dir $LOG_DIR \
+    --llm_provider_sparql_generation $LLM_PROVIDER_SPARQL_GENERATION \
+    --llm_provider_entity_extraction $LLM_PROVIDER_ENTITY_EXTRACTION \
+    --model_entity_extraction $MODEL_ENTITY_EXTRACTION \
+    --model_sparql_generation $MODEL_SPARQL_GENERATION \
+    --benchmark_dataset $BENCHMARK_DATASET \
+    --is_local_graph $IS_LOCAL_GRAPH \
+    --local_graph_location $LOCAL_GRAPH_LOCATION \
+    --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
+    --shape_type $SHAPE_TYPE \
+    --dataset_type $DATASET_TYPE \
+    --annotation $ANNOTATION \
+    --baseline_run $BASELINE_RUN \
+    --run_index $RUN_INDEX \
+    --resume $RESUME \
+    --results_db $RESULTS_DB \
+    --gold_answers ${GOLD_ANSWERS:-False} \
+    --gold_drift_check ${GOLD_DRIFT_CHECK:-False} \
+    --trace_dir "$TRACE_DIR" \
+    --event_log_dir "$EVENT_LOG_DIR" \
+    --log_level ${LOG_LEVEL:-info} \
+    --log_sample_rate ${LOG_SAMPLE_RATE:-0.1} \
+    > "$LOG_DIR/4_verify_sparql.out" 2> "$LOG_DIR/4_verify_sparql.err"
+fi
 
-python verify_sparql.py \
-  --json_path $JSON_PATH_FILE_NAME \
-  --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
-  --is_local_graph $IS_LOCAL_GRAPH \
-  --local_graph_location $LOCAL_GRAPH_LOCATION \
-  --num_questions $NUM_QUESTIONS \
-  --max_retries $MAX_CONSECUTIVE_RETRIES \
-  --log_dir $LOG_DIR \
-  --llm_provider_sparql_generation $LLM_PROVIDER_SPARQL_GENERATION \
-  --llm_provider_entity_extraction $LLM_PROVIDER_ENTITY_EXTRACTION \
-  --model_entity_extraction $MODEL_ENTITY_EXTRACTION \
-  --model_sparql_generation $MODEL_SPARQL_GENERATION \
-  --benchmark_dataset $BENCHMARK_DATASET \
-  --is_local_graph $IS_LOCAL_GRAPH \
-  --local_graph_location $LOCAL_GRAPH_LOCATION \
-  --sparql_endpoint_url $SPARQL_ENDPOINT_URL \
-  --shape_type $SHAPE_TYPE \
-  --dataset_type $DATASET_TYPE \
-  --annotation $ANNOTATION \
-  --baseline_run $BASELINE_RUN \
-  --run_index $RUN_INDEX \
-  > "$LOG_DIR/4_verify_sparql.out" 2> "$LOG_DIR/4_verify_sparql.err"
-  
   # Copy results to Experiment_Results if NUM_QUESTIONS is 50
   if [ "$NUM_QUESTIONS" -eq 50 ]; then
     RESULTS_DIR="/root/KG_Agent/KG_Agent_MK2/Experiment_Results/$LOG_DIR"
     mkdir -p "$RESULTS_DIR"
-    cp "$JSON_PATH_FILE_NAME" "$RESULTS_DIR/"
+    # The archived copy carries its query results inline, as the result store under ./cache is not archived
+    python result_sidecar.py \
+      --input "$JSON_PATH_FILE_NAME" \
+      --output "$RESULTS_DIR/$(basename "$JSON_PATH_FILE_NAME")" \
+      > "$LOG_DIR/misc/meta/archive_results.out" 2> "$LOG_DIR/misc/meta/archive_results.err"
     SUMMARY_FILE="${JSON_PATH_FILE_NAME%.json}_summary.txt"
     if [ -f "$SUMMARY_FILE" ]; then
       cp "$SUMMARY_FILE" "$RESULTS_DIR/"
     fi
   fi
 
-  python /root/KG_Agent/KG_Agent_MK2/util/convert_summaries_to_csv.py \
-    --base "/root/KG_Agent/KG_Agent_MK2/Experiment_Results" \
-    --output "/root/KG_Agent/KG_Agent_MK2/Experiment_Results/results.csv" \
-    > "$LOG_DIR/7_convert_summaries_to_csv.out" 2> "$LOG_DIR/7_convert_summaries_to_csv.err"
\ No newline at end of file
+  # Export the 50-question runs of the results store (previously re-parsed from every summary file)
+  python results_store.py export \
+    --db "$RESULTS_DB" \
+    --filter num_questions=50 \
+    --output "$RESULTS_CSV" \
+    > "$LOG_DIR/7_export_results_csv.out" 2> "$LOG_DIR/7_export_results_csv.err"
\ No newline at end of file
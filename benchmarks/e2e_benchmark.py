@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCHMARK_DIR)
+
+import synthetic
+import tracing
+import operational_metrics
+
+STAGES = ["extract_entity_list", "generate_shape", "call_llm_api", "verify_sparql"]
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(script, port, options, log_path):
+    """Starts a mock server and waits until it accepts connections."""
+    log = open(log_path, "w", encoding="utf-8")
+    process = subprocess.Popen([sys.executable, os.path.join(BENCHMARK_DIR, script), "--port", str(port), *options], stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{script} exited with code {process.returncode}, see {log_path}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"{script} did not start listening on port {port}")
+
+def run_process(name, command, env, log_dir):
+    """Runs one stage in a fresh interpreter and returns its wall-clock seconds and peak RSS (from wait4)."""
+    with open(os.path.join(log_dir, f"{name}.out"), "w", encoding="utf-8") as out, open(os.path.join(log_dir, f"{name}.err"), "w", encoding="utf-8") as err:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=out, stderr=err)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"Stage {name} failed with exit code {process.returncode}, see {log_dir}/{name}.err")
+    # ru_maxrss is reported in kilobytes on Linux
+    return {"wall_seconds": round(wall_seconds, 3), "peak_rss_mb": round(usage.ru_maxrss / 1024, 1)}
+
+def stage_commands(args, work_dir, benchmark_path, endpoint_url, num_questions):
+    json_path = os.path.join(work_dir, "experiment.json")
+    shape_dir = os.path.join(work_dir, "shapes")
+    common = ["--trace_dir", os.path.join(work_dir, "trace")]
+    gold = ["--gold_answers", str(args.gold_answers), "--gold_cache_dir", os.path.join(work_dir, "gold")]
+    results = ["--result_store_dir", os.path.join(work_dir, "results")]
+
+    if args.mode != "stages":
+        return {"pipeline": [
+            sys.executable, "pipeline.py", "--benchmark_dataset", benchmark_path, "--json_path", json_path, "--shape_output_path", shape_dir,
+            "--is_local_graph", "False", "--sparql_endpoint_url", endpoint_url, "--shape_type", args.shape_type, "--dataset_type", "dbpedia",
+            "--api_key_entity_extraction", "bench", "--api_key_sparql_generation", "bench", "--model_entity_extraction", "mock",
+            "--model_sparql_generation", "mock", "--max_retries", str(args.max_retries), "--run_index", f"bench_{num_questions}",
+            "--log_dir", work_dir, "--streaming", str(args.mode == "streaming"), "--stage_workers", str(args.stage_workers),
+            "--batch_size_entity_extraction", str(args.entity_batch_size),
+            *gold, *results, *common,
+        ]}
+
+    return {
+        "extract_entity_list": [
+            sys.executable, "extract_entity_list.py", "--benchmark_dataset", benchmark_path, "--output_file", json_path, "--api_key", "bench",
+            "--num_questions", "0", "--model", "mock", "--is_local_graph", "False", "--system_prompt_path", "prompts/system_prompt_entity_extraction.txt",
+            "--dataset_type", "dbpedia", "--sparql_endpoint_url", endpoint_url, "--batch_size", str(args.entity_batch_size), *gold, *common,
+        ],
+        "generate_shape": [
+            sys.executable, "generate_shape.py", "--shape_output_path", shape_dir, "--target_json_file", json_path, "--is_local_graph", "False",
+            "--shape_type", args.shape_type, "--dataset_type", "dbpedia", "--annotation", "False", "--sparql_endpoint_url", endpoint_url, *common,
+        ],
+        "call_llm_api": [
+            sys.executable, "call_llm_api.py", "--json_path", json_path, "--system_prompt_path", "prompts/system_prompt_SPARQL_generation.txt",
+            "--shape_path", shape_dir, "--model", "mock", "--api_key", "bench", "--is_local_graph", "False", "--max_retries", str(args.max_retries),
+            "--sparql_endpoint_url", endpoint_url, "--shape_type", args.shape_type, "--dataset_type", "dbpedia", *results, *common,
+        ],
+        "verify_sparql": [
+            sys.executable, "verify_sparql.py", "--json_path", json_path, "--sparql_endpoint_url", endpoint_url, "--is_local_graph", "False",
+            "--num_questions", str(num_questions), "--benchmark_dataset", benchmark_path, "--run_index", f"bench_{num_questions}",
+            "--log_dir", work_dir, *gold, *results, *common,
+        ],
+    }
+
+def percentiles(values):
+    values = sorted(values)
+    return {f"p{q}": round(tracing.percentile(values, q), 4) for q in (50, 95, 99)}
+
+def run_scale(args, num_questions, env, endpoint_url):
+    """Runs the stages on a fresh synthetic benchmark of num_questions questions and returns the measurements."""
+    work_dir = os.path.join(args.output_dir, f"scale_{num_questions}")
+    os.makedirs(work_dir, exist_ok=True)
+    benchmark_path = synthetic.build_benchmark(num_questions, os.path.join(work_dir, "benchmark.json"), args.min_rows, args.max_rows)
+
+    stages = {}
+    for name, command in stage_commands(args, work_dir, benchmark_path, endpoint_url, num_questions).items():
+        print(f"🚀 {num_questions} questions: {name}", flush=True)
+        stages[name] = run_process(name, command, env, work_dir)
+        stages[name]["throughput_qpm"] = round(num_questions * 60 / stages[name]["wall_seconds"], 1)
+
+    with open(os.path.join(work_dir, "experiment.json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    operations = operational_metrics.summarize_records(data)
+    total_seconds = sum(stage["wall_seconds"] for stage in stages.values())
+    question_seconds = [entry["operational_metrics"]["wall_seconds"] for entry in data if entry.get("operational_metrics")]
+
+    return {
+        "questions": num_questions,
+        "total_wall_seconds": round(total_seconds, 3),
+        "throughput_qpm": round(num_questions * 60 / total_seconds, 1),
+        "peak_rss_mb": max(stage["peak_rss_mb"] for stage in stages.values()),
+        "stages": stages,
+        "question_seconds": percentiles(question_seconds),
+        "spans": tracing.latency_table(tracing.load_trace_events(os.path.join(work_dir, "trace"))),
+        "llm_calls": operations["llm_calls"],
+        "endpoint_queries": operations["endpoint_queries"],
+        "classifications": {label: sum(1 for entry in data if entry.get("sparql_comparison_result", {}).get("is_correct") == label) for label in ("TP", "FP", "FN", "Invalid")},
+    }
+
+def print_report(result):
+    print(f"\n==== {result['questions']} questions ====")
+    for name, stage in result["stages"].items():
+        print(f"{name:<22}{stage['wall_seconds']:>10.2f} s{stage['throughput_qpm']:>12.1f} Q/min{stage['peak_rss_mb']:>10.1f} MB peak RSS")
+    print(f"{'total':<22}{result['total_wall_seconds']:>10.2f} s{result['throughput_qpm']:>12.1f} Q/min{result['peak_rss_mb']:>10.1f} MB peak RSS")
+    seconds = result["question_seconds"]
+    print(f"Seconds per question: p50 {seconds['p50']:.3f}  p95 {seconds['p95']:.3f}  p99 {seconds['p99']:.3f}")
+    print(f"LLM calls {result['llm_calls']}, endpoint queries {result['endpoint_queries']}, classifications {result['classifications']}")
+    print(tracing.format_latency_table(result["spans"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the pipeline stages against local mock LLM and SPARQL servers.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[50, 500, 5000], help="Numbers of synthetic questions to run.")
+    parser.add_argument("--output_dir", type=str, default="./benchmarks/results", help="Directory for the synthetic benchmarks, stage outputs and logs.")
+    parser.add_argument("--output", type=str, help="Optional JSON file to record the measurements in.")
+    parser.add_argument("--mode", type=str, choices=["stages", "pipeline", "streaming"], default="stages", help="Run the four stage scripts, or pipeline.py sequentially or streaming.")
+    parser.add_argument("--stage_workers", type=int, default=4, help="Worker threads per stage with --mode streaming.")
+    parser.add_argument("--entity_batch_size", type=int, default=1, help="Questions per entity extraction call.")
+    parser.add_argument("--shape_type", type=str, choices=["shex", "shacl"], default="shex")
+    parser.add_argument("--max_retries", type=int, default=2)
+    parser.add_argument("--gold_answers", type=lambda v: v.lower() in ("true", "1", "yes"), default=True, help="Verify against the embedded answers (False re-executes gold queries with the 1 s throttle per question).")
+    parser.add_argument("--llm_latency_ms", type=float, default=50.0)
+    parser.add_argument("--llm_error_rate", type=float, default=0.0, help="Fraction of LLM requests failing with HTTP 500 (retried by the OpenAI client).")
+    parser.add_argument("--llm_accuracy", type=float, default=0.7, help="Fraction of questions the mock LLM answers with the gold query.")
+    parser.add_argument("--endpoint_latency_ms", type=float, default=20.0)
+    parser.add_argument("--endpoint_error_rate", type=float, default=0.0, help="Fraction of endpoint requests failing with HTTP 503.")
+    parser.add_argument("--min_rows", type=int, default=1)
+    parser.add_argument("--max_rows", type=int, default=20)
+    parser.add_argument("--recorded", type=str, help="JSON file mapping queries to recorded SPARQL results, served before synthetic results.")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    llm_port, endpoint_port = free_port(), free_port()
+    endpoint_url = f"http://127.0.0.1:{endpoint_port}/sparql"
+    endpoint_options = ["--latency_ms", str(args.endpoint_latency_ms), "--error_rate", str(args.endpoint_error_rate), "--min_rows", str(args.min_rows), "--max_rows", str(args.max_rows)]
+    if args.recorded:
+        endpoint_options += ["--recorded", args.recorded]
+
+    servers = [
+        start_server("mock_llm_server.py", llm_port, ["--latency_ms", str(args.llm_latency_ms), "--error_rate", str(args.llm_error_rate), "--accuracy", str(args.llm_accuracy)], os.path.join(args.output_dir, "mock_llm.log")),
+        start_server("mock_sparql_server.py", endpoint_port, endpoint_options, os.path.join(args.output_dir, "mock_sparql.log")),
+    ]
+    # The stages talk to the mocks through the same overrides that can point them at mirrors
+    env = {**os.environ, "OPENAI_BASE_URL": f"http://127.0.0.1:{llm_port}/v1", "DBPEDIA_SPARQL_ENDPOINT": endpoint_url, "PYTHONUNBUFFERED": "1"}
+
+    results = []
+    try:
+        for num_questions in args.scales:
+            result = run_scale(args, num_questions, env, endpoint_url)
+            print_report(result)
+            results.append(result)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "mode": args.mode, "arguments": vars(args), "results": results}, f, indent=4)
+        print(f"📝 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible /v1/chat/completions endpoint.
+    Entity extraction prompts get the entity names of the synthetic question, as a JSON object for batched extraction.
+    SPARQL generation prompts get its gold query (for --accuracy of the questions) or a wrong query.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without TCP_NODELAY keep-alive clients wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        config = self.server.config
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+        with config["lock"]:
+            delay = max(0.0, config["rng"].gauss(config["latency_ms"], config["jitter_ms"])) / 1000
+            fail = config["rng"].random() < config["error_rate"]
+        time.sleep(delay)
+        if fail:
+            return self._send(config["error_status"], {"error": {"message": "Injected error", "type": "server_error"}})
+
+        messages = request.get("messages", [])
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        prompt = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+        index = synthetic.question_index(prompt)
+
+        if "named entities" in system and "question ID" in prompt:
+            # Batched extraction, synthetic question IDs are their indexes
+            content = json.dumps({str(i): synthetic.entity_names(i) for i in synthetic.question_indexes(prompt)})
+        elif "named entities" in system:
+            content = ", ".join(synthetic.entity_names(index)) if index is not None else "Unknown"
+        elif index is None:
+            content = "SELECT ?x WHERE { ?x ?p ?o } LIMIT 1"
+        elif synthetic.stable_fraction("accuracy", index) < config["accuracy"]:
+            content = f"```sparql\n{synthetic.gold_query(index)}\n```"
+        else:
+            content = f"```sparql\n{synthetic.wrong_query(index)}\n```"
+
+        prompt_tokens = config["prompt_tokens"] or max(1, math.ceil(sum(len(m.get("content") or "") for m in messages) * config["tokens_per_char"]))
+        completion_tokens = config["completion_tokens"] or max(1, math.ceil(len(content) * config["tokens_per_char"]))
+        self._send(200, {
+            "id": f"chatcmpl-mock-{index}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server for benchmarks.")
+    parser.add_argument("--port", type=int, default=18880)
+    parser.add_argument("--latency_ms", type=float, default=50.0, help="Mean response latency.")
+    parser.add_argument("--jitter_ms", type=float, default=10.0, help="Standard deviation of the latency.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with --error_status.")
+    parser.add_argument("--error_status", type=int, default=500, help="HTTP status of injected errors (e.g. 429 or 500).")
+    parser.add_argument("--accuracy", type=float, default=0.7, help="Fraction of questions that get their gold query.")
+    parser.add_argument("--tokens_per_char", type=float, default=0.25, help="Reported tokens per character of prompt and completion.")
+    parser.add_argument("--prompt_tokens", type=int, default=0, help="Fixed prompt token count (0 = derived from the prompt length).")
+    parser.add_argument("--completion_tokens", type=int, default=0, help="Fixed completion token count (0 = derived from the answer length).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the latency and error injection.")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockLLMHandler)
+    server.daemon_threads = True
+    server.config = {**vars(args), "rng": random.Random(args.seed), "lock": threading.Lock()}
+    print(f"🤖 Mock LLM listening on http://127.0.0.1:{args.port}/v1", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
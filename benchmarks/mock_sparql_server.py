@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+class MockSparqlHandler(BaseHTTPRequestHandler):
+    """Answers SPARQL GET/POST requests with recorded or synthetic SPARQL JSON results."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, without TCP_NODELAY keep-alive clients wait for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._answer(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        if self.headers.get("Content-Type", "").startswith("application/sparql-query"):
+            self._answer({"query": [body]})
+        else:
+            self._answer(parse_qs(body))
+
+    def _answer(self, params):
+        config = self.server.config
+        query = (params.get("query") or [""])[0]
+        with config["lock"]:
+            delay = max(0.0, config["rng"].gauss(config["latency_ms"], config["jitter_ms"])) / 1000
+            fail = config["rng"].random() < config["error_rate"]
+        time.sleep(delay)
+
+        if not query:
+            return self._send(400, {"error": "Missing query parameter"})
+        if fail:
+            return self._send(config["error_status"], {"error": "Injected error"})
+
+        response = config["recorded"].get(query) or synthetic.select_response(query, config["min_rows"], config["max_rows"])
+        self._send(200, response, "application/sparql-results+json")
+
+    def _send(self, status, payload, content_type="application/json"):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SPARQL endpoint serving recorded or synthetic results for benchmarks.")
+    parser.add_argument("--port", type=int, default=18890)
+    parser.add_argument("--latency_ms", type=float, default=20.0, help="Mean response latency.")
+    parser.add_argument("--jitter_ms", type=float, default=5.0, help="Standard deviation of the latency.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with --error_status.")
+    parser.add_argument("--error_status", type=int, default=503, help="HTTP status of injected errors.")
+    parser.add_argument("--min_rows", type=int, default=1, help="Minimum number of rows of synthetic SELECT results.")
+    parser.add_argument("--max_rows", type=int, default=20, help="Maximum number of rows of synthetic SELECT results.")
+    parser.add_argument("--recorded", type=str, help="JSON file mapping query strings to recorded SPARQL JSON results.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the latency and error injection.")
+    args = parser.parse_args()
+
+    recorded = {}
+    if args.recorded:
+        with open(args.recorded, "r", encoding="utf-8") as f:
+            recorded = json.load(f)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), MockSparqlHandler)
+    server.daemon_threads = True
+    server.config = {
+        "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate, "error_status": args.error_status,
+        "min_rows": args.min_rows, "max_rows": args.max_rows, "recorded": recorded, "rng": random.Random(args.seed), "lock": threading.Lock(),
+    }
+    print(f"🛰️ Mock SPARQL endpoint listening on http://127.0.0.1:{args.port}/sparql", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
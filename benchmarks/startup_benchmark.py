@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Stage modules of the pipeline and the import budget each of them must stay within (milliseconds)
+STAGE_MODULES = {
+    "extract_entity_list": 50,
+    "generate_shape": 50,
+    "call_llm_api": 50,
+    "verify_sparql": 50,
+    "track_files": 50,
+    "pipeline": 75,
+}
+
+def measure_import_ms(module):
+    """Returns the cumulative import time of a module in a fresh interpreter, as reported by -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    for line in reversed(result.stderr.splitlines()):
+        # Format: "import time: self [us] | cumulative | imported package"
+        parts = [part.strip() for part in line.replace("import time:", "").split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time reported for module {module}")
+
+def measure_cli_ms(module):
+    """Returns the wall-clock time of `python <stage>.py --help`, i.e. interpreter start plus argument parsing."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, f"{module}.py", "--help"], cwd=REPO_ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+def run_benchmark(repeats, threshold_scale):
+    """Measures every stage `repeats` times and returns the medians together with the budget check."""
+    results = {}
+    for module, budget_ms in STAGE_MODULES.items():
+        import_ms = statistics.median(measure_import_ms(module) for _ in range(repeats))
+        cli_ms = statistics.median(measure_cli_ms(module) for _ in range(repeats))
+        limit_ms = budget_ms * threshold_scale
+        results[module] = {
+            "import_ms": round(import_ms, 2),
+            "cli_help_ms": round(cli_ms, 2),
+            "import_budget_ms": limit_ms,
+            "within_budget": import_ms <= limit_ms,
+        }
+        status = "✅" if import_ms <= limit_ms else "❌"
+        print(f"{status} {module:<22} import {import_ms:8.1f} ms (budget {limit_ms:.0f} ms)   --help {cli_ms:8.1f} ms")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import and CLI startup time of every pipeline stage.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of measurements per stage (the median is reported).")
+    parser.add_argument("--threshold_scale", type=float, default=1.0, help="Scale all import budgets, e.g. 2.0 on slow machines.")
+    parser.add_argument("--output", type=str, help="Optional JSON file to record the measurements in.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.repeats, args.threshold_scale)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "results": results}, f, indent=4)
+        print(f"📝 Results written to {args.output}")
+
+    over_budget = [module for module, result in results.items() if not result["within_budget"]]
+    if over_budget:
+        print(f"❌ Import time regression in: {', '.join(over_budget)}")
+        sys.exit(1)
+    print("✅ All stages start within their import budget")
+
+if __name__ == "__main__":
+    main()
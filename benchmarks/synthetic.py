@@ -0,0 +1,101 @@
+import hashlib
+import json
+import re
+
+# Synthetic questions carry their index as "(Q<n>)", so the mock servers can answer them deterministically
+QUESTION_MARKER = re.compile(r"\(Q(\d+)\)")
+LABEL_LOOKUP = re.compile(r'rdfs:label\s+"(.*?)"@en')
+SELECT_VARIABLES = re.compile(r"SELECT\s+(?:DISTINCT\s+|REDUCED\s+)?((?:\?\w+\s*)+)", re.IGNORECASE)
+SUBJECT_PATTERN = re.compile(r"\{\s*<([^>]+)>\s+(\?\w+|<[^>]+>)\s+\?\w+\s*\.?\s*\}")
+OBJECT_PATTERN = re.compile(r"\{\s*\?\w+\s+\?\w+\s+<([^>]+)>\s*\.?\s*\}")
+
+RESOURCE = "http://dbpedia.org/resource/"
+ONTOLOGY = "http://dbpedia.org/ontology/"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+
+def question_text(index):
+    return f"Which organisations are related to topic {index}? (Q{index})"
+
+def entity_names(index):
+    return [f"Topic {index}", f"Organisation {index}"]
+
+def gold_query(index):
+    return f"SELECT DISTINCT ?uri WHERE {{ ?uri <{ONTOLOGY}relatedTo> <{RESOURCE}Topic_{index}> }}"
+
+def wrong_query(index):
+    return f"SELECT DISTINCT ?uri WHERE {{ ?uri <{ONTOLOGY}foundedBy> <{RESOURCE}Topic_{index}> }}"
+
+def question_index(text):
+    """Returns the synthetic question index mentioned in a prompt, or None."""
+    match = QUESTION_MARKER.search(text or "")
+    return int(match.group(1)) if match else None
+
+def question_indexes(text):
+    """All synthetic question indexes mentioned in a prompt, e.g. of a batched extraction."""
+    return [int(index) for index in QUESTION_MARKER.findall(text or "")]
+
+def stable_fraction(*parts) -> float:
+    """Deterministic value in [0, 1) derived from the given parts."""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 0x100000000
+
+def _uri(value):
+    return {"type": "uri", "value": value}
+
+def _bindings_response(variables, rows):
+    return {"head": {"vars": variables}, "results": {"bindings": rows}}
+
+def select_response(query, min_rows=1, max_rows=20):
+    """
+    Deterministic SPARQL JSON result of a query, shaped like a public endpoint's answer:
+    entity label lookups, Shexer's per-node triple queries, ASK queries and synthetic SELECT results.
+    """
+    label = LABEL_LOOKUP.search(query)
+    if label:
+        return _bindings_response(["entity"], [{"entity": _uri(RESOURCE + label.group(1).replace(" ", "_"))}])
+
+    if re.search(r"\bASK\b", query, re.IGNORECASE):
+        return {"head": {}, "boolean": stable_fraction(query) < 0.5}
+
+    variables = SELECT_VARIABLES.search(query)
+    variables = [name.lstrip("?") for name in variables.group(1).split()] if variables else ["value"]
+
+    subject = SUBJECT_PATTERN.search(query)
+    if subject:
+        node, predicate = subject.group(1), subject.group(2)
+        name = node.rsplit("/", 1)[-1]
+        if not predicate.startswith("?"):
+            # Classes of one node
+            return _bindings_response(variables, [{variables[0]: _uri(f"{ONTOLOGY}Organisation")}])
+        triples = [
+            (_uri(RDF_TYPE), _uri(f"{ONTOLOGY}Organisation")),
+            (_uri(RDFS_LABEL), {"type": "literal", "value": name.replace("_", " "), "xml:lang": "en"}),
+            (_uri(f"{ONTOLOGY}relatedTo"), _uri(f"{RESOURCE}{name}_partner")),
+            (_uri(f"{ONTOLOGY}foundingYear"), {"type": "typed-literal", "value": str(1900 + int(stable_fraction(node) * 120)), "datatype": "http://www.w3.org/2001/XMLSchema#gYear"}),
+        ]
+        return _bindings_response(variables, [{variables[0]: p, variables[1]: o} for p, o in triples])
+
+    obj = OBJECT_PATTERN.search(query)
+    if obj and len(variables) >= 2:
+        return _bindings_response(variables, [{variables[0]: _uri(f"{obj.group(1)}_partner"), variables[1]: _uri(f"{ONTOLOGY}relatedTo")}])
+
+    count = min_rows + int(stable_fraction(query) * (max_rows - min_rows + 1))
+    digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:12]
+    rows = [{variable: _uri(f"http://bench.example/{digest}/{variable}/{row}") for variable in variables} for row in range(count)]
+    return _bindings_response(variables, rows)
+
+def build_benchmark(num_questions, output_path, min_rows=1, max_rows=20):
+    """Writes a QALD-style benchmark of synthetic questions whose embedded answers match the mock endpoint."""
+    questions = []
+    for index in range(1, num_questions + 1):
+        query = gold_query(index)
+        questions.append({
+            "id": str(index),
+            "question": [{"language": "en", "string": question_text(index)}],
+            "query": {"sparql": query},
+            "answers": [select_response(query, min_rows, max_rows)],
+        })
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"dataset": {"id": f"synthetic-{num_questions}"}, "questions": questions}, f)
+    return output_path
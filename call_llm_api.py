@@ -2,10 +2,16 @@ import argparse
 import os
 import json
 import sys
-from openai import OpenAI
-import time
-from rdflib import Graph
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+import operational_metrics
+import retry_policy
 from utility import Utils
+from journal import StageJournal
+import result_sidecar
+import multilingual
+import event_log
+import compact_shape
 
 def read_file(file_path):
     """Reads content from a file and returns it as a string."""
@@ -16,212 +22,372 @@ def read_file(file_path):
         sys.stderr.write(f"WARNING: Could not read file {file_path}: {e}\n")
         return ""
 
+class LLMCallError(RuntimeError):
+    """Raised when the LLM API call fails, after all previously completed questions have been journaled."""
+
 def call_llm(full_prompt, max_tokens, temperature, api_key, model, llm_provider):
     """Calls OpenAI's GPT model via the ChatGPT API or DeepSeek API."""
     
-    client = OpenAI(api_key=api_key, base_url=Utils.resolve_llm_provider(llm_provider))
+    client = Utils.get_llm_client(api_key, llm_provider)
+    messages = [
+        {"role": "system", "content": "You are a SPARQL expert. Only output valid SPARQL queries."},
+        {"role": "user", "content": full_prompt}
+    ]
     
     try:
-        if llm_provider == "google":
-            completion = client.chat.completions.create(
-                model=model,
-                reasoning_effort="medium",
-                messages=[
-                    {"role": "system", "content": "You are a SPARQL expert. Only output valid SPARQL queries."},
-                    {"role": "user", "content": full_prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-        else:
-            completion = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a SPARQL expert. Only output valid SPARQL queries."},
-                    {"role": "user", "content": full_prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+        with Utils.llm_slot(), tracing.span("llm.call", purpose="sparql_generation", model=model):
+            if llm_provider == "google":
+                completion = client.chat.completions.create(
+                    model=model,
+                    reasoning_effort="medium",
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+            else:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+        Utils.count_llm_call(messages, completion)
         return completion
     
     except Exception as e:
         sys.stderr.write(f"❌ ERROR: API call to ChatGPT failed: {e}\n")
-        sys.exit(1)
-
-def process_json_and_shapes(json_path, shape_dir, system_prompt_path, api_key, model, max_tokens, initial_temperature,
-                            llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, system_prompt_path_baseline_run):
-    """Iterates over JSON questions and shape files to generate SPARQL queries, ensuring only one LLM call per question."""
-
-    # Load the JSON file with questions
-    with open(json_path, "r", encoding="utf-8") as file:
-        data = json.load(file)
-
-    print(f"🔍 Debug: Starting to process {len(data)} questions.")
-
-    if baseline_run:
-        system_prompt_path = system_prompt_path_baseline_run
-    # Read system prompt
-    system_prompt = read_file(system_prompt_path)
-
-    if is_local_graph and not baseline_run:
-        local_shape_file_path = os.path.join(shape_dir, f"local_graph_shape.{shape_type}")
-        if not os.path.exists(local_shape_file_path):
-            raise FileNotFoundError(f"❌ ERROR: Local graph shape file not found: {local_shape_file_path}")
-        local_shape_data = read_file(local_shape_file_path)
-
-    for entry in data:
-        if not isinstance(entry, dict):
-            print(f"⚠️ Skipping non-dict entry: {entry}")
-            continue
+        raise LLMCallError(f"API call to {llm_provider} failed: {e}") from e
+
+def load_local_shape(shape_dir, shape_type):
+    """Reads the shape that was generated for the whole local graph."""
+    local_shape_file_path = os.path.join(shape_dir, f"local_graph_shape.{shape_type}")
+    if not os.path.exists(local_shape_file_path):
+        raise FileNotFoundError(f"❌ ERROR: Local graph shape file not found: {local_shape_file_path}")
+    return read_file(local_shape_file_path)
+
+def resolve_shape_for_entry(entry, shape_dir, shape_type, shapes=None):
+    """
+    Returns the shape text for a question generated from a remote endpoint,
+    preferring the in-memory shapes handed over by the shape stage over the shape files.
+    Returns None if the question has to be skipped.
+    """
+    question_id = entry.get('baseline_id')
+    entity_dict = entry.get("endpoint_entities_resolved", {})
+    if not isinstance(entity_dict, dict) or not entity_dict:
+        print(f"⚠️ Skipping question ID {question_id} due to missing or invalid entity_dict.")
+        return None
+
+    if shapes is not None and question_id in shapes:
+        return shapes[question_id]
+
+    shape_file_path = os.path.join(shape_dir, f"question_{question_id}_shape.{shape_type}")
+    if not os.path.exists(shape_file_path):
+        print(f"⚠️ Shape file missing: {shape_file_path}")
+        return None
+
+    return read_file(shape_file_path)
+
+def generate_sparql_for_entry(entry, system_prompt, merged_shape_data, api_key, model, max_tokens, initial_temperature,
+                              llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, policy=None):
+    """
+    Generates and executes SPARQL for one question with retries, storing the attempts in the entry.
+    Every failed attempt is classified and the retry policy decides whether the query is re-executed,
+    the LLM is re-prompted, the escalation model takes over or the attempt is kept.
+    """
+    policy = policy or retry_policy.RetryPolicy()
+    question_id = entry.get('baseline_id')
+    question = entry.get("baseline_question_text", "").strip()
+
+    retries = 0
+    prompt_tokens_by_question = 0
+    completion_tokens_by_question = 0
+    total_tokens_by_question = 0
+    final_query = None
+    temperature = initial_temperature
+    previous_response = None
+    attempts_log = []  # Change from dictionary to list
+    previous_results = {}  # normalized query -> result of the attempts so far
+    failure_classes = {}
+    retry_actions = {}
+    reexecutions = 0
+    escalated = False
+    attempt_model = model
+
+    def execute(query):
+        if is_local_graph:
+            return Utils.query_local_graph(query, local_graph_path)
+        return Utils.query_sparql_endpoint(query, sparql_endpoint_url)
+
+    def record(failure_class, action):
+        failure_classes[failure_class] = failure_classes.get(failure_class, 0) + 1
+        retry_actions[action] = retry_actions.get(action, 0) + 1
+
+    print(f"🔄 Constructing SPARQL with retry limit = {max_retries}")
+
+    while retries <= max_retries:
+        if previous_response and not baseline_run:
+            full_prompt = (
+                system_prompt.replace("{nlq}", question)
+                .replace("{ont}", dataset_type)
+                .replace("{shp_typ}", shape_type)
+                .replace("{shp_dat}", merged_shape_data)
+                + f"\n\n### Previous attempt (failed):\n{previous_response}\n\n### Revised SPARQL Query:\n```sparql"
+            )
+        elif previous_response and baseline_run:
+            full_prompt = (
+                system_prompt.replace("{nlq}", question)
+                .replace("{ont}", dataset_type)
+                + f"\n\n### Previous attempt (failed):\n{previous_response}\n\n### Revised SPARQL Query:\n```sparql"
+            )
+            
+        elif not previous_response and not baseline_run:
+            full_prompt = (system_prompt.replace("{nlq}", question)
+                .replace("{ont}", dataset_type)
+                .replace("{shp_typ}", shape_type)
+                .replace("{shp_dat}", merged_shape_data)
+            )
+        elif not previous_response and baseline_run:
+            full_prompt = (system_prompt.replace("{nlq}", question)
+                .replace("{ont}", dataset_type)
+            )
+        temperature = round(min(initial_temperature + 0.1 * retries, 2), 2)  # capped at 2.0
+        tracing.tag(attempt=retries + 1)
+        print(f"🔄 Attempt {retries + 1}/{max_retries + 1} with temperature: {temperature}")
+        full_response = call_llm(full_prompt, max_tokens, temperature, api_key, attempt_model, llm_provider)
 
-        question_id = entry.get('baseline_id')
-        question = entry.get("baseline_question_text", "").strip()
+        message_content = full_response.choices[0].message.content
 
-        print(f"\n🔎 Processing question ID {question_id}")
-        print(f"   ↳ Question: {repr(question)}")
-        print(f"   ↳ Baseline SPARQL query: {repr(entry.get('baseline_sparql_query'))}")
-        if not baseline_run:
-            print(f"   ↳ Resolved entities: {repr(entry.get('endpoint_entities_resolved'))}")
+        if message_content is not None:
+            response = message_content.strip()
         else:
-            print(f"   ↳ Resolved entities: ⚠️ \"baseline_run:\" {baseline_run}")
-
-        if not question:
-            print(f"⚠️ Skipping question ID {question_id} due to missing question text.")
-            continue
-
-        if is_local_graph and not baseline_run:
-            merged_shape_data = local_shape_data
-        elif not is_local_graph and not baseline_run:
-            entity_dict = entry.get("endpoint_entities_resolved", {})
-            if not isinstance(entity_dict, dict) or not entity_dict:
-                print(f"⚠️ Skipping question ID {question_id} due to missing or invalid entity_dict.")
-                continue
-
-            shape_file_path = os.path.join(shape_dir, f"question_{question_id}_shape.{shape_type}")
-            if not os.path.exists(shape_file_path):
-                print(f"⚠️ Shape file missing: {shape_file_path}")
-                continue
-
-            merged_shape_data = read_file(shape_file_path)
-
-        retries = 0
-        prompt_tokens_by_question = 0
-        completion_tokens_by_question = 0
-        total_tokens_by_question = 0
-        final_query = None
-        temperature = initial_temperature
-        previous_response = None
-        attempts_log = []  # Change from dictionary to list
-
-        print(f"🔄 Constructing SPARQL with retry limit = {max_retries}")
-
-        while retries <= max_retries:
-            if previous_response and not baseline_run:
-                full_prompt = (
-                    system_prompt.replace("{nlq}", question)
-                    .replace("{ont}", dataset_type)
-                    .replace("{shp_typ}", shape_type)
-                    .replace("{shp_dat}", merged_shape_data)
-                    + f"\n\n### Previous attempt (failed):\n{previous_response}\n\n### Revised SPARQL Query:\n```sparql"
-                )
-            elif previous_response and baseline_run:
-                full_prompt = (
-                    system_prompt.replace("{nlq}", question)
-                    .replace("{ont}", dataset_type)
-                    + f"\n\n### Previous attempt (failed):\n{previous_response}\n\n### Revised SPARQL Query:\n```sparql"
-                )
-                
-            elif not previous_response and not baseline_run:
-                full_prompt = (system_prompt.replace("{nlq}", question)
-                    .replace("{ont}", dataset_type)
-                    .replace("{shp_typ}", shape_type)
-                    .replace("{shp_dat}", merged_shape_data)
-                )
-            elif not previous_response and baseline_run:
-                full_prompt = (system_prompt.replace("{nlq}", question)
-                    .replace("{ont}", dataset_type)
-                )
-            temperature = round(min(initial_temperature + 0.1 * retries, 2), 2)  # capped at 2.0
-            print(f"🔄 Attempt {retries + 1}/{max_retries + 1} with temperature: {temperature}")
-            full_response = call_llm(full_prompt, max_tokens, temperature, api_key, model, llm_provider)
-
-            message_content = full_response.choices[0].message.content
-
-            if message_content is not None:
-                response = message_content.strip()
-            else:
-                print(f"LLM response has no content (None). Check the API call or model behavior. \n full_response: {full_response}\nmessage_content: {message_content}")
-
-            if not response:
-                retries += 1
-                time.sleep(1)
-                continue
-
-            final_query = response.replace("```sparql\n", "").replace("\n```", "").strip()
-            print(f"##########################################\nFull prompt: {full_prompt}\n##########################################")
-
+            response = ""
+            print(f"⚠️ LLM response has no content (None). Check the API call or model behavior.")
+            event_log.warning("generate.empty_response", model=attempt_model, full_response=full_response)
+
+        prompt_tokens_by_retry = full_response.usage.prompt_tokens
+        completion_tokens_by_retry = full_response.usage.completion_tokens
+        total_tokens_by_retry = full_response.usage.total_tokens
+
+        final_query = response.replace("```sparql\n", "").replace("\n```", "").strip()
+        normalized_query = retry_policy.normalize_query(final_query)
+        attempt_reexecutions = 0
+
+        if not final_query:
+            llm_generated_result = None
+            failure_class = retry_policy.NO_QUERY
+        elif normalized_query in previous_results:
+            # Running the same query again cannot give a different answer
+            print(f"⚠️ LLM repeated a previous query, not executing it again.")
+            llm_generated_result = previous_results[normalized_query]
+            failure_class = retry_policy.DUPLICATE
+        else:
+            event_log.detail("generate.prompt", question_id, prompt=full_prompt)
             print(f"LLM generated SPARQL query:\n{final_query}")
-            
-            if is_local_graph:
-                llm_generated_result = Utils.query_local_graph(final_query, local_graph_path)
-
-            else:
-                llm_generated_result = Utils.query_sparql_endpoint(final_query, sparql_endpoint_url)
 
-            # Truncate results if they exceed 10000 and mark as failed
-            if isinstance(llm_generated_result, list) and len(llm_generated_result) > 10000:
-                print(f"⚠️ Result exceeds 10000 entries. Truncating and marking as failed.")
+            llm_generated_result = execute(final_query)
+            failure_class = retry_policy.classify_result(llm_generated_result)
+            while failure_class and policy.decide(failure_class, reexecutions, escalated) == retry_policy.REEXECUTE:
+                record(failure_class, retry_policy.REEXECUTE)
+                reexecutions += 1
+                attempt_reexecutions += 1
+                print(f"🔁 {retry_policy.REASONS[failure_class]}. Re-executing the query ({reexecutions}/{policy.max_reexecutions})")
+                tracing.sleep(reexecutions, "endpoint_reexecute")
+                llm_generated_result = execute(final_query)
+                failure_class = retry_policy.classify_result(llm_generated_result)
+            # Results exceeding the cap are dropped and the attempt counts as failed; a repeat of the query gets the dropped result too
+            if failure_class == retry_policy.OVER_CAP:
+                print(f"⚠️ Result exceeds {retry_policy.RESULT_CAP} entries. Truncating and marking as failed.")
                 llm_generated_result = []
-                failed = True
-                failure_reason = "Result exceeded 10000 entries (truncated)"
-            else:
-                failed = Utils.is_faulty_result(llm_generated_result)
-                failure_reason = "Faulty result" if failed else None
+            previous_results[normalized_query] = llm_generated_result
 
-            prompt_tokens_by_retry = full_response.usage.prompt_tokens
-            completion_tokens_by_retry = full_response.usage.completion_tokens
-            total_tokens_by_retry = full_response.usage.total_tokens
-            
+        action = policy.decide(failure_class, reexecutions, escalated) if failure_class else None
+        if failure_class:
+            record(failure_class, action)
+
+        counted = policy.counts_attempt(failure_class)
+        if counted:
+            failed = policy.marks_failed(failure_class)
             prompt_tokens_by_question += prompt_tokens_by_retry
             completion_tokens_by_question += completion_tokens_by_retry
             total_tokens_by_question += total_tokens_by_retry
-            
             attempts_log.append({
                 "attempt": retries + 1,
                 "temperature": temperature,
+                "model": attempt_model,
                 "query": final_query,
                 "result": llm_generated_result,
                 "failed": str(failed),
-                "reason": failure_reason if failure_reason else "None",
+                "reason": retry_policy.REASONS[failure_class] if failed else "None",
+                "failure_class": failure_class or "None",
+                "action": action or "None",
+                "reexecutions": attempt_reexecutions,
                 "prompt_tokens_by_retry": prompt_tokens_by_retry,
                 "completion_tokens_by_retry": completion_tokens_by_retry,
                 "total_tokens_by_retry": total_tokens_by_retry,
             })
 
-            if failure_reason:
-                print(f"⚠️ Failure reason: {failure_reason}")
+        event_log.info(
+            "generate.attempt", model=attempt_model, temperature=temperature, failure_class=failure_class, action=action,
+            reexecutions=attempt_reexecutions, total_tokens=total_tokens_by_retry,
+            result_size=len(llm_generated_result) if isinstance(llm_generated_result, list) else None,
+        )
+        event_log.detail("generate.result", question_id, query=final_query, result=llm_generated_result)
+
+        if not failure_class:
+            print(f"✅ SPARQL executed successfully for question ID {question_id}")
+            break
+
+        print(f"⚠️ Failure reason: {retry_policy.REASONS[failure_class]} ({failure_class} → {action})")
+        if action == retry_policy.STOP:
+            print(f"⏹️ Keeping attempt {retries + 1} for question ID {question_id}")
+            break
+        if action == retry_policy.ESCALATE:
+            escalated = True
+            attempt_model = policy.escalation_model
+            print(f"⬆️ Escalating to model {attempt_model}")
+
+        print(f"⚠️ Retrying... ({retries + 1}/{max_retries})")
+        if counted:
+            previous_response = f"Query: {final_query}\nResult: {llm_generated_result}"
+        retries += 1
+
+    entry["LLM_generated_sparql_query"] = attempts_log
+    entry["sparql_comparison_result"] = {
+        "is_correct": "",
+        "llm_failed_attempts": retries,
+        "prompt_tokens_by_question": prompt_tokens_by_question,
+        "completion_tokens_by_question": completion_tokens_by_question,
+        "total_tokens_by_question": total_tokens_by_question,
+        "failure_classes": failure_classes,
+        "retry_actions": retry_actions,
+        "retry_accounting": policy.accounting,
+    }
+
+def generate_sparql_for_languages(entry, system_prompt, merged_shape_data, api_key, model, max_tokens, initial_temperature,
+                                  llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, policy=None):
+    """
+    Generates SPARQL for every language of a multilingual record concurrently, one thread per language.
+    All languages share the record's shape; the attempts and comparison of each language are stored under "languages".
+    """
+    question_id = entry.get('baseline_id')
+
+    def generate(language):
+        view = multilingual.language_view(entry, language)
+        # Worker threads don't inherit the question's context, so each language is measured separately
+        with tracing.context(question_id=question_id, language=language), operational_metrics.measure() as usage:
+            generate_sparql_for_entry(view, system_prompt, merged_shape_data, api_key, model, max_tokens, initial_temperature,
+                                      llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, policy)
+        return view, usage
+
+    languages = multilingual.languages_of(entry)
+    print(f"🌐 Generating SPARQL for question ID {question_id} in {len(languages)} languages: {', '.join(languages)}")
+    with ThreadPoolExecutor(max_workers=len(languages), thread_name_prefix=f"question-{question_id}") as executor:
+        results = list(executor.map(generate, languages))
+
+    for language, (view, usage) in zip(languages, results):
+        multilingual.store_view(entry, language, view)
+        operational_metrics.absorb(usage)
+
+def load_system_prompt(system_prompt_path, baseline_run, system_prompt_path_baseline_run):
+    """Reads the system prompt for SPARQL generation, using the baseline prompt for baseline runs."""
+    if baseline_run:
+        system_prompt_path = system_prompt_path_baseline_run
+    return read_file(system_prompt_path)
+
+def process_entry(entry, system_prompt, local_shape_data, shape_dir, shapes, api_key, model, max_tokens, initial_temperature,
+                  llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, policy=None,
+                  shape_format=compact_shape.NATIVE):
+    """
+    Picks the shape for one experiment record and generates its SPARQL query; skipped records are left unchanged.
+    With shape_format "compact" the prompt gets the compact serialization of the shape instead of the shape text.
+    """
+    if not isinstance(entry, dict):
+        print(f"⚠️ Skipping non-dict entry: {entry}")
+        return entry
+
+    question_id = entry.get('baseline_id')
+    question = entry.get("baseline_question_text", "").strip()
+
+    print(f"\n🔎 Processing question ID {question_id}")
+    event_log.detail(
+        "generate.question", question_id, question_id=question_id, question=question, baseline_sparql_query=entry.get("baseline_sparql_query"),
+        endpoint_entities_resolved=None if baseline_run else entry.get("endpoint_entities_resolved"),
+    )
 
-            if not failed:
-                print(f"✅ SPARQL executed successfully for question ID {question_id}")
-                break
-            else:
-                print(f"⚠️ Faulty result. Retrying... ({retries + 1}/{max_retries})")
-                previous_response = f"Query: {final_query}\nResult: {llm_generated_result}"
-                retries += 1
-                time.sleep(1)
-
-        entry["LLM_generated_sparql_query"] = attempts_log
-        entry["sparql_comparison_result"] = {
-            "is_correct": "",
-            "llm_failed_attempts": retries,
-            "prompt_tokens_by_question": prompt_tokens_by_question,
-            "completion_tokens_by_question": completion_tokens_by_question,
-            "total_tokens_by_question": total_tokens_by_question,
-        }
-
-    with open(json_path, "w", encoding="utf-8") as file:
-        json.dump(data, file, indent=4, ensure_ascii=False)
+    if not question:
+        print(f"⚠️ Skipping question ID {question_id} due to missing question text.")
+        return entry
+
+    merged_shape_data = None
+    if is_local_graph and not baseline_run:
+        merged_shape_data = local_shape_data
+    elif not is_local_graph and not baseline_run:
+        merged_shape_data = resolve_shape_for_entry(entry, shape_dir, shape_type, shapes)
+        if merged_shape_data is None:
+            return entry
+
+    prompt_shape_type = shape_type
+    if merged_shape_data is not None:
+        merged_shape_data, prompt_shape_type, entry["shape_serialization"] = compact_shape.prompt_shape(merged_shape_data, shape_type, shape_format)
+
+    generate = generate_sparql_for_languages if multilingual.languages_of(entry) else generate_sparql_for_entry
+    with tracing.context(question_id=question_id), operational_metrics.measure() as usage:
+        generate(entry, system_prompt, merged_shape_data, api_key, model, max_tokens, initial_temperature,
+                                  llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, prompt_shape_type, dataset_type, baseline_run, policy)
+    return usage.add_to(entry)
+
+def process_records(data, shape_dir, system_prompt_path, api_key, model, max_tokens, initial_temperature,
+                    llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, system_prompt_path_baseline_run, shapes=None, journal=None, sidecar=None, policy=None,
+                    shape_format=compact_shape.NATIVE):
+    """
+    Generates SPARQL queries for in-memory experiment records.
+    `shapes` optionally maps question IDs (or "local_graph") to shape text produced in the same process.
+    If a journal is given, every finished record is appended to it and already journaled questions are skipped.
+    With a result sidecar, journaled records reference their query results instead of embedding them.
+    """
+    print(f"🔍 Debug: Starting to process {len(data)} questions.")
+
+    system_prompt = load_system_prompt(system_prompt_path, baseline_run, system_prompt_path_baseline_run)
+
+    local_shape_data = None
+    if is_local_graph and not baseline_run:
+        if shapes is not None and "local_graph" in shapes:
+            local_shape_data = shapes["local_graph"]
+        else:
+            local_shape_data = load_local_shape(shape_dir, shape_type)
+
+    for entry in data:
+        question_id = entry.get('baseline_id') if isinstance(entry, dict) else None
+        if journal is not None and journal.is_completed(question_id):
+            entry.update(journal.get(question_id))
+            result_sidecar.resolve_entry(entry, sidecar)
+            print(f"♻️ Skipping question ID {question_id}, already completed")
+            continue
+
+        process_entry(entry, system_prompt, local_shape_data, shape_dir, shapes, api_key, model, max_tokens, initial_temperature,
+                      llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, policy, shape_format)
+        if journal is not None and isinstance(entry, dict):
+            journal.append(question_id, result_sidecar.externalize_entry(entry, sidecar))
+
+    return data
+
+def process_json_and_shapes(json_path, shape_dir, system_prompt_path, api_key, model, max_tokens, initial_temperature,
+                            llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, system_prompt_path_baseline_run, resume=False, result_store_dir=None, policy=None,
+                            shape_format=compact_shape.NATIVE):
+    """Iterates over JSON questions and shape files to generate SPARQL queries, ensuring only one LLM call per question."""
+
+    # Load the JSON file with questions
+    with tracing.span("file.read", path=json_path), open(json_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    sidecar = result_sidecar.open_sidecar(result_store_dir)
+    journal = StageJournal(StageJournal.path_for(json_path, "call_llm_api"), resume)
+    process_records(data, shape_dir, system_prompt_path, api_key, model, max_tokens, initial_temperature,
+                    llm_provider, is_local_graph, max_retries, sparql_endpoint_url, local_graph_path, shape_type, dataset_type, baseline_run, system_prompt_path_baseline_run,
+                    journal=journal, sidecar=sidecar, policy=policy, shape_format=shape_format)
+
+    with tracing.span("file.write", path=json_path), open(json_path, "w", encoding="utf-8") as file:
+        json.dump(result_sidecar.externalize_records(data, sidecar), file, indent=4, ensure_ascii=False)
 
     print(f"\n🎉 Done. All questions processed and saved to: {json_path}")
 
@@ -241,11 +407,17 @@ def main():
     parser.add_argument("--sparql_endpoint_url", type=str)
     parser.add_argument("--local_graph_path", type=str)
     parser.add_argument("--shape_type", type=str)
+    parser.add_argument("--shape_format", type=str, choices=compact_shape.FORMATS, default=compact_shape.NATIVE, help="Shape serialization in the prompt: the shape text or one compact line per property.")
     parser.add_argument("--dataset_type", type=str, default="default", help="Type of dataset to process.")
     parser.add_argument("--baseline_run", type=Utils.str_to_bool, default=False, help="Run baseline SPARQL queries.")
     parser.add_argument("--system_prompt_path_baseline_run", type=str, default="system_prompt_baseline_run.txt", help="Path to the system prompt for baseline run.")
+    parser.add_argument("--resume", type=Utils.str_to_bool, default=False, help="Skip questions already completed in the stage journal.")
+    parser.add_argument("--result_store_dir", type=str, default="./cache/results", help="Content-addressed store for query results referenced from the JSON (\"None\" keeps results inline).")
+    retry_policy.add_arguments(parser)
+    Utils.add_runtime_arguments(parser)
 
     args = parser.parse_args()
+    Utils.configure_runtime(args, "call_llm_api")
     print(f"⚠️ baseline_run: {args.baseline_run}")
     if args.is_local_graph and not args.local_graph_path:
         parser.error("--local_graph_path is required when --is_local_graph is True.")
@@ -268,7 +440,11 @@ def main():
         shape_type=args.shape_type,
         dataset_type=args.dataset_type,
         baseline_run=args.baseline_run,
-        system_prompt_path_baseline_run=args.system_prompt_path_baseline_run
+        system_prompt_path_baseline_run=args.system_prompt_path_baseline_run,
+        resume=args.resume,
+        result_store_dir=args.result_store_dir,
+        policy=retry_policy.from_args(args),
+        shape_format=args.shape_format
     )
     print("🔍 Debug: process_json_and_shapes executed successfully.")
 
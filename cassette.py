@@ -0,0 +1,243 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import types
+import zlib
+import tracing
+
+RECORD = "record"
+REPLAY = "replay"
+MODES = [RECORD, REPLAY]
+
+# Environment variables with the cassette path and mode, set by --cassette for child processes
+PATH_ENV = "CASSETTE_PATH"
+MODE_ENV = "CASSETTE_MODE"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    kind TEXT NOT NULL,
+    scope TEXT NOT NULL DEFAULT '',
+    digest TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    summary TEXT,
+    response BLOB NOT NULL,
+    PRIMARY KEY (kind, scope, digest, occurrence)
+)
+"""
+
+_cassette = None
+_configured = False
+# Process name of the stage (see Utils.configure_runtime); stage processes count their occurrences separately
+_scope = ""
+_lock = threading.RLock()
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request that was not recorded."""
+
+class Cassette:
+    """
+    SQLite file of the LLM, SPARQL and shexer exchanges of a run, keyed by scope (the stage process),
+    request digest and occurrence. The n-th identical request of a process gets the n-th response recorded by the
+    same stage, so repeated calls replay in order and two stages sending the same request (the gold query in
+    extraction and verification) each get their own response. A replayed request beyond the recorded ones gets
+    the last response; one the stage never recorded gets a response of another stage. Responses are zlib-compressed JSON.
+    """
+
+    def __init__(self, path: str, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {', '.join(MODES)}.")
+        if mode == REPLAY and not os.path.exists(path):
+            raise FileNotFoundError(f"❌ ERROR: Cassette not found: {path}")
+        self.path = path
+        self.mode = mode
+        self.occurrences = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        self._migrate()
+        self._db.execute(SCHEMA)
+        self._db.commit()
+
+    def _migrate(self):
+        """Moves the exchanges of a cassette recorded without scopes to the empty scope."""
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(exchanges)")}
+        if not columns or "scope" in columns:
+            return
+        with self._db:
+            self._db.execute("ALTER TABLE exchanges RENAME TO exchanges_unscoped")
+            self._db.execute(SCHEMA)
+            self._db.execute(
+                "INSERT INTO exchanges (kind, scope, digest, occurrence, summary, response) "
+                "SELECT kind, '', digest, occurrence, summary, response FROM exchanges_unscoped"
+            )
+            self._db.execute("DROP TABLE exchanges_unscoped")
+
+    def _next_occurrence(self, kind: str, digest: str) -> int:
+        with self._lock:
+            occurrence = self.occurrences.get((kind, digest), 0)
+            self.occurrences[(kind, digest)] = occurrence + 1
+            return occurrence
+
+    def store(self, kind: str, digest: str, occurrence: int, summary: str, payload: dict):
+        blob = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO exchanges (kind, scope, digest, occurrence, summary, response) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, _scope, digest, occurrence, summary, blob),
+            )
+            self._db.commit()
+
+    def load(self, kind: str, digest: str, occurrence: int, summary: str) -> dict:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM exchanges WHERE kind = ? AND digest = ? AND occurrence <= ? "
+                "ORDER BY scope = ? DESC, occurrence DESC LIMIT 1",
+                (kind, digest, occurrence, _scope),
+            ).fetchone()
+        if row is None:
+            raise CassetteMiss(f"No recorded {kind} exchange in {self.path} for: {summary}")
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def exchange(self, kind: str, request: dict, perform, encode=None, decode=None, summary: str = ""):
+        """
+        Records or replays one exchange: perform() sends the request, encode turns its result into JSON-serializable
+        data and decode turns the recorded data back into a result. Exceptions are recorded and raised again on replay.
+        """
+        digest = hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+        occurrence = self._next_occurrence(kind, digest)
+        summary = summary[:200]
+
+        if self.mode == REPLAY:
+            payload = self.load(kind, digest, occurrence, summary)
+            if "error" in payload:
+                raise _rebuild_error(payload["error"])
+            return decode(payload["response"]) if decode else payload["response"]
+
+        try:
+            result = perform()
+        except Exception as e:
+            self.store(kind, digest, occurrence, summary, {"error": {"type": f"{type(e).__module__}.{type(e).__qualname__}", "message": str(e)}})
+            raise
+        self.store(kind, digest, occurrence, summary, {"response": encode(result) if encode else result})
+        return result
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._db.execute("SELECT kind, COUNT(*) FROM exchanges GROUP BY kind").fetchall())
+
+def _rebuild_error(error: dict) -> Exception:
+    """The recorded exception, or a RuntimeError with its message if its type cannot be rebuilt from the message alone."""
+    module_name, _, class_name = error["type"].rpartition(".")
+    try:
+        error_class = getattr(importlib.import_module(module_name), class_name)
+        return error_class(error["message"])
+    except Exception:
+        return RuntimeError(f"{error['type']}: {error['message']}")
+
+def set_scope(process_name: str):
+    """Names the stage process whose exchanges are recorded and replayed, e.g. "extract_entity_list"."""
+    global _scope
+    _scope = process_name
+
+def configure(path: str, mode: str):
+    """Records or replays the exchanges of this process and of the stage processes it starts."""
+    global _cassette, _configured
+    with _lock:
+        _cassette = Cassette(path, mode)
+        _configured = True
+    os.environ[PATH_ENV] = os.path.abspath(path)
+    os.environ[MODE_ENV] = mode
+    if mode == REPLAY:
+        # Nothing goes over the network, so there is nothing the throttling and back-off sleeps could protect
+        tracing.skip_sleeps()
+    print(f"📼 {'Recording' if mode == RECORD else 'Replaying'} LLM and endpoint traffic {'into' if mode == RECORD else 'from'} {path}")
+
+def active():
+    """The cassette of this process (configured or from the environment), None if traffic goes to the network."""
+    global _configured
+    if not _configured:
+        with _lock:
+            if not _configured:
+                _configured = True
+                if os.environ.get(PATH_ENV):
+                    configure(os.environ[PATH_ENV], os.environ.get(MODE_ENV, REPLAY))
+    return _cassette
+
+def exchange(kind: str, request: dict, perform, encode=None, decode=None, summary: str = ""):
+    """Cassette.exchange of the active cassette; calls perform() directly without one."""
+    cassette = active()
+    if cassette is None:
+        return perform()
+    return cassette.exchange(kind, request, perform, encode, decode, summary)
+
+def _encode_completion(completion):
+    return completion.model_dump(mode="json")
+
+def _decode_completion(data):
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(data)
+
+class _Completions:
+    def __init__(self, client_factory, llm_provider: str):
+        self._client_factory = client_factory
+        self._llm_provider = llm_provider
+
+    def create(self, **kwargs):
+        request = {"llm_provider": self._llm_provider, **kwargs}
+        return exchange(
+            "llm", request, lambda: self._client_factory().chat.completions.create(**kwargs),
+            _encode_completion, _decode_completion, summary=f"{kwargs.get('model')}: {str(kwargs.get('messages', ''))[-150:]}",
+        )
+
+def llm_client(client_factory, llm_provider: str):
+    """
+    Stand-in for an OpenAI client whose chat completions go through the cassette.
+    The real client is only created when a request is recorded, so replays need neither network nor API key.
+    """
+    return types.SimpleNamespace(chat=types.SimpleNamespace(completions=_Completions(client_factory, llm_provider)))
+
+def encode_response(response) -> dict:
+    return {
+        "status": response.status_code,
+        "reason": response.reason,
+        "url": response.url,
+        "headers": {"Content-Type": response.headers.get("Content-Type", "")},
+        "encoding": response.encoding,
+        "body": response.content.decode("latin-1"),
+    }
+
+def decode_response(data: dict):
+    """A requests.Response with the recorded status, headers and body bytes."""
+    import requests
+
+    response = requests.Response()
+    response.status_code = data["status"]
+    response.reason = data["reason"]
+    response.url = data["url"]
+    response.headers.update(data["headers"])
+    response.encoding = data["encoding"]
+    response._content = data["body"].encode("latin-1")
+    return response
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the contents of a cassette recorded with --cassette_mode record.")
+    parser.add_argument("--cassette", type=str, required=True, help="Path of the cassette file.")
+    parser.add_argument("--kind", type=str, help="Only list exchanges of this kind (llm, sparql, shexer).")
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.cassette)
+    for kind, count, size in db.execute("SELECT kind, COUNT(*), SUM(LENGTH(response)) FROM exchanges GROUP BY kind ORDER BY kind"):
+        print(f"📼 {kind}: {count} exchanges, {size / 1024:.1f} KiB compressed")
+    if args.kind:
+        for scope, digest, occurrence, summary in db.execute(
+            "SELECT scope, digest, occurrence, summary FROM exchanges WHERE kind = ? ORDER BY summary, scope", (args.kind,)
+        ):
+            print(f"{scope or '-'} {digest[:12]} #{occurrence}: {summary}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import argparse
+import functools
+import math
+import re
+
+NATIVE = "native"
+COMPACT = "compact"
+FORMATS = [NATIVE, COMPACT]
+
+# Rough size of a token in shape text, for comparing serializations without a tokenizer of every provider
+CHARS_PER_TOKEN = 4
+
+LEGEND = "# Each shape, then one property per line: <path> <value type> <cardinality: 1 ? * + {m,n}> [-- label]"
+
+PREFIX_PATTERN = re.compile(r"^\s*(?:PREFIX|@prefix)\s+([\w.-]*):\s*<([^>]*)>\s*\.?\s*$", re.IGNORECASE | re.MULTILINE)
+CARDINALITY_PATTERN = re.compile(r"^(\*|\+|\?|\{\d+(,\d*)?\})$")
+QNAME_PATTERN = re.compile(r"(?<![\w<@/#-])([A-Za-z][\w.-]*):(?=[\w<])")
+
+# Namespace of the shape labels of the KG shape maps (generate_shape.py), e.g. http://shapes.dbpedia.org/,
+# and the entity IRI after the label in "<label>:<entity IRI>"
+SHAPES_NAMESPACE_PATTERN = re.compile(r"^https?://shapes\.[\w.-]+/")
+ENTITY_IRI_PATTERN = re.compile(r"^(.*?):(https?://.+)$")
+
+SH = "http://www.w3.org/ns/shacl#"
+NODE_KINDS = {"IRI": "IRI", "Literal": "Literal", "BlankNode": "BNode", "BlankNodeOrIRI": "IRI", "IRIOrLiteral": "."}
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+def parse_prefixes(text: str) -> dict:
+    return {prefix: namespace for prefix, namespace in PREFIX_PATTERN.findall(text)}
+
+def prefixed_iri(iri: str, prefixes: dict) -> str:
+    """IRI as prefix:local with the longest matching namespace, or <iri> if none matches."""
+    matches = [(prefix, namespace) for prefix, namespace in prefixes.items() if namespace and iri.startswith(namespace)]
+    if matches:
+        prefix, namespace = max(matches, key=lambda match: len(match[1]))
+        return f"{prefix}:{iri[len(namespace):]}"
+    return f"<{iri}>"
+
+def shape_name(reference: str, prefixes: dict) -> str:
+    """
+    Name of a shape (or shape reference) in the compact serialization. Shapes of the KG shape maps keep their
+    "<label>:<entity>" part with the entity as prefixed IRI, as the name is the only place the prompt carries it:
+    "<http://shapes.dbpedia.org/AC/DC:http://dbpedia.org/resource/AC/DC>" → "AC/DC:dbr:AC/DC",
+    "shapes:Barack_Obama:Q76" → "Barack_Obama:Q76". Other shapes keep their local name, "@:Company" → "Company".
+    """
+    reference = reference.lstrip("@")
+    if reference.startswith("<") and reference.endswith(">"):
+        iri = reference[1:-1]
+    elif ":" in reference:
+        prefix, local = reference.split(":", 1)
+        if prefix not in prefixes:
+            return local
+        iri = prefixes[prefix] + local
+    else:
+        return reference
+
+    shapes_namespace = SHAPES_NAMESPACE_PATTERN.match(iri)
+    if shapes_namespace:
+        name = iri[shapes_namespace.end():]
+        entity = ENTITY_IRI_PATTERN.match(name)
+        return f"{entity.group(1)}:{prefixed_iri(entity.group(2), prefixes)}" if entity else name
+    return re.split(r"[/#]", iri)[-1]
+
+def _cardinality(min_count, max_count) -> str:
+    minimum = int(min_count) if min_count is not None else 0
+    maximum = int(max_count) if max_count is not None else None
+    symbols = {(1, 1): "1", (0, 1): "?", (0, None): "*", (1, None): "+"}
+    return symbols.get((minimum, maximum), f"{{{minimum},{'' if maximum is None else maximum}}}")
+
+def parse_shex(text: str) -> list:
+    """
+    Shapes of a ShEx text as written by shexer and cleaned by generate_shape.clean_shape_text:
+    [{"name": ..., "properties": [(path, value type, cardinality, label), ...]}, ...].
+    """
+    prefixes = parse_prefixes(text)
+    shapes, current = [], None
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line or PREFIX_PATTERN.match(line):
+            continue
+        if current is None:
+            name = line.rstrip("{").strip()
+            if name:
+                current = {"name": shape_name(name, prefixes), "properties": []}
+                shapes.append(current)
+            continue
+        if line == "{":
+            continue
+        if line.startswith("}"):
+            current = None
+            continue
+
+        label = None
+        comment = re.search(r"\s//\s", line)
+        if comment:
+            line, comment = line[:comment.start()], line[comment.end():]
+            quoted = re.search(r"\"(?:P\d+\s*-->\s*)?(.*?)\"", comment)
+            label = quoted.group(1).strip() if quoted and "rdfs:comment" in comment else None
+        elif "-->" in line:
+            line, label = (part.strip() for part in line.split("-->", 1))
+        tokens = line.strip().rstrip(";").split()
+        if len(tokens) < 2:
+            continue
+        path, rest = tokens[0], tokens[1:]
+        cardinality = "1"
+        if len(rest) > 1 and CARDINALITY_PATTERN.match(rest[-1]):
+            cardinality = rest.pop()
+        value_type = " ".join("@" + shape_name(token, prefixes) if token.startswith("@") else token for token in rest)
+        current["properties"].append((path, value_type, cardinality, label))
+    return shapes
+
+def parse_shacl(text: str) -> list:
+    """Node shapes of a SHACL Turtle text, in the same form as parse_shex. Properties are sorted by path."""
+    import rdflib
+    from rdflib.collection import Collection
+
+    graph = rdflib.Graph()
+    graph.parse(data=text, format="turtle")
+    prefixes = parse_prefixes(text)
+    sh = rdflib.Namespace(SH)
+
+    def qname(node) -> str:
+        if isinstance(node, rdflib.Literal):
+            return str(node)
+        return prefixed_iri(str(node), prefixes)
+
+    def value(node, *predicates):
+        for predicate in predicates:
+            found = graph.value(node, predicate)
+            if found is not None:
+                return found
+        return None
+
+    shapes = []
+    for shape in sorted(set(graph.subjects(rdflib.RDF.type, sh.NodeShape)), key=str):
+        properties = []
+        for prop in graph.objects(shape, sh.property):
+            path = value(prop, sh.path)
+            if path is None:
+                continue
+            members = value(prop, sh["in"])
+            if members is not None:
+                value_type = "[" + " ".join(qname(member) for member in Collection(graph, members)) + "]"
+            elif value(prop, sh.node) is not None:
+                value_type = "@" + shape_name(f"<{value(prop, sh.node)}>", prefixes)
+            elif value(prop, sh.datatype, sh.dataType) is not None:
+                value_type = qname(value(prop, sh.datatype, sh.dataType))
+            elif value(prop, sh["class"]) is not None:
+                value_type = f"class {qname(value(prop, sh['class']))}"
+            elif value(prop, sh.nodeKind) is not None:
+                value_type = NODE_KINDS.get(str(value(prop, sh.nodeKind))[len(SH):], ".")
+            else:
+                value_type = "."
+            label = value(prop, rdflib.RDFS.comment, sh.name, sh.description)
+            cardinality = _cardinality(value(prop, sh.minCount), value(prop, sh.maxCount))
+            properties.append((qname(path), value_type, cardinality, str(label) if label is not None else None))
+        shapes.append({"name": shape_name(f"<{shape}>", prefixes), "properties": sorted(properties)})
+    return shapes
+
+def serialize(shapes: list, prefixes: dict) -> str:
+    """Compact text of parsed shapes, preceded by the PREFIX lines of the namespaces it uses."""
+    lines = []
+    for shape in shapes:
+        lines.append(shape["name"])
+        for path, value_type, cardinality, label in shape["properties"]:
+            lines.append(f"  {path} {value_type} {cardinality}" + (f" -- {label}" if label else ""))
+    body = "\n".join(lines)
+    used = {prefix for prefix in QNAME_PATTERN.findall(body) if prefix in prefixes}
+    prefix_lines = [f"PREFIX {prefix}: <{namespace}>" for prefix, namespace in prefixes.items() if prefix in used]
+    return "\n".join(prefix_lines + ["", LEGEND, body] if prefix_lines else [LEGEND, body])
+
+@functools.lru_cache(maxsize=256)
+def compact_shape(shape_text: str, shape_type: str):
+    """Compact serialization of a ShEx or SHACL shape text; None if no shape could be parsed from it."""
+    try:
+        shapes = parse_shacl(shape_text) if shape_type == "shacl" else parse_shex(shape_text)
+    except Exception as e:
+        print(f"⚠️ Could not parse the {shape_type} shape for the compact serialization: {e}")
+        return None
+    if not shapes:
+        return None
+    return serialize(shapes, parse_prefixes(shape_text))
+
+def prompt_shape(shape_text: str, shape_type: str, shape_format: str = NATIVE):
+    """
+    The shape text and shape type name for the {shp_dat} and {shp_typ} placeholders of the prompt, and the
+    estimated token sizes of the native and the prompt serialization. Shapes that cannot be parsed are sent as they are.
+    """
+    text, type_name, used_format = shape_text, shape_type, NATIVE
+    if shape_format == COMPACT:
+        compact = compact_shape(shape_text, shape_type)
+        if compact is not None:
+            text, type_name, used_format = compact, f"compact {shape_type}", COMPACT
+    native_tokens, prompt_tokens = estimate_tokens(shape_text), estimate_tokens(text)
+    stats = {
+        "format": used_format,
+        "native_tokens": native_tokens,
+        "prompt_tokens": prompt_tokens,
+        "saved_tokens": native_tokens - prompt_tokens,
+    }
+    return text, type_name, stats
+
+def summarize_records(data) -> dict:
+    """Average estimated shape tokens per question, native and as sent in the prompt, over the records with a shape."""
+    stats = [entry["shape_serialization"] for entry in data if isinstance(entry, dict) and entry.get("shape_serialization")]
+    if not stats:
+        return {"questions": 0}
+    formats = sorted({item["format"] for item in stats})
+    native = sum(item["native_tokens"] for item in stats) / len(stats)
+    prompt = sum(item["prompt_tokens"] for item in stats) / len(stats)
+    return {
+        "questions": len(stats),
+        "format": formats[0] if len(formats) == 1 else "mixed",
+        "avg_native_tokens": native,
+        "avg_prompt_tokens": prompt,
+        "avg_saved_tokens": native - prompt,
+        "saved_ratio": (native - prompt) / native if native else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the compact prompt serialization of a ShEx or SHACL shape file and its estimated token savings.")
+    parser.add_argument("--shape_file", type=str, required=True, help="Path of a shape file written by generate_shape.py.")
+    parser.add_argument("--shape_type", type=str, choices=["shex", "shacl"], help="Shape type (default: the file extension).")
+    args = parser.parse_args()
+
+    with open(args.shape_file, "r", encoding="utf-8") as f:
+        shape_text = f.read().strip()
+    shape_type = args.shape_type or args.shape_file.rsplit(".", 1)[-1]
+    text, _, stats = prompt_shape(shape_text, shape_type, COMPACT)
+    print(text)
+    print(f"\n📉 ~{stats['native_tokens']} → ~{stats['prompt_tokens']} tokens ({stats['saved_tokens']} saved)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import json
+import random
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+class _Stream:
+    """Character buffer over a text file that is refilled in chunks and trimmed as values are consumed."""
+
+    def __init__(self, f, path):
+        self.f = f
+        self.path = path
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character without consuming it ("" at the end of the file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Invalid JSON file: {self.path}. Expected '{char}' at character {self.pos} of the current chunk.")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next JSON value, reading more chunks until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer might continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"Invalid JSON file: {self.path}. Error: {e}")
+            self.fill()
+
+def iter_questions(path):
+    """
+    Yields the question entries of a QALD-style `{"questions": [...]}` file or a bare list, one at a time.
+    Only the current entry and one chunk of the file are held in memory; other top-level keys are skipped.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _Stream(f, path)
+        first = stream.peek()
+        if first == "{":
+            stream.expect("{")
+            while True:
+                if stream.peek() == "}":
+                    raise ValueError(f"Invalid JSON structure in file {path}: expected a list or a dictionary with a 'questions' key.")
+                key = stream.value()
+                stream.expect(":")
+                if key == "questions":
+                    break
+                stream.value()
+                if stream.peek() == ",":
+                    stream.expect(",")
+        elif first != "[":
+            raise ValueError(f"Invalid JSON structure in file {path}: expected a list or a dictionary with a 'questions' key.")
+
+        stream.expect("[")
+        if stream.peek() == "]":
+            return
+        while True:
+            yield stream.value()
+            separator = stream.peek()
+            if separator == "]":
+                return
+            stream.expect(",")
+
+def validate_question(entry):
+    """Raises ValueError unless the entry has the fields the pipeline reads."""
+    if not isinstance(entry, dict):
+        raise ValueError("Invalid question entry: each question must be a dictionary.")
+    if "id" not in entry or "question" not in entry or "query" not in entry:
+        raise ValueError("Invalid question entry: missing required keys ('id', 'question', 'query').")
+    if not isinstance(entry["question"], list) or not entry["question"]:
+        raise ValueError("Invalid question entry: 'question' must be a non-empty list.")
+    if not isinstance(entry["query"], dict) or "sparql" not in entry["query"]:
+        raise ValueError("Invalid question entry: 'query' must be a dictionary containing a 'sparql' key.")
+
+def parse_id_ranges(spec):
+    """
+    Parses a question ID selection like "1-50,77,100-" into a list of (low, high) pairs.
+    Numeric bounds select numeric IDs in the range (open ends allowed), anything else is an exact ID.
+    """
+    ranges = []
+    for part in filter(None, (part.strip() for part in (spec or "").split(","))):
+        low, separator, high = part.partition("-")
+        if separator and (low.strip().isdigit() or not low.strip()) and (high.strip().isdigit() or not high.strip()):
+            ranges.append((int(low) if low.strip() else None, int(high) if high.strip() else None))
+        else:
+            ranges.append((part, part))
+    return ranges
+
+def id_selected(question_id, ranges) -> bool:
+    if not ranges:
+        return True
+    question_id = str(question_id)
+    for low, high in ranges:
+        if isinstance(low, str):
+            if question_id == low:
+                return True
+        elif question_id.isdigit() and (low is None or int(question_id) >= low) and (high is None or int(question_id) <= high):
+            return True
+    return False
+
+def read_questions(path, num_questions=None, question_ids=None, sample_size=None, sample_seed=0, shard_index=0, shard_count=1):
+    """
+    Streams the questions of a benchmark and returns the selected, validated entries in file order.
+    Selection: question IDs in `question_ids` ranges, then a uniform random sample of `sample_size` of them
+    (reservoir sampling, so the file is read once and only the sample is kept), then the first `num_questions`,
+    then the round-robin shard. Without sampling, reading stops as soon as `num_questions` entries are selected.
+    """
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard_index}/{shard_count}: expected 0 <= shard_index < shard_count.")
+    ranges = parse_id_ranges(question_ids)
+
+    if sample_size:
+        rng = random.Random(sample_seed)
+        reservoir = []
+        for seen, entry in enumerate(entry for entry in _validated(path) if id_selected(entry["id"], ranges)):
+            if len(reservoir) < sample_size:
+                reservoir.append((seen, entry))
+            else:
+                slot = rng.randint(0, seen)
+                if slot < sample_size:
+                    reservoir[slot] = (seen, entry)
+        selected = [entry for _, entry in sorted(reservoir, key=lambda item: item[0])]
+        selected = selected[:num_questions] if num_questions is not None else selected
+        return selected[shard_index::shard_count]
+
+    selected = []
+    taken = 0
+    for entry in _validated(path):
+        if num_questions is not None and taken >= num_questions:
+            break
+        if not id_selected(entry["id"], ranges):
+            continue
+        if taken % shard_count == shard_index:
+            selected.append(entry)
+        taken += 1
+    return selected
+
+def _validated(path):
+    for entry in iter_questions(path):
+        validate_question(entry)
+        yield entry
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the selected questions of a QALD-style benchmark into a smaller benchmark file.")
+    parser.add_argument("--benchmark_dataset", type=str, required=True, help="Path to the QALD benchmark JSON file.")
+    parser.add_argument("--output", type=str, required=True, help="Path of the written benchmark subset.")
+    parser.add_argument("--num_questions", type=int, help="Keep the first n selected questions.")
+    parser.add_argument("--question_ids", type=str, help="Question ID selection, e.g. \"1-50,77,100-\".")
+    parser.add_argument("--sample_size", type=int, help="Uniform random sample of this many questions.")
+    parser.add_argument("--sample_seed", type=int, default=0, help="Seed of the random sample.")
+    args = parser.parse_args()
+
+    questions = read_questions(args.benchmark_dataset, args.num_questions or None, args.question_ids, args.sample_size, args.sample_seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"questions": questions}, f, indent=4, ensure_ascii=False)
+    print(f"✅ {len(questions)} questions written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import threading
+import time
+import tracing
+import operational_metrics
+import cassette
+
+# Weight of the newest request in the latency and error rate averages
+EWMA_ALPHA = 0.3
+# Consecutive failures that open the circuit of an endpoint; it stays open this long, doubling while probes fail
+FAILURE_THRESHOLD = 3
+OPEN_SECONDS = 30.0
+MAX_OPEN_SECONDS = 300.0
+# Routing score multiplier per unit of error rate: an endpoint failing half of its requests counts as 3x slower
+ERROR_PENALTY = 4.0
+# Latency assumed for an endpoint whose requests all failed before a response arrived
+UNMEASURED_SECONDS = 10.0
+# Statuses of an overloaded endpoint, retried on the next endpoint of the pool
+FAILOVER_STATUSES = (429, 502, 503, 504)
+
+# Environment variable with the path of the endpoint pool file, set by --endpoint_pool for child processes
+POOL_ENV = "SPARQL_ENDPOINT_POOL"
+
+# Endpoint groups of the pool file and the pools created in this process
+_groups = None
+_pools = {}
+_lock = threading.Lock()
+
+class EndpointState:
+    """Latency and error averages and the circuit breaker of one endpoint."""
+
+    def __init__(self, url: str, order: int):
+        self.url = url
+        self.order = order
+        self.latency = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.open_seconds = OPEN_SECONDS
+        self.open_until = 0.0
+        self.probing = False
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def state(self, now: float) -> str:
+        if self.consecutive_failures < FAILURE_THRESHOLD:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+    def available(self, now: float) -> bool:
+        """Closed circuits take any request, half-open ones a single probe at a time."""
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def score(self) -> float:
+        # Endpoints without a request yet score 0, so every endpoint is measured once
+        if self.latency is None:
+            return UNMEASURED_SECONDS if self.requests else 0.0
+        return self.latency * (1 + ERROR_PENALTY * self.error_rate)
+
+class EndpointPool:
+    """
+    Equivalent SPARQL endpoints (public endpoint, mirrors, local stand-ins) of one dataset.
+    Requests go to the available endpoint with the lowest latency average, penalized by its error rate;
+    endpoints failing FAILURE_THRESHOLD times in a row are skipped until their circuit half-opens for a probe.
+    """
+
+    def __init__(self, name: str, urls: list):
+        self.name = name
+        self.endpoints = [EndpointState(url, order) for order, url in enumerate(urls)]
+        self._lock = threading.Lock()
+
+    @property
+    def urls(self) -> list:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def choose(self, exclude=()):
+        """
+        Picks the endpoint of the next request and returns it with the seconds to wait before sending it.
+        The wait is 0 unless every circuit is open, then the endpoint reopening first is probed after it reopens.
+        Every choice must be followed by record().
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.url not in exclude] or self.endpoints
+            available = [endpoint for endpoint in candidates if endpoint.available(now)]
+            if available:
+                endpoint = min(available, key=lambda endpoint: (endpoint.score(), endpoint.in_flight, endpoint.order))
+            else:
+                endpoint = min(candidates, key=lambda endpoint: endpoint.open_until)
+            if endpoint.state(now) != "closed":
+                endpoint.probing = True
+            endpoint.in_flight += 1
+            return endpoint, max(0.0, endpoint.open_until - now)
+
+    def record(self, endpoint: EndpointState, ok: bool, seconds: float = None):
+        """
+        Updates the averages and the circuit of an endpoint after a request.
+        seconds is the latency sample, None if the request failed without one (a fast error response says nothing about the latency).
+        """
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.probing = False
+            endpoint.requests += 1
+            if seconds is not None:
+                endpoint.latency = seconds if endpoint.latency is None else (1 - EWMA_ALPHA) * endpoint.latency + EWMA_ALPHA * seconds
+            endpoint.error_rate = (1 - EWMA_ALPHA) * endpoint.error_rate + EWMA_ALPHA * (0.0 if ok else 1.0)
+
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.open_seconds = OPEN_SECONDS
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= FAILURE_THRESHOLD:
+                # A failed probe keeps the circuit open twice as long as before
+                if endpoint.consecutive_failures > FAILURE_THRESHOLD:
+                    endpoint.open_seconds = min(endpoint.open_seconds * 2, MAX_OPEN_SECONDS)
+                endpoint.open_until = time.monotonic() + endpoint.open_seconds
+                print(f"⚡ Circuit of {endpoint.url} opened for {endpoint.open_seconds:.0f}s after {endpoint.consecutive_failures} failures")
+
+    def _next(self, tried: list):
+        endpoint, wait = self.choose(exclude=tried)
+        if wait:
+            tracing.sleep(wait, "endpoint_circuit_open")
+        if tried:
+            operational_metrics.count("endpoint_failovers")
+        tried.append(endpoint.url)
+        return endpoint
+
+    def get(self, params: dict, headers: dict = None, timeout: float = None, **tags):
+        """
+        Sends a GET request to the best endpoint of the pool (see _send), or replays it from the cassette.
+        """
+        replaying = cassette.active() is not None and cassette.active().mode == cassette.REPLAY
+        response = cassette.exchange(
+            "sparql", {"pool": self.name, "params": params}, lambda: self._send(params, headers, timeout, **tags),
+            cassette.encode_response, cassette.decode_response, summary=params.get("query", ""),
+        )
+        if replaying:
+            from utility import Utils
+
+            Utils.count_endpoint_request(params.get("query", ""), response)
+        return response
+
+    def _send(self, params: dict, headers: dict = None, timeout: float = None, **tags):
+        """
+        Sends a GET request to the best endpoint of the pool.
+        Connection errors and overload statuses (FAILOVER_STATUSES) fail over to the next endpoint, each endpoint
+        is tried at most once. Timeouts are raised without failover, a query that is too expensive for one
+        endpoint is expensive for its mirrors as well.
+        Returns the last response; raises the last connection error if no endpoint answered.
+        """
+        import requests
+        from utility import Utils
+
+        tried, response, error = [], None, None
+        while len(tried) < len(self.endpoints):
+            endpoint = self._next(tried)
+            start = time.perf_counter()
+            try:
+                with Utils.endpoint_slot(), tracing.span("endpoint.query", endpoint=endpoint.url, **tags):
+                    response = Utils.get_http_session().get(endpoint.url, params=params, headers=headers, timeout=timeout)
+            except requests.exceptions.Timeout:
+                self.record(endpoint, False, time.perf_counter() - start)
+                raise
+            except requests.exceptions.RequestException as e:
+                self.record(endpoint, False)
+                error = e
+                continue
+            Utils.count_endpoint_request(params.get("query", ""), response)
+
+            overloaded = response.status_code in FAILOVER_STATUSES
+            self.record(endpoint, not overloaded, None if overloaded else time.perf_counter() - start)
+            if not overloaded:
+                return response
+        if response is not None:
+            return response
+        raise error or requests.exceptions.InvalidURL(f"No endpoints in pool '{self.name}'")
+
+    def run(self, function):
+        """
+        Calls function(url) with the best endpoint, e.g. for clients like shexer that send their own requests,
+        and fails over to the next endpoint when it raises. Raises the last exception if every endpoint failed.
+        """
+        tried = []
+        while True:
+            endpoint = self._next(tried)
+            start = time.perf_counter()
+            try:
+                result = function(endpoint.url)
+            except Exception:
+                self.record(endpoint, False)
+                if len(tried) >= len(self.endpoints):
+                    raise
+                continue
+            self.record(endpoint, True, time.perf_counter() - start)
+            return result
+
+    def snapshot(self) -> list:
+        """Per-endpoint state for reports."""
+        with self._lock:
+            now = time.monotonic()
+            return [{
+                "url": endpoint.url,
+                "state": endpoint.state(now),
+                "requests": endpoint.requests,
+                "failures": endpoint.failures,
+                "latency_ms": round(endpoint.latency * 1000, 1) if endpoint.latency is not None else None,
+                "error_rate": round(endpoint.error_rate, 3),
+            } for endpoint in self.endpoints]
+
+def split_urls(spec: str) -> list:
+    return [url.strip() for url in (spec or "").split(",") if url.strip()]
+
+def load_groups(path: str) -> dict:
+    """
+    Reads a pool file mapping group names to equivalent endpoints, e.g.
+    {"dbpedia": ["https://dbpedia.org/sparql", "http://localhost:8890/sparql"], "wikidata": ["https://query.wikidata.org/sparql"]}.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        groups = json.load(f)
+    if not isinstance(groups, dict) or not all(isinstance(urls, list) and urls for urls in groups.values()):
+        raise ValueError(f"Invalid endpoint pool file {path}: expected a dictionary of group names to non-empty URL lists.")
+    return {name.lower(): [str(url) for url in urls] for name, urls in groups.items()}
+
+def configure(path: str):
+    """Uses the endpoint groups of a pool file in this process and in the stage processes it starts."""
+    global _groups
+    groups = load_groups(path)
+    with _lock:
+        _groups = groups
+        _pools.clear()
+    os.environ[POOL_ENV] = os.path.abspath(path)
+
+def _configured_groups() -> dict:
+    global _groups
+    if _groups is None:
+        _groups = load_groups(os.environ[POOL_ENV]) if os.environ.get(POOL_ENV) else {}
+    return _groups
+
+def _pool(name: str, urls: list) -> EndpointPool:
+    with _lock:
+        key = (name, tuple(urls))
+        if key not in _pools:
+            _pools[key] = EndpointPool(name, urls)
+        return _pools[key]
+
+def pool_for(url_spec: str) -> EndpointPool:
+    """
+    The pool of an endpoint URL, e.g. --sparql_endpoint_url: the pool file group containing it,
+    otherwise a pool of the comma-separated URLs given.
+    """
+    urls = split_urls(url_spec)
+    with _lock:
+        groups = _configured_groups()
+    for name, group in groups.items():
+        if urls and urls[0] in group:
+            return _pool(name, group)
+    return _pool(urls[0] if urls else "", urls)
+
+def dataset_pool(dataset_type: str, default_url: str) -> EndpointPool:
+    """
+    The pool of the public endpoint of a dataset type, used for entity lookups and shape extraction.
+    <DATASET_TYPE>_SPARQL_ENDPOINT (comma-separated for several) takes precedence over the pool file group of the dataset type.
+    """
+    override = os.environ.get(f"{dataset_type.upper()}_SPARQL_ENDPOINT")
+    if override:
+        return pool_for(override)
+    with _lock:
+        group = _configured_groups().get(dataset_type.lower())
+    return _pool(dataset_type.lower(), group) if group else pool_for(default_url)
+
+def snapshot() -> dict:
+    """State of all pools used in this process, keyed by pool name."""
+    with _lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.snapshot() for pool in pools}
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe the endpoints of a pool file with a test query and show how requests are routed.")
+    parser.add_argument("--endpoint_pool", type=str, required=True, help="Path of the endpoint pool JSON file.")
+    parser.add_argument("--query", type=str, default="SELECT * WHERE { ?s ?p ?o } LIMIT 1", help="Query sent to every group.")
+    parser.add_argument("--requests", type=int, default=5, help="Requests per group.")
+    args = parser.parse_args()
+
+    configure(args.endpoint_pool)
+    for name in _configured_groups():
+        pool = dataset_pool(name, "")
+        for _ in range(args.requests):
+            try:
+                pool.get({"query": args.query, "format": "json"}, timeout=20)
+            except Exception as e:
+                print(f"❌ {name}: {e}")
+        for endpoint in pool.snapshot():
+            print(f"🛰️ {name}: {endpoint['url']} {endpoint['state']}, {endpoint['requests']} requests, "
+                  f"{endpoint['failures']} failures, {endpoint['latency_ms']} ms")
+
+if __name__ == "__main__":
+    main()
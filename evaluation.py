@@ -0,0 +1,252 @@
+import argparse
+import csv
+import json
+import time
+import numpy as np
+
+# Classification codes, in the order compare_sparql_results checks them
+TP, FP, FN, INVALID = 0, 1, 2, 3
+CLASSIFICATION_CODES = {"TP": TP, "FP": FP, "FN": FN, "Invalid": INVALID}
+
+# Values that count as an empty LLM answer (see verify_sparql.compare_sparql_results)
+NULL_LIKE_VALUES = {"", "0", "0.0", "null", "None"}
+
+class AnswerInterner:
+    """Maps answer strings to dense integer IDs, shared across all questions and runs that are scored together."""
+
+    def __init__(self):
+        self.ids = {}
+        self._null_like = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, value) -> int:
+        value = str(value)
+        answer_id = self.ids.get(value)
+        if answer_id is None:
+            answer_id = len(self.ids)
+            self.ids[value] = answer_id
+            self._null_like.append(value.strip() in NULL_LIKE_VALUES)
+        return answer_id
+
+    def null_like_mask(self):
+        return np.array(self._null_like, dtype=bool)
+
+class EncodedRun:
+    """
+    Gold and predicted answer sets of one run as flat arrays of (question index, answer ID) pairs.
+    Every question's answer IDs are unique, so set operations become sorted-array operations.
+    """
+
+    def __init__(self, gold_questions, gold_ids, pred_questions, pred_ids, total_tokens, retries):
+        self.gold_questions = gold_questions
+        self.gold_ids = gold_ids
+        self.pred_questions = pred_questions
+        self.pred_ids = pred_ids
+        self.total_tokens = total_tokens
+        self.retries = retries
+
+    @property
+    def num_questions(self):
+        return len(self.total_tokens)
+
+def _encode_sets(value_lists, interner):
+    questions, ids = [], []
+    for index, values in enumerate(value_lists):
+        answer_ids = {interner.intern(value) for value in values}
+        questions.extend([index] * len(answer_ids))
+        ids.extend(answer_ids)
+    return np.array(questions, dtype=np.int64), np.array(ids, dtype=np.int64)
+
+def _answer_values(response):
+    """
+    The values compare_sparql_results builds its answer set from: set() of the stored response,
+    which for the error dict of a failed query are its keys.
+    """
+    return list(response) if isinstance(response, (list, dict)) else []
+
+def encode_records(data, interner):
+    """Encodes the verified experiment records of one run."""
+    gold_lists, pred_lists = [], []
+    total_tokens, retries = [], []
+
+    for entry in data:
+        gold_lists.append(_answer_values(entry.get("baseline_sparql_query_response", [])))
+        llm_queries = entry.get("LLM_generated_sparql_query", [])
+        pred_lists.append(_answer_values(llm_queries[-1].get("result") if llm_queries else []))
+
+        comparison = entry.get("sparql_comparison_result", {})
+        total_tokens.append(int(comparison.get("total_tokens_by_question", 0)))
+        retries.append(int(comparison.get("llm_failed_attempts", 0)))
+
+    gold_questions, gold_ids = _encode_sets(gold_lists, interner)
+    pred_questions, pred_ids = _encode_sets(pred_lists, interner)
+    return EncodedRun(
+        gold_questions, gold_ids, pred_questions, pred_ids,
+        np.array(total_tokens, dtype=np.int64), np.array(retries, dtype=np.int64),
+    )
+
+def score_run(run, interner):
+    """
+    Scores all questions of an encoded run in vectorized passes.
+    Returns the classification codes (same rules as compare_sparql_results) and the per-question
+    partial precision and recall (NaN where undefined).
+    """
+    n = run.num_questions
+    vocabulary = max(len(interner), 1)
+    gold_keys = run.gold_questions * vocabulary + run.gold_ids
+    pred_keys = run.pred_questions * vocabulary + run.pred_ids
+    shared_keys = np.intersect1d(gold_keys, pred_keys, assume_unique=True)
+
+    gold_size = np.bincount(run.gold_questions, minlength=n)
+    pred_size = np.bincount(run.pred_questions, minlength=n)
+    shared = np.bincount(shared_keys // vocabulary, minlength=n)
+    null_like = interner.null_like_mask()
+    pred_meaningful = np.bincount(run.pred_questions, weights=~null_like[run.pred_ids], minlength=n) if len(null_like) else np.zeros(n)
+
+    codes = np.full(n, FP, dtype=np.int8)
+    is_invalid = gold_size == 0
+    is_exact = (gold_size == pred_size) & (shared == gold_size)
+    is_empty = pred_meaningful == 0
+    codes[is_empty] = FN
+    codes[is_exact] = TP
+    codes[is_invalid] = INVALID
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        partial_precision = np.where(pred_size > 0, shared / pred_size, np.nan)
+        partial_recall = np.where(gold_size > 0, shared / gold_size, np.nan)
+    partial_precision[is_invalid] = np.nan
+    partial_recall[is_invalid] = np.nan
+
+    return codes, partial_precision, partial_recall
+
+def aggregate_metrics(counts, total_tokens, total_retries, num_questions):
+    """
+    Computes F1, execution accuracy and ENA from (possibly batched) TP/FP/FN counts and effort totals,
+    with the same formulas as verify_sparql.compute_metrics.
+    """
+    tp, fp, fn = (np.asarray(c, dtype=float) for c in counts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f1_score = np.where(tp > 0, 2 * tp / (2 * tp + fp + fn), 0.0)
+        execution_accuracy = np.where(tp + fp + fn > 0, tp * 100 / (tp + fp + fn), 0.0)
+        avg_retries = np.asarray(total_retries, dtype=float) / num_questions
+        avg_tokens = np.asarray(total_tokens, dtype=float) / num_questions
+        ena = np.where(avg_tokens > 0, f1_score / ((1 + avg_retries) * np.log10(1 + avg_tokens)), 0.0) * 100
+    return f1_score, execution_accuracy, ena
+
+def bootstrap_confidence_intervals(codes, total_tokens, retries, resamples=10000, confidence=0.95, seed=0, max_batch_cells=4_000_000):
+    """
+    Bootstrap confidence intervals of F1, execution accuracy and ENA over resampled questions.
+    Resamples are drawn in batches of (resamples × questions) index matrices, so memory stays bounded.
+    """
+    codes = np.asarray(codes)
+    n = len(codes)
+    if n == 0 or resamples <= 0:
+        return None
+
+    rng = np.random.default_rng(seed)
+    is_tp, is_fp, is_fn = (codes == TP).astype(np.int64), (codes == FP).astype(np.int64), (codes == FN).astype(np.int64)
+    total_tokens = np.asarray(total_tokens, dtype=np.int64)
+    retries = np.asarray(retries, dtype=np.int64)
+
+    batch = max(1, max_batch_cells // n)
+    samples = {"f1_score": [], "execution_accuracy": [], "ena_score": []}
+    for start in range(0, resamples, batch):
+        indices = rng.integers(0, n, size=(min(batch, resamples - start), n))
+        counts = (is_tp[indices].sum(axis=1), is_fp[indices].sum(axis=1), is_fn[indices].sum(axis=1))
+        f1_score, execution_accuracy, ena = aggregate_metrics(counts, total_tokens[indices].sum(axis=1), retries[indices].sum(axis=1), n)
+        samples["f1_score"].append(f1_score)
+        samples["execution_accuracy"].append(execution_accuracy)
+        samples["ena_score"].append(ena)
+
+    tail = (1 - confidence) / 2 * 100
+    intervals = {"resamples": resamples, "confidence": confidence}
+    for metric, values in samples.items():
+        values = np.concatenate(values)
+        low, high = np.percentile(values, [tail, 100 - tail])
+        intervals[metric] = {"low": float(low), "high": float(high), "std": float(values.std())}
+    return intervals
+
+def classification_codes(data):
+    """Codes of the classifications already stored on verified records (unverified records count as Invalid)."""
+    return np.array(
+        [CLASSIFICATION_CODES.get(entry.get("sparql_comparison_result", {}).get("is_correct"), INVALID) for entry in data],
+        dtype=np.int8,
+    )
+
+def evaluate_run(data, interner=None, resamples=10000, confidence=0.95, seed=0, stored_classifications=False):
+    """
+    Re-scores one run from its raw answers and returns point estimates, partial scores and confidence intervals.
+    With stored_classifications=True, the TP/FP/FN/Invalid classifications stored on the records are used
+    for the point estimates and intervals, and only the partial scores are computed from the answers.
+    """
+    interner = interner if interner is not None else AnswerInterner()
+    run = encode_records(data, interner)
+    codes, partial_precision, partial_recall = score_run(run, interner)
+    if stored_classifications:
+        codes = classification_codes(data)
+
+    n = run.num_questions
+    counts = ((codes == TP).sum(), (codes == FP).sum(), (codes == FN).sum())
+    f1_score, execution_accuracy, ena = aggregate_metrics(counts, run.total_tokens.sum(), run.retries.sum(), max(n, 1))
+    valid = ~np.isnan(partial_recall)
+
+    return {
+        "num_entries": n,
+        "tp": int(counts[0]),
+        "fp": int(counts[1]),
+        "fn": int(counts[2]),
+        "invalid": int((codes == INVALID).sum()),
+        "f1_score": float(f1_score),
+        "execution_accuracy": float(execution_accuracy),
+        "ena_score": float(ena),
+        # Macro averages over valid questions, an empty prediction has precision 0
+        "partial_precision": float(np.nan_to_num(partial_precision[valid]).mean()) if valid.any() else 0.0,
+        "partial_recall": float(partial_recall[valid].mean()) if valid.any() else 0.0,
+        "confidence_intervals": bootstrap_confidence_intervals(codes, run.total_tokens, run.retries, resamples, confidence, seed),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score verified experiment JSON files with bootstrap confidence intervals.")
+    parser.add_argument("--inputs", nargs="+", required=True, help="Verified experiment JSON files.")
+    parser.add_argument("--resamples", type=int, default=10000, help="Number of bootstrap resamples.")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the bootstrap.")
+    parser.add_argument("--output", type=str, help="Optional CSV file with one row per input.")
+    parser.add_argument("--result_store_dir", type=str, default="./cache/results", help="Result store referenced by the experiment JSONs.")
+    args = parser.parse_args()
+    import result_sidecar
+    sidecar = result_sidecar.open_sidecar(args.result_store_dir)
+
+    # One interner for all runs, so answer strings repeated across runs are hashed only once
+    interner = AnswerInterner()
+    rows = []
+    start = time.perf_counter()
+    for path in args.inputs:
+        with open(path, "r", encoding="utf-8") as f:
+            data = result_sidecar.resolve_records(json.load(f), sidecar)
+        result = evaluate_run(data, interner, args.resamples, args.confidence, args.seed)
+        intervals = result["confidence_intervals"] or {}
+        row = {"file": path, **{k: v for k, v in result.items() if k != "confidence_intervals"}}
+        for metric in ("f1_score", "execution_accuracy", "ena_score"):
+            row[f"{metric}_low"] = intervals.get(metric, {}).get("low")
+            row[f"{metric}_high"] = intervals.get(metric, {}).get("high")
+        rows.append(row)
+        print(
+            f"{path}: F1 {result['f1_score']:.2f} [{row['f1_score_low'] or 0:.2f}, {row['f1_score_high'] or 0:.2f}]  "
+            f"EA {result['execution_accuracy']:.2f} [{row['execution_accuracy_low'] or 0:.2f}, {row['execution_accuracy_high'] or 0:.2f}]  "
+            f"ENA {result['ena_score']:.2f} [{row['ena_score_low'] or 0:.2f}, {row['ena_score_high'] or 0:.2f}]  "
+            f"partial P/R {result['partial_precision']:.2f}/{result['partial_recall']:.2f}"
+        )
+
+    print(f"⏱️ Scored {len(rows)} run(s) in {time.perf_counter() - start:.2f}s ({len(interner)} distinct answers)")
+    if args.output and rows:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"📝 Scores written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import argparse
+import atexit
+import glob
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+import tracing
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+# Strings longer than this are written as their length, a hash and a prefix
+MAX_FIELD_CHARS = 2000
+HEAD_CHARS = 300
+# Lists and dictionaries longer than this are written as their length and the first items
+MAX_ITEMS = 20
+MAX_DEPTH = 4
+# Records waiting for the writer thread; further records are dropped (and counted) instead of blocking the caller
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+
+_level = None
+_sample_rate = 1.0
+_path = None
+_queue = None
+_writer = None
+_dropped = 0
+_lock = threading.Lock()
+_STOP = object()
+
+def configure(log_dir: str, process_name: str, level: str = "info", sample_rate: float = 1.0):
+    """
+    Starts writing records of `level` and above to <log_dir>/<process_name>.log.jsonl from a background thread.
+    sample_rate is the fraction of questions whose per-attempt detail (detail()) is written.
+    """
+    global _level, _sample_rate, _path, _queue, _writer
+    if level not in LEVELS:
+        raise ValueError(f"Unknown log level '{level}', expected one of {', '.join(LEVELS)}.")
+    os.makedirs(log_dir, exist_ok=True)
+    with _lock:
+        if _writer is not None:
+            return
+        _path = os.path.join(log_dir, f"{process_name}.log.jsonl")
+        _sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        _queue = queue.Queue(maxsize=QUEUE_SIZE)
+        _writer = threading.Thread(target=_write_loop, name="event-log-writer", daemon=True)
+        _writer.start()
+        _level = LEVELS[level]
+    atexit.register(close)
+
+def enabled(level: str = "info") -> bool:
+    """True if records of this level are written; lets callers skip building expensive fields."""
+    return _level is not None and LEVELS[level] >= _level
+
+def sampled(key) -> bool:
+    """
+    True for the questions whose per-attempt detail is logged. The choice is a hash of the key (question ID),
+    so every stage process and every retry of a question makes the same choice.
+    """
+    if _sample_rate >= 1.0:
+        return True
+    return zlib.crc32(str(key).encode("utf-8")) / 0xFFFFFFFF < _sample_rate
+
+def log(level: str, event: str, **fields):
+    """
+    Queues a record for the writer thread, tagged with the tracing context (question ID, attempt, language).
+    Field values are serialized, truncated and hashed by the writer thread, so they must not be mutated afterwards.
+    """
+    global _dropped
+    if not enabled(level):
+        return
+    record = {"ts": time.time(), "level": level, "event": event, "pid": os.getpid(), **tracing.current_context(), **fields}
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        with _lock:
+            _dropped += 1
+
+def debug(event: str, **fields):
+    log("debug", event, **fields)
+
+def info(event: str, **fields):
+    log("info", event, **fields)
+
+def warning(event: str, **fields):
+    log("warning", event, **fields)
+
+def error(event: str, **fields):
+    log("error", event, **fields)
+
+def detail(event: str, key, **fields):
+    """Debug record with large payloads (prompts, queries, results), only for the sampled questions."""
+    if enabled("debug") and sampled(key):
+        log("debug", event, **fields)
+
+def compact(value, depth: int = 0):
+    """
+    JSON-serializable copy of a field value with long strings replaced by their length, hash and prefix,
+    and long lists and dictionaries cut to their first MAX_ITEMS entries.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) <= MAX_FIELD_CHARS:
+            return value
+        digest = hashlib.blake2b(value.encode("utf-8", "replace"), digest_size=8).hexdigest()
+        return {"chars": len(value), "blake2b": digest, "head": value[:HEAD_CHARS]}
+    if depth >= MAX_DEPTH:
+        return compact(repr(value), depth)
+    if isinstance(value, dict):
+        items = list(value.items())
+        result = {str(key): compact(item, depth + 1) for key, item in items[:MAX_ITEMS]}
+        if len(items) > MAX_ITEMS:
+            result["…"] = f"{len(items) - MAX_ITEMS} more keys"
+        return result
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(value)
+        if len(items) <= MAX_ITEMS:
+            return [compact(item, depth + 1) for item in items]
+        return {"items": len(items), "head": [compact(item, depth + 1) for item in items[:MAX_ITEMS]]}
+    return compact(str(value), depth)
+
+def _serialize(record: dict) -> str:
+    return json.dumps({key: compact(value) for key, value in record.items()}, ensure_ascii=False, default=str)
+
+def _write_loop():
+    """Drains the queue in batches, one write and flush per batch."""
+    with open(_path, "a", encoding="utf-8") as f:
+        while True:
+            batch = [_queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is _STOP for record in batch)
+            lines = []
+            for record in batch:
+                if record is _STOP:
+                    continue
+                try:
+                    lines.append(_serialize(record))
+                except Exception as e:
+                    lines.append(json.dumps({"ts": record.get("ts"), "level": "error", "event": "log.unserializable", "error": str(e)}))
+            if lines:
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+            if stop:
+                return
+
+def close():
+    """Writes the queued records and stops the writer thread (registered with atexit by configure)."""
+    global _level, _writer
+    with _lock:
+        writer, dropped = _writer, _dropped
+        if writer is None:
+            return
+    if dropped:
+        _queue.put({"ts": time.time(), "level": "warning", "event": "log.dropped", "pid": os.getpid(), "records": dropped})
+    _queue.put(_STOP)
+    writer.join(timeout=30)
+    with _lock:
+        _level = None
+        _writer = None
+
+def read_records(log_dir: str, level: str = "debug", event: str = None, question_id: str = None):
+    """Records of all processes of a run, in time order, filtered by minimum level, event name prefix and question ID."""
+    records = []
+    for path in sorted(glob.glob(os.path.join(log_dir, "*.log.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if LEVELS.get(record.get("level"), 0) < LEVELS[level]:
+                    continue
+                if event and not str(record.get("event", "")).startswith(event):
+                    continue
+                if question_id is not None and str(record.get("question_id")) != str(question_id):
+                    continue
+                records.append(record)
+    records.sort(key=lambda record: record.get("ts", 0))
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the structured log records of a run, merged over its stage processes.")
+    parser.add_argument("--event_log_dir", type=str, required=True, help="Directory with the *.log.jsonl files of a run.")
+    parser.add_argument("--level", type=str, choices=list(LEVELS), default="info", help="Minimum level shown.")
+    parser.add_argument("--event", type=str, help="Only records whose event name starts with this, e.g. \"generate.\".")
+    parser.add_argument("--question_id", type=str, help="Only records of this question ID.")
+    args = parser.parse_args()
+
+    for record in read_records(args.event_log_dir, args.level, args.event, args.question_id):
+        print(json.dumps(record, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
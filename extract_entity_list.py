@@ -2,51 +2,155 @@ import json
 import argparse
 import traceback
 import sys
-from openai import OpenAI
-import requests
+import tracing
+import operational_metrics
 from utility import Utils
+from journal import StageJournal
+import dataset_reader
+import multilingual
+import event_log
+
+_prompt_templates = {}
+
+def load_prompt_template(system_prompt_path):
+    """Reads a prompt template once per process."""
+    if system_prompt_path not in _prompt_templates:
+        with open(system_prompt_path, "r", encoding="utf-8") as f:
+            _prompt_templates[system_prompt_path] = f.read()
+    return _prompt_templates[system_prompt_path]
+
+def token_usage(response, parts: int = 1) -> dict:
+    """Prompt, completion and total tokens of an LLM response, divided evenly among the questions sharing it."""
+    usage = getattr(response, "usage", None)
+    return {
+        name: round((getattr(usage, name, 0) or 0) / parts, 2)
+        for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+    }
 
 def extract_entities_with_llm(nlq, api_key, model, llm_provider, system_prompt_path, max_tokens, temperature, dataset_type):
     """
     Uses an LLM to extract the most relevant entities from a natural language query.
     Replaces {nlq} in the prompt file with the current question.
-    Returns a list of entity names.
+    Returns a list of entity names and the token usage of the call.
     """
     # Load prompt template
-    with open(system_prompt_path, "r", encoding="utf-8") as f:
-        prompt_template = f.read()
+    prompt_template = load_prompt_template(system_prompt_path)
 
     # Inject question into template
     user_prompt = prompt_template.replace("{nlq}", nlq).replace("{ont}", dataset_type)
     
     # Select provider
-    client = OpenAI(api_key=api_key, base_url=Utils.resolve_llm_provider(llm_provider))
+    client = Utils.get_llm_client(api_key, llm_provider)
+
+    messages = [
+        {"role": "system", "content": "You are an expert in extracting named entities from questions."},
+        {"role": "user", "content": user_prompt}
+    ]
 
     # Call LLM
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are an expert in extracting named entities from questions."},
-            {"role": "user", "content": user_prompt}
-        ],
-        max_tokens=max_tokens,
-        temperature=temperature
-    )
+    with Utils.llm_slot(), tracing.span("llm.call", purpose="entity_extraction", model=model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    Utils.count_llm_call(messages, response)
 
     # Parse and return entity names
     entity_names = response.choices[0].message.content.strip().split(",")
     
-    return [name.strip() for name in entity_names if name.strip()]
+    return [name.strip() for name in entity_names if name.strip()], token_usage(response)
+
+def parse_batch_response(content, question_ids):
+    """
+    Splits the JSON answer of a batched extraction into question ID → entity names.
+    Questions that are missing or whose value is not a list of names (or a comma-separated string) are left out.
+    """
+    text = (content or "").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return {}
+    try:
+        answer = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(answer, dict):
+        return {}
+
+    entities = {}
+    for question_id in question_ids:
+        names = answer.get(str(question_id))
+        if isinstance(names, str):
+            names = names.split(",")
+        if isinstance(names, list) and all(isinstance(name, str) for name in names):
+            entities[question_id] = [name.strip() for name in names if name.strip()]
+    return entities
+
+def extract_entities_batch_with_llm(questions, api_key, model, llm_provider, batch_prompt_path, max_tokens, temperature, dataset_type):
+    """
+    Extracts the entities of several questions with one LLM call.
+    `questions` is a list of (question ID, question text); {questions} in the prompt file becomes a JSON object of them.
+    Returns the question ID → entity names of the questions that could be parsed, and the token usage per question.
+    """
+    prompt_template = load_prompt_template(batch_prompt_path)
+    questions_json = json.dumps({str(question_id): text for question_id, text in questions}, ensure_ascii=False, indent=0)
+    user_prompt = prompt_template.replace("{questions}", questions_json).replace("{ont}", dataset_type)
+
+    client = Utils.get_llm_client(api_key, llm_provider)
+    messages = [
+        {"role": "system", "content": "You are an expert in extracting named entities from questions."},
+        {"role": "user", "content": user_prompt}
+    ]
+
+    # max_tokens is the budget of one question's answer
+    with Utils.llm_slot(), tracing.span("llm.call", purpose="entity_extraction", model=model, batch_size=len(questions)):
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens * len(questions),
+            temperature=temperature
+        )
+    Utils.count_llm_call(messages, response)
 
+    entities = parse_batch_response(response.choices[0].message.content, [question_id for question_id, _ in questions])
+    return entities, token_usage(response, len(questions))
 
-def get_wikidata_entities(entity_names):
+def lookup_label(label_index, entity_name, offline=False):
+    """
+    Resolves a name with the offline label index (see label_index.py), recording the lookup as a cache hit or miss.
+    Only the exact spelling is accepted unless offline is set, i.e. when the name is not looked up at the endpoint
+    otherwise: a case-folded or similar label must not pre-empt the endpoint's exact rdfs:label lookup.
+    """
+    if label_index is None:
+        return None
+    if offline:
+        match = label_index.resolve(entity_name)
+    else:
+        matches = label_index.exact(entity_name, limit=1)
+        match = matches[0] if matches else None
+    operational_metrics.cache("label_index", match is not None)
+    if match and match["match"] == "fuzzy":
+        operational_metrics.count("label_index_fuzzy_matches")
+        print(f"🏷️ Fuzzy label index match for '{entity_name}': '{match['label']}' → {match['entity']} (score {match['score']})", file=sys.stderr)
+    return match
+
+def get_wikidata_entities(entity_names, label_index=None, endpoint_fallback=True):
     """
     Queries Wikidata to get the entity IDs (Q-numbers) for multiple entity names.
+    Names found in the label index are resolved offline; the others are queried unless endpoint_fallback is False.
     Returns a dictionary mapping names to Q-IDs.
     """
     wikidata_entities = {}
 
     for entity_name in entity_names:
+        match = lookup_label(label_index, entity_name, offline=not endpoint_fallback)
+        if match:
+            wikidata_entities[entity_name] = match["entity"].split("/")[-1]  # Extract Q-ID
+            continue
+        if not endpoint_fallback:
+            continue
+
         sparql_query = f"""
         SELECT ?entity WHERE {{
             ?entity rdfs:label "{entity_name}"@en .
@@ -54,9 +158,9 @@ def get_wikidata_entities(entity_names):
         LIMIT 1
         """
 
-        url = "https://query.wikidata.org/sparql"
+        pool = Utils.public_endpoint("wikidata", "https://query.wikidata.org/sparql")
         headers = {"User-Agent": "EntityExtractorBot/1.0"}
-        response = requests.get(url, params={"query": sparql_query, "format": "json"}, headers=headers)
+        response = pool.get({"query": sparql_query, "format": "json"}, headers=headers, purpose="entity_resolution")
 
         if response.status_code == 200:
             results = response.json().get("results", {}).get("bindings", [])
@@ -65,17 +169,26 @@ def get_wikidata_entities(entity_names):
 
     return wikidata_entities
 
-def get_dbpedia_entities(entity_names):
+def get_dbpedia_entities(entity_names, label_index=None, endpoint_fallback=True):
     """
     Queries DBpedia to get the entity IDs (DBpedia URIs) for multiple entity names.
+    Names found in the label index are resolved offline; the others are queried unless endpoint_fallback is False.
     Returns a dictionary mapping names to DBpedia URIs.
     Logs errors and warnings to stderr.
     """
     dbpedia_entities = {}
-    url = "http://dbpedia.org/sparql"
+    pool = Utils.public_endpoint("dbpedia", "http://dbpedia.org/sparql")
     headers = {"User-Agent": "EntityExtractorBot/1.0"}
 
     for entity_name in entity_names:
+        match = lookup_label(label_index, entity_name, offline=not endpoint_fallback)
+        if match:
+            dbpedia_entities[entity_name] = match["entity"]
+            continue
+        if not endpoint_fallback:
+            print(f"🔍 No label index match found for '{entity_name}'", file=sys.stderr)
+            continue
+
         sparql_query = f"""
         SELECT ?entity WHERE {{
             ?entity rdfs:label "{entity_name}"@en .
@@ -84,11 +197,11 @@ def get_dbpedia_entities(entity_names):
         """
 
         try:
-            response = requests.get(
-                url,
-                params={"query": sparql_query, "format": "json"},
+            response = pool.get(
+                {"query": sparql_query, "format": "json"},
                 headers=headers,
-                timeout=10
+                timeout=10,
+                purpose="entity_resolution",
             )
 
             if response.status_code == 200 and response.text.strip():
@@ -98,126 +211,194 @@ def get_dbpedia_entities(entity_names):
                 else:
                     print(f"🔍 No DBpedia match found for '{entity_name}'", file=sys.stderr)
             else:
-                print(f"⚠️ Bad response for '{entity_name}'", file=sys.stderr)
-                print(f"  → Status: {response.status_code} {response.reason}", file=sys.stderr)
-                print(f"  → URL: {response.url}", file=sys.stderr)
-                print(f"  → Headers: {dict(response.headers)}", file=sys.stderr)
-                if response.text.strip():
-                    print(f"  → Body (first 500 chars):\n{response.text.strip()[:500]}", file=sys.stderr)
-                else:
-                    print(f"  → Body is empty", file=sys.stderr)
+                print(f"⚠️ Bad response for '{entity_name}': {response.status_code} {response.reason}", file=sys.stderr)
+                event_log.warning(
+                    "extract.bad_response", entity_name=entity_name, status=response.status_code, reason=response.reason,
+                    url=response.url, headers=dict(response.headers), body=response.text.strip(),
+                )
 
         except Exception as e:
-            print("❌ Exception during DBpedia entity lookup:", file=sys.stderr)
-            print(f"Entity name: '{entity_name}'", file=sys.stderr)
-            print(f"SPARQL query:\n{sparql_query.strip()}", file=sys.stderr)
-            print(f"Exception message: {e}", file=sys.stderr)
-            print("Full traceback:", file=sys.stderr)
-            traceback.print_exc()
+            print(f"❌ Exception during DBpedia entity lookup of '{entity_name}': {e}", file=sys.stderr)
+            event_log.error(
+                "extract.lookup_failed", entity_name=entity_name, query=sparql_query.strip(),
+                error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc(),
+            )
 
     return dbpedia_entities
 
 
 
-def transform_json(benchmark_dataset, output_file, api_key, num_questions, model, llm_provider, is_local_graph, local_graph_location, sparql_endpoint_url, system_prompt_path, max_tokens, temperature, dataset_type, baseline_run):
+def load_benchmark_questions(benchmark_dataset, num_questions, shard_index=0, shard_count=1, question_ids=None, sample_size=None, sample_seed=0):
     """
-    Transforms the input JSON structure into a simplified list of question-answer pairs,
-    including extracted entity IDs from SPARQL, LLM, and Wikidata SPARQL endpoint,
-    while preserving the original question ID.
+    Streams and validates the question entries of a QALD-style benchmark file (see dataset_reader.py).
+    Returns the first `num_questions` entries (all if num_questions is None) of the questions selected by
+    `question_ids` ranges and an optional random sample, restricted to the given shard when the run is split
+    across several nodes. Reading stops once enough questions are selected, so memory stays flat for large files.
     """
-    try:
-        with open(benchmark_dataset, 'r') as f:
-            data = json.load(f)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON file: {benchmark_dataset}. Error: {e}")
-
-    if isinstance(data, dict) and "questions" in data:
-        questions_list = data["questions"]
-    elif isinstance(data, list):
-        questions_list = data
-    else:
-        raise ValueError(
-            f"Invalid JSON structure in file {benchmark_dataset}: expected a list or a dictionary with a 'questions' key."
-        )
+    with tracing.span("file.read", path=benchmark_dataset):
+        return dataset_reader.read_questions(benchmark_dataset, num_questions, question_ids, sample_size, sample_seed, shard_index, shard_count)
 
-    # Validate each question entry
-    for entry in questions_list:
-        if not isinstance(entry, dict):
-            raise ValueError("Invalid question entry: each question must be a dictionary.")
-        if "id" not in entry or "question" not in entry or "query" not in entry:
-            raise ValueError("Invalid question entry: missing required keys ('id', 'question', 'query').")
-        if not isinstance(entry["question"], list) or not entry["question"]:
-            raise ValueError("Invalid question entry: 'question' must be a non-empty list.")
-        if not isinstance(entry["query"], dict) or "sparql" not in entry["query"]:
-            raise ValueError("Invalid question entry: 'query' must be a dictionary containing a 'sparql' key.")
+def question_text_of(entry):
+    """The English question of a benchmark entry (the first one if there is no English)."""
+    return next((q["string"] for q in entry["question"] if q["language"] == "en"), entry["question"][0]["string"])
 
-    if num_questions is None or num_questions > len(questions_list):
-        num_questions = len(questions_list)
+def transform_entry(entry, api_key, model, llm_provider, is_local_graph, local_graph_location, sparql_endpoint_url, system_prompt_path, max_tokens, temperature, dataset_type, baseline_run, gold_answers=None, label_index=None, label_index_fallback=True, extracted=None, languages=None):
+    """
+    Transforms a single benchmark entry into the experiment record format,
+    executing the gold query and extracting/resolving entities for it.
+    If the question is in gold_answers (see gold_answers.py), its embedded answers are used instead of executing the gold query.
+    Entity names are looked up in the label index first, if one is given.
+    `extracted` optionally holds the (entity names, token usage) of a batched extraction, which replaces the LLM call.
+    With `languages` (see multilingual.parse_languages), the record keeps the question in each of them; the gold answers
+    and entities are computed once from the English question and shared by all languages.
+    """
+    original_id = entry.get("id")
 
-    transformed_data = []
+    # Get the English question (fallback to first available if no English)
+    question_text = question_text_of(entry)
+    question_texts = multilingual.question_texts(entry, languages) if languages else None
 
-    for entry in questions_list[:num_questions]:  # Process only `num_questions` questions
-        original_id = entry.get("id")
+    # Get the SPARQL query
+    sparql_query = entry["query"]["sparql"]
 
-        # Get the English question (fallback to first available if no English)
-        question_text = next(
-            (q["string"] for q in entry["question"] if q["language"] == "en"),
-            entry["question"][0]["string"]  # Fallback
-        )
+    # Default values
+    llm_extracted_entities = "No entity extraction"
+    endpoint_entities_resolved = "No entity resolving"
+    extraction_tokens = None
 
-        # Get the SPARQL query
-        sparql_query = entry["query"]["sparql"]
+    gold_values = gold_answers.get(str(original_id)) if gold_answers is not None else None
+    if gold_answers is not None:
+        operational_metrics.cache("gold_answers", gold_values is not None)
 
-        # Default values
-        llm_extracted_entities = "No entity extraction"
-        endpoint_entities_resolved = "No entity resolving"
+    # Determine response based on graph type and run mode
+    if gold_values is not None:
+        sparql_response = gold_values
+    elif is_local_graph:
+        sparql_response = Utils.query_local_graph(sparql_query, local_graph_location)
+    else:
+        sparql_response = Utils.query_sparql_endpoint(sparql_query, sparql_endpoint_url)
 
-        # Determine response based on graph type and run mode
-        if is_local_graph:
-            sparql_response = Utils.query_local_graph(sparql_query, local_graph_location)
-            if baseline_run:
-                llm_extracted_entities = "Baseline run, no entity extraction needed"
-                endpoint_entities_resolved = "Baseline run, no entity resolving needed"
-            else:
-                llm_extracted_entities = "Local Graph, no entity extraction needed"
-                endpoint_entities_resolved = "Local Graph, no entity resolving needed"
+    if is_local_graph:
+        if baseline_run:
+            llm_extracted_entities = "Baseline run, no entity extraction needed"
+            endpoint_entities_resolved = "Baseline run, no entity resolving needed"
         else:
-            sparql_response = Utils.query_sparql_endpoint(sparql_query, sparql_endpoint_url)
-            if not baseline_run:
-                llm_extracted_entities = extract_entities_with_llm(
+            llm_extracted_entities = "Local Graph, no entity extraction needed"
+            endpoint_entities_resolved = "Local Graph, no entity resolving needed"
+    else:
+        if not baseline_run:
+            if extracted is not None:
+                llm_extracted_entities, extraction_tokens = extracted
+            else:
+                llm_extracted_entities, extraction_tokens = extract_entities_with_llm(
                     question_text, api_key, model, llm_provider, system_prompt_path,
                     max_tokens, temperature, dataset_type
                 )
 
-                if dataset_type == "wikidata":
-                    endpoint_entities_resolved = get_wikidata_entities(llm_extracted_entities)
-                elif dataset_type == "dbpedia":
-                    endpoint_entities_resolved = get_dbpedia_entities(llm_extracted_entities)
+            if dataset_type == "wikidata":
+                endpoint_entities_resolved = get_wikidata_entities(llm_extracted_entities, label_index, label_index_fallback)
+            elif dataset_type == "dbpedia":
+                endpoint_entities_resolved = get_dbpedia_entities(llm_extracted_entities, label_index, label_index_fallback)
+        else:
+            llm_extracted_entities = "Baseline run, no entity extraction needed"
+            endpoint_entities_resolved = "Baseline run, no entity resolving needed"
+
+    # Logging
+    print(f"✅ Processed ID {original_id}")
+    event_log.info(
+        "extract.record", question_id=original_id,
+        entities=len(llm_extracted_entities) if isinstance(llm_extracted_entities, list) else None,
+        resolved=len(endpoint_entities_resolved) if isinstance(endpoint_entities_resolved, dict) else None,
+        gold_results=len(sparql_response) if isinstance(sparql_response, list) else None,
+    )
+    event_log.detail(
+        "extract.record_detail", original_id, question_id=original_id, baseline_question_text=question_text, baseline_sparql_query=sparql_query,
+        llm_extracted_entity_names=llm_extracted_entities, endpoint_entities_resolved=endpoint_entities_resolved,
+    )
+
+    record = {
+        "baseline_id": original_id,
+        "baseline_question_text": next(iter(question_texts.values())) if question_texts else question_text,
+        "baseline_sparql_query": sparql_query,
+        "baseline_sparql_query_response": sparql_response,
+        "llm_extracted_entity_names": llm_extracted_entities,
+        "endpoint_entities_resolved": endpoint_entities_resolved
+    }
+    if extraction_tokens is not None:
+        record["entity_extraction_tokens"] = extraction_tokens
+    if question_texts:
+        record["baseline_question_texts"] = question_texts
+    return record
+
+def transform_questions(questions_list, api_key, model, llm_provider, is_local_graph, local_graph_location, sparql_endpoint_url, system_prompt_path, max_tokens, temperature, dataset_type, baseline_run, journal=None, gold_answers=None, label_index=None, label_index_fallback=True, batch_size=1, batch_prompt_path=None, languages=None):
+    """
+    Transforms a list of benchmark entries into experiment records, kept in memory.
+    If a journal is given, completed records are appended to it and already journaled questions are skipped.
+    With batch_size > 1, the entities of up to batch_size pending questions are extracted with one LLM call;
+    questions missing from the batch answer fall back to a single-question call. The batch call's time,
+    counters and tokens are divided evenly among its questions.
+    """
+    batching = batch_size > 1 and not is_local_graph and not baseline_run
+    transformed_data = []
+    for start in range(0, len(questions_list), batch_size if batching else 1):
+        chunk = questions_list[start:start + batch_size] if batching else questions_list[start:start + 1]
+
+        pending = []
+        for entry in chunk:
+            original_id = entry.get("id")
+            if journal is not None and journal.is_completed(original_id):
+                print(f"♻️ Skipping ID {original_id}, already completed")
+                transformed_data.append(journal.get(original_id))
             else:
-                llm_extracted_entities = "Baseline run, no entity extraction needed"
-                endpoint_entities_resolved = "Baseline run, no entity resolving needed"
-
-        # Append the transformed entry
-        transformed_data.append({
-            "baseline_id": original_id,
-            "baseline_question_text": question_text,
-            "baseline_sparql_query": sparql_query,
-            "baseline_sparql_query_response": sparql_response,
-            "llm_extracted_entity_names": llm_extracted_entities,
-            "endpoint_entities_resolved": endpoint_entities_resolved
-        })
-
-        # Logging
-        print(f"✅ Processed ID {original_id}")
-        print(f"baseline_question_text {question_text}")
-        print(f"baseline_sparql_query {sparql_query}")
-        print(f"llm_extracted_entity_names {llm_extracted_entities}")
-        print(f"endpoint_entities_resolved {endpoint_entities_resolved}")
-        print("-----------------------------------------------------")
+                pending.append(entry)
+
+        batch_entities, batch_tokens, batch_shares = {}, None, [None] * len(pending)
+        if batching and len(pending) > 1:
+            with operational_metrics.measure() as batch_usage:
+                batch_entities, batch_tokens = extract_entities_batch_with_llm(
+                    [(entry.get("id"), question_text_of(entry)) for entry in pending], api_key, model, llm_provider,
+                    batch_prompt_path, max_tokens, temperature, dataset_type
+                )
+            batch_shares = batch_usage.split(len(pending))
+            print(f"📦 Extracted entities of {len(batch_entities)}/{len(pending)} questions in one call")
+
+        for entry, share in zip(pending, batch_shares):
+            original_id = entry.get("id")
+            extracted = (batch_entities[original_id], batch_tokens) if original_id in batch_entities else None
+            with tracing.context(question_id=original_id), operational_metrics.measure() as usage:
+                record = transform_entry(entry, api_key, model, llm_provider, is_local_graph, local_graph_location, sparql_endpoint_url, system_prompt_path, max_tokens, temperature, dataset_type, baseline_run, gold_answers, label_index, label_index_fallback, extracted, languages)
+            usage.add_to(record)
+            if share is not None:
+                share.add_to(record)
+            if journal is not None:
+                journal.append(original_id, record)
+            transformed_data.append(record)
+
+    return transformed_data
+
+def transform_json(benchmark_dataset, output_file, api_key, num_questions, model, llm_provider, is_local_graph, local_graph_location, sparql_endpoint_url, system_prompt_path, max_tokens, temperature, dataset_type, baseline_run, resume=False, shard_index=0, shard_count=1, gold_cache_dir=None, label_index_path=None, label_index_fallback=True, batch_size=1, batch_prompt_path=None, question_ids=None, sample_size=None, sample_seed=0, languages=None):
+    """
+    Transforms the input JSON structure into a simplified list of question-answer pairs,
+    including extracted entity IDs from SPARQL, LLM, and Wikidata SPARQL endpoint,
+    while preserving the original question ID.
+    """
+    questions_list = load_benchmark_questions(benchmark_dataset, num_questions, shard_index, shard_count, question_ids, sample_size, sample_seed)
 
+    gold_answers = None
+    if gold_cache_dir:
+        import gold_answers as gold
+        gold_answers = gold.load_gold_answers(benchmark_dataset, gold_cache_dir)
+
+    label_index = None
+    if label_index_path:
+        import label_index as labels
+        label_index = labels.open_index(label_index_path)
+
+    journal = StageJournal(StageJournal.path_for(output_file, "extract_entity_list"), resume)
+    transformed_data = transform_questions(questions_list, api_key, model, llm_provider, is_local_graph, local_graph_location, sparql_endpoint_url, system_prompt_path, max_tokens, temperature, dataset_type, baseline_run, journal, gold_answers, label_index, label_index_fallback, batch_size, batch_prompt_path, multilingual.parse_languages(languages))
 
     # Save to output JSON file
-    with open(output_file, "w", encoding="utf-8") as file:
+    with tracing.span("file.write", path=output_file), open(output_file, "w", encoding="utf-8") as file:
         json.dump(transformed_data, file, indent=4, ensure_ascii=False)
 
     print(f"✅ Transformed JSON saved to: {output_file}")
@@ -238,9 +419,23 @@ def main():
     parser.add_argument("--local_graph_location", type=str, help="Path to the local RDF graph file (e.g., .ttl, .rdf).")
     parser.add_argument("--sparql_endpoint_url", type=str, help="SPARQL endpoint URL (ignored if --is_local_graph is used).")
     parser.add_argument("--baseline_run", type=Utils.str_to_bool, default=False, help="Set True or False.")
-
+    parser.add_argument("--resume", type=Utils.str_to_bool, default=False, help="Skip questions already completed in the stage journal.")
+    parser.add_argument("--shard_index", type=int, default=0, help="Index of the shard processed by this node (0-based).")
+    parser.add_argument("--shard_count", type=int, default=1, help="Total number of shards the questions are split into.")
+    parser.add_argument("--gold_answers", type=Utils.str_to_bool, default=False, help="Use the benchmark's embedded answers instead of executing the gold queries.")
+    parser.add_argument("--gold_cache_dir", type=str, default="./cache/gold", help="Directory of the gold answer indexes.")
+    parser.add_argument("--label_index", type=str, help="Label index (see label_index.py) used to resolve entity names before querying the endpoint.")
+    parser.add_argument("--label_index_fallback", type=Utils.str_to_bool, default=True, help="Query the endpoint for names missing from the label index (False resolves offline only).")
+    parser.add_argument("--question_ids", type=str, help="Only process these question IDs, e.g. \"1-50,77,100-\".")
+    parser.add_argument("--sample_size", type=int, help="Process a uniform random sample of this many questions.")
+    parser.add_argument("--sample_seed", type=int, default=0, help="Seed of the random sample.")
+    parser.add_argument("--languages", type=str, help="Keep the questions in these languages (e.g. \"en,de,ru\" or \"all\") for a multilingual run; entities are resolved once per question.")
+    parser.add_argument("--batch_size", type=int, default=1, help="Questions whose entities are extracted with one LLM call (1 = one call per question).")
+    parser.add_argument("--batch_prompt_path", type=str, default="./prompts/system_prompt_entity_extraction_batch.txt", help="Prompt template of batched extraction, with {questions} and {ont}.")
+    Utils.add_runtime_arguments(parser)
 
     args = parser.parse_args()
+    Utils.configure_runtime(args, "extract_entity_list")
     print(f"⚠️ baseline_run: {args.baseline_run}")
     print(f"✅ is_local_graph: {args.is_local_graph}")
 
@@ -252,9 +447,11 @@ def main():
         num_questions = args.num_questions
 
     print(f"📌 Using num_questions: {'ALL' if num_questions is None else num_questions}")
+    if args.shard_count > 1:
+        print(f"📌 Processing shard {args.shard_index + 1}/{args.shard_count}")
 
     # Use the validated variable here
-    transform_json(args.benchmark_dataset, args.output_file, args.api_key, num_questions, args.model, args.llm_provider, args.is_local_graph, args.local_graph_location, args.sparql_endpoint_url, args.system_prompt_path, args.max_tokens, args.temperature, args.dataset_type, args.baseline_run)
+    transform_json(args.benchmark_dataset, args.output_file, args.api_key, num_questions, args.model, args.llm_provider, args.is_local_graph, args.local_graph_location, args.sparql_endpoint_url, args.system_prompt_path, args.max_tokens, args.temperature, args.dataset_type, args.baseline_run, args.resume, args.shard_index, args.shard_count, args.gold_cache_dir if args.gold_answers else None, None if args.label_index in (None, "", "None") else args.label_index, args.label_index_fallback, args.batch_size, args.batch_prompt_path, args.question_ids, args.sample_size, args.sample_seed, args.languages)
 
 if __name__ == "__main__":
     main()
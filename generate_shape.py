@@ -1,74 +1,118 @@
 import argparse
+import hashlib
 import json
 import os
 import re   
 import traceback
 import sys
-from rdflib import Graph
-from shexer.consts import SHACL_TURTLE
-from shexer.shaper import Shaper
 from utility import Utils
-import time
-
-def generate_shape_from_local_graph(local_graph_location, shape_output_path, shape_type, existing_shape_path):
+from journal import StageJournal
+import tracing
+import operational_metrics
+import endpoint_pool
+import cassette
+
+LOCAL_GRAPH_SHAPE_OPTIONS = {
+    "all_classes_mode": True,
+    "disable_comments": True,
+}
+
+def local_graph_shape_cache_key(rdf_files, shape_options):
     """
-    Loads all RDF files from a folder, generates ShEx shapes using Shexer,
-    and annotates shape lines with labels using rdflib.
+    Builds the cache key for local graph shapes from the graph content hash and the Shaper options.
     """
-    if shape_type == "shex":
-        try:
-            g = Graph()
-
-            for fname in os.listdir(local_graph_location):
-                if fname.endswith((".ttl", ".rdf", ".nt")):
-                    fpath = os.path.join(local_graph_location, fname)
-                    fmt = (
-                        "ttl" if fname.endswith(".ttl")
-                        else "nt" if fname.endswith(".nt")
-                        else "xml"
-                    )
-                    print(f"📥 Loading {fname} as {fmt}")
-                    g.parse(fpath, format=fmt)
-
-            if len(g) == 0:
-                print(f"⚠️ No RDF triples loaded from {local_graph_location}")
-                return
+    graph_hash = Utils.hash_files(rdf_files)
+    options_hash = hashlib.sha256(json.dumps(shape_options, sort_keys=True).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{graph_hash}:{options_hash}".encode("utf-8")).hexdigest()
 
-            # Generate shapes from combined graph
-            shaper = Shaper(
-                rdflib_graph=g,
-                all_classes_mode=True,
-                disable_comments=True
-            )
+def extract_local_graph_shapes(local_graph_location, shape_options):
+    """
+    Runs a single Shexer extraction over the combined local graph and serializes
+    the computed shape model both as ShEx and as SHACL (Turtle).
+    Returns a dict {"shex": ..., "shacl": ...} or None if the graph is empty.
+    """
+    from shexer.consts import SHACL_TURTLE
+    from shexer.shaper import Shaper
 
-            shape = shaper.shex_graph(string_output=True)
-            os.makedirs(shape_output_path, exist_ok=True)
-            output_filepath = os.path.join(shape_output_path, "local_graph_shape.shex")
+    print(f"📥 Loading local graph from {local_graph_location}")
+    g = Utils.load_local_graph(local_graph_location)
 
-            with open(output_filepath, "w", encoding="utf-8") as f:
-                f.write(shape.strip())
+    if len(g) == 0:
+        return None
 
-            print(f"✅ Saved ShEx shape for local graph to {output_filepath}")
+    shaper = Shaper(rdflib_graph=g, **shape_options)
 
-        except Exception as e:
-            print(f"❌ Error generating shape from local graph: {e}")
-    
-    elif shape_type == "shacl":
-        if not existing_shape_path or not os.path.isfile(existing_shape_path):
-            print(f"❌ Error: Existing shape file not found at {existing_shape_path}")
-            return
+    # The Shaper keeps its instance tracking, profiling and shape list after the first call,
+    # so the second serialization reuses the same computed model.
+    with tracing.span("shape.generate", source="local_graph"):
+        return {
+            "shex": shaper.shex_graph(string_output=True).strip(),
+            "shacl": shaper.shex_graph(string_output=True, output_format=SHACL_TURTLE).strip(),
+        }
 
-        os.makedirs(shape_output_path, exist_ok=True)
-        output_filepath = os.path.join(shape_output_path, os.path.basename(existing_shape_path))
+def generate_shape_from_local_graph(local_graph_location, shape_output_path, shape_type, existing_shape_path, shape_cache_dir=None):
+    """
+    Loads all RDF files from a folder and derives ShEx and SHACL shapes from one Shexer pass.
+    Returns the shape text of the requested shape_type, or None on failure.
+    Both serializations are cached under shape_cache_dir by (graph content hash, shape options),
+    so switching between shape types never redoes the extraction.
+    An existing SHACL shape file, if given, still takes precedence over the derived one.
+    """
+    os.makedirs(shape_output_path, exist_ok=True)
 
+    if shape_type == "shacl" and existing_shape_path and os.path.isfile(existing_shape_path):
+        output_filepath = os.path.join(shape_output_path, f"local_graph_shape.{shape_type}")
         try:
             with open(existing_shape_path, "r", encoding="utf-8") as src, open(output_filepath, "w", encoding="utf-8") as dest:
-                dest.write(src.read())
+                shape = src.read()
+                dest.write(shape)
 
             print(f"✅ Copied existing shape file to {output_filepath}")
+            return shape
         except Exception as e:
             print(f"❌ Error copying shape file: {e}")
-        
+        return None
+
+    try:
+        rdf_files = Utils.list_rdf_files(local_graph_location)
+        if not rdf_files:
+            print(f"⚠️ No RDF files found in {local_graph_location}")
+            return
+
+        cache_key = local_graph_shape_cache_key(rdf_files, LOCAL_GRAPH_SHAPE_OPTIONS)
+        cache_entry_dir = os.path.join(shape_cache_dir, cache_key) if shape_cache_dir else None
+        cached_shape_path = os.path.join(cache_entry_dir, f"local_graph_shape.{shape_type}") if cache_entry_dir else None
+
+        if cached_shape_path and os.path.isfile(cached_shape_path):
+            print(f"♻️ Using cached local graph shapes {cache_key[:12]}")
+            shape = Utils.read_file(cached_shape_path)
+        else:
+            shapes = extract_local_graph_shapes(local_graph_location, LOCAL_GRAPH_SHAPE_OPTIONS)
+            if shapes is None:
+                print(f"⚠️ No RDF triples loaded from {local_graph_location}")
+                return
+
+            if cache_entry_dir:
+                os.makedirs(cache_entry_dir, exist_ok=True)
+                for cached_type, cached_shape in shapes.items():
+                    # Write to a temp file first so a concurrent reader never sees a partial shape
+                    tmp_path = os.path.join(cache_entry_dir, f".local_graph_shape.{cached_type}.{os.getpid()}.tmp")
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(cached_shape)
+                    os.replace(tmp_path, os.path.join(cache_entry_dir, f"local_graph_shape.{cached_type}"))
+                print(f"💾 Cached local graph shapes under {cache_entry_dir}")
+
+            shape = shapes[shape_type]
+
+        output_filepath = os.path.join(shape_output_path, f"local_graph_shape.{shape_type}")
+        with open(output_filepath, "w", encoding="utf-8") as f:
+            f.write(shape)
+
+        print(f"✅ Saved {shape_type} shape for local graph to {output_filepath}")
+        return shape
+
+    except Exception as e:
+        print(f"❌ Error generating shape from local graph: {e}")
 
 
 def clean_shape_text(raw_shape):
@@ -85,6 +129,9 @@ def clean_shape_text(raw_shape):
     return "\n".join(cleaned_lines)
 
 def generate_combined_shape_from_wikidata(entity_label_pairs, shape_type, annotation, sparql_endpoint_url):
+    from shexer.consts import SHACL_TURTLE
+    from shexer.shaper import Shaper
+
     shape_lines = []
     for label, entity_id in entity_label_pairs:
         # Use a unique namespace for the shape label to avoid ambiguity
@@ -114,23 +161,29 @@ def generate_combined_shape_from_wikidata(entity_label_pairs, shape_type, annota
         "http://www.wikidata.org/prop/direct-normalized/"
     ]
 
-    shaper = Shaper(
-    shape_map_raw=shape_map_raw,
-    url_endpoint=sparql_endpoint_url,
-    namespaces_dict=namespaces_dict,
-    disable_comments=True,
-    namespaces_to_ignore=namespaces_to_ignore,
-    wikidata_annotation=annotation,
-    )
-    
-    try:
+    def extract(url):
+        shaper = Shaper(
+        shape_map_raw=shape_map_raw,
+        url_endpoint=url,
+        namespaces_dict=namespaces_dict,
+        disable_comments=True,
+        namespaces_to_ignore=namespaces_to_ignore,
+        wikidata_annotation=annotation,
+        )
 
-        if shape_type == "shex":
-            return shaper.shex_graph(string_output=True)
+        with Utils.endpoint_slot(), tracing.span("shape.generate", source="wikidata", endpoint=url, entities=len(entity_label_pairs)):
+            if shape_type == "shex":
+                return shaper.shex_graph(string_output=True)
+
+            elif shape_type == "shacl":
+                return shaper.shex_graph(string_output=True, output_format=SHACL_TURTLE)
+
+    try:
+        # shexer sends its own requests, a failed extraction is repeated on the next endpoint of the pool
+        pool = endpoint_pool.pool_for(sparql_endpoint_url)
+        request = {"source": "wikidata", "pool": pool.name, "shape_map": shape_map_raw, "shape_type": shape_type, "annotation": annotation}
+        return cassette.exchange("shexer", request, lambda: pool.run(extract), summary=shape_map_raw)
 
-        elif shape_type == "shacl":
-            return shaper.shex_graph(string_output=True, output_format=SHACL_TURTLE)
-                
     except Exception as e:
             print("❌ Error generating shape from shape_map:", file=sys.stderr)
             print(f"Entities involved: {entity_label_pairs}", file=sys.stderr)
@@ -143,6 +196,9 @@ def generate_combined_shape_from_dbpedia(entity_label_pairs, shape_type):
     """
     Generates SHACL shapes from DBpedia entities using a shape map-like structure.
     """
+    from shexer.consts import SHACL_TURTLE
+    from shexer.shaper import Shaper
+
     try:
         shape_lines = []
         for label, entity_id in entity_label_pairs:
@@ -172,69 +228,128 @@ def generate_combined_shape_from_dbpedia(entity_label_pairs, shape_type):
         }
 
 
-        shaper = Shaper(
-            shape_map_raw=shape_map_raw,
-            url_endpoint="https://dbpedia.org/sparql",
-            namespaces_dict=namespaces_dict,
-            disable_comments=True,
-        )
+        def extract(url):
+            shaper = Shaper(
+                shape_map_raw=shape_map_raw,
+                url_endpoint=url,
+                namespaces_dict=namespaces_dict,
+                disable_comments=True,
+            )
+
+            with Utils.endpoint_slot(), tracing.span("shape.generate", source="dbpedia", endpoint=url, entities=len(entity_label_pairs)):
+                if shape_type == "shex":
+                    return shaper.shex_graph(string_output=True)
+                elif shape_type == "shacl":
+                    return shaper.shex_graph(string_output=True, output_format=SHACL_TURTLE)
 
-        if shape_type == "shex":
-            return shaper.shex_graph(string_output=True)
-        elif shape_type == "shacl":
-            return shaper.shex_graph(string_output=True, output_format=SHACL_TURTLE)
+        pool = Utils.public_endpoint("dbpedia", "https://dbpedia.org/sparql")
+        request = {"source": "dbpedia", "pool": pool.name, "shape_map": shape_map_raw, "shape_type": shape_type}
+        return cassette.exchange("shexer", request, lambda: pool.run(extract), summary=shape_map_raw)
 
     except Exception as e:
         print(f"❌ Error generating shape: {e}")
         return None
     
-def generate_shape_from_endpoint(json_file, shape_output_path, shape_type, dataset_type, annotation, sparql_endpoint_url):
-    with open(json_file, "r", encoding="utf-8") as file:
-        data = json.load(file)
+def generate_shape_for_entry(entry, shape_output_path, shape_type, dataset_type, annotation, sparql_endpoint_url):
+    """
+    Generates, cleans and saves the combined shape for the resolved entities of one question.
+    Returns the final shape text, or None if no shape could be generated.
+    """
+    original_id = entry.get("baseline_id")
+    named_entities = entry.get("llm_extracted_entity_names", [])
+    entity_dict = entry.get("endpoint_entities_resolved", {})
 
-    for entry in data:
-        original_id = entry.get("baseline_id")
-        named_entities = entry.get("llm_extracted_entity_names", [])
-        entity_dict = entry.get("endpoint_entities_resolved", {})
+    if not named_entities or not entity_dict:
+        print(f"⚠️ Warning: Skipping question ID {original_id} due to missing entity data.")
+        return None
 
-        if not named_entities or not entity_dict:
-            print(f"⚠️ Warning: Skipping question ID {original_id} due to missing entity data.")
-            continue
+    # Collect all (label, entity_id) pairs
+    entity_label_pairs = []
+    for name in named_entities:
+        entity_id = entity_dict.get(name.strip())
+        if entity_id:
+            entity_label_pairs.append((name, entity_id))
+
+    if not entity_label_pairs:
+        print(f"⚠️ Warning: No valid entity-label pairs for question ID {original_id}.")
+        return None
 
-        # Collect all (label, entity_id) pairs
-        entity_label_pairs = []
-        for name in named_entities:
-            entity_id = entity_dict.get(name.strip())
-            if entity_id:
-                entity_label_pairs.append((name, entity_id))
+    shape = None
+    if dataset_type == "wikidata":
+        # Generate ShEx shape for each entity
+        shape = generate_combined_shape_from_wikidata(entity_label_pairs, shape_type, annotation, sparql_endpoint_url)
+    elif dataset_type == "dbpedia":
+        # Generate ShEx shape for each entity
+        shape = generate_combined_shape_from_dbpedia(entity_label_pairs, shape_type) 
 
-        if not entity_label_pairs:
-            print(f"⚠️ Warning: No valid entity-label pairs for question ID {original_id}.")
+    if not shape:
+        return None
+
+    prefix_block_match = re.search(r"^(PREFIX .*\n)+", shape)
+    prefix_block = prefix_block_match.group(0) if prefix_block_match else ""
+    shape = re.sub(r"^(PREFIX .*\n)+", "", shape)
+
+    final_shape = clean_shape_text(prefix_block + "\n" + shape).strip()
+
+    os.makedirs(shape_output_path, exist_ok=True)
+    output_filepath = os.path.join(shape_output_path, f"question_{original_id}_shape.{shape_type}")
+    with tracing.span("file.write", path=output_filepath), open(output_filepath, "w", encoding="utf-8") as f:
+        f.write(final_shape)
+
+    print(f"✅ Saved {shape_type} shape for question {original_id} to {output_filepath}")
+    return final_shape
+
+def restore_journaled_shape(question_id, shape, shape_output_path, shape_type):
+    """Rewrites the shape file of a question completed in a previous run if it is missing."""
+    output_filepath = os.path.join(shape_output_path, f"question_{question_id}_shape.{shape_type}")
+    if shape and not os.path.exists(output_filepath):
+        os.makedirs(shape_output_path, exist_ok=True)
+        with open(output_filepath, "w", encoding="utf-8") as f:
+            f.write(shape)
+
+def generate_shapes_for_records(data, shape_output_path, shape_type, dataset_type, annotation, sparql_endpoint_url, journal=None):
+    """
+    Generates shapes for all in-memory experiment records.
+    Returns a dict mapping question IDs to their shape text, so later stages don't need to re-read the files.
+    If a journal is given, generated shapes are appended to it and already journaled questions are skipped.
+    """
+    shapes = {}
+    for entry in data:
+        original_id = entry.get("baseline_id")
+        if journal is not None and journal.is_completed(original_id):
+            shape = journal.get(original_id)["shape"]
+            restore_journaled_shape(original_id, shape, shape_output_path, shape_type)
+            if journal.get(original_id).get("operational_metrics"):
+                entry["operational_metrics"] = journal.get(original_id)["operational_metrics"]
+            if shape:
+                shapes[original_id] = shape
+            print(f"♻️ Skipping question {original_id}, shape already completed")
             continue
-        
-        if dataset_type == "wikidata":
-            # Generate ShEx shape for each entity
-            shape = generate_combined_shape_from_wikidata(entity_label_pairs, shape_type, annotation, sparql_endpoint_url)
-        elif dataset_type == "dbpedia":
-            # Generate ShEx shape for each entity
-            shape = generate_combined_shape_from_dbpedia(entity_label_pairs, shape_type) 
-        
+
+        with tracing.context(question_id=original_id), operational_metrics.measure() as usage:
+            shape = generate_shape_for_entry(entry, shape_output_path, shape_type, dataset_type, annotation, sparql_endpoint_url)
+            if dataset_type == "wikidata":
+                Utils.throttle(15, "wikidata_rate_limit", sparql_endpoint_url)  # adjust if needed
+        usage.add_to(entry)
+        if journal is not None:
+            journal.append(original_id, {"shape": shape, "operational_metrics": entry.get("operational_metrics")})
         if shape:
-            prefix_block_match = re.search(r"^(PREFIX .*\n)+", shape)
-            prefix_block = prefix_block_match.group(0) if prefix_block_match else ""
-            shape = re.sub(r"^(PREFIX .*\n)+", "", shape)
+            shapes[original_id] = shape
 
-            final_shape = clean_shape_text(prefix_block + "\n" + shape)
+    return shapes
 
-            os.makedirs(shape_output_path, exist_ok=True)
-            output_filepath = os.path.join(shape_output_path, f"question_{original_id}_shape.{shape_type}")
-            with open(output_filepath, "w", encoding="utf-8") as f:
-                f.write(final_shape.strip())
+def generate_shape_from_endpoint(json_file, shape_output_path, shape_type, dataset_type, annotation, sparql_endpoint_url, resume=False):
+    with tracing.span("file.read", path=json_file), open(json_file, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    journal = StageJournal(StageJournal.path_for(json_file, "generate_shape"), resume)
+    generate_shapes_for_records(data, shape_output_path, shape_type, dataset_type, annotation, sparql_endpoint_url, journal)
 
-            print(f"✅ Saved {shape_type} shape for question {original_id} to {output_filepath}")
-        
-        if dataset_type == "wikidata":    
-            time.sleep(15)  # adjust if needed
+    # Write the records back so their operational metrics include this stage
+    tmp_path = f"{json_file}.{os.getpid()}.tmp"
+    with tracing.span("file.write", path=json_file), open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, json_file)
 
 
 def main():
@@ -249,8 +364,12 @@ def main():
     parser.add_argument("--annotation", type=Utils.str_to_bool, required=False, help="Annotation for the shape file.")
     parser.add_argument("--sparql_endpoint_url", type=str, required=False, help="SPARQL endpoint URL for DBpedia or Wikidata.")
     parser.add_argument("--baseline_run", type=Utils.str_to_bool, default=False, help="Run baseline SPARQL queries.")
-    
+    parser.add_argument("--shape_cache_dir", type=str, default="./cache/shapes", help="Directory for caching local graph shapes (set to None to disable).")
+    parser.add_argument("--resume", type=Utils.str_to_bool, default=False, help="Skip questions already completed in the stage journal.")
+    Utils.add_runtime_arguments(parser)
+
     args = parser.parse_args()
+    Utils.configure_runtime(args, "generate_shape")
     is_local_graph = args.is_local_graph
     
     print(f"✅ is_local_graph: {is_local_graph}")
@@ -262,10 +381,11 @@ def main():
             print("❌ Error: --local_graph_location is required when --is_local_graph is True.")
             return
         print(f"✅ Generating shape from local graph at {args.local_graph_location}")
-        generate_shape_from_local_graph(args.local_graph_location, args.shape_output_path, args.shape_type, args.existing_shape_path)
+        shape_cache_dir = None if args.shape_cache_dir in (None, "", "None") else args.shape_cache_dir
+        generate_shape_from_local_graph(args.local_graph_location, args.shape_output_path, args.shape_type, args.existing_shape_path, shape_cache_dir)
     else:
         print(f"✅ Generating shape using sparql endpoint {args.target_json_file} and generated shapes.")
-        generate_shape_from_endpoint(args.target_json_file, args.shape_output_path, args.shape_type, args.dataset_type, args.annotation, args.sparql_endpoint_url)
+        generate_shape_from_endpoint(args.target_json_file, args.shape_output_path, args.shape_type, args.dataset_type, args.annotation, args.sparql_endpoint_url, args.resume)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import threading
+from utility import Utils
+import run_allocator
+
+# Gold answer indexes loaded in this process, keyed by index path
+_gold_indexes = {}
+_gold_lock = threading.Lock()
+
+def normalize_answer_block(answers):
+    """
+    Flattens the QALD `answers` block of one question into the value list format of Utils.query_sparql_endpoint
+    (values grouped by variable, then by binding). ASK answers become ["true"] or ["false"].
+    Returns None if the question has no usable answers block.
+    """
+    if not isinstance(answers, list) or not answers:
+        return None
+
+    values = []
+    for answer in answers:
+        if not isinstance(answer, dict):
+            return None
+        if "boolean" in answer:
+            values.append(str(answer["boolean"]).lower())
+            continue
+        vars_ = answer.get("head", {}).get("vars", [])
+        bindings = answer.get("results", {}).get("bindings", [])
+        values.extend(
+            binding[var]["value"]
+            for var in vars_
+            for binding in bindings
+            if var in binding and "value" in binding[var]
+        )
+    return values
+
+def gold_index_path(benchmark_dataset, cache_dir):
+    """Path of the gold answer index of a benchmark, keyed by the benchmark content."""
+    return os.path.join(cache_dir, f"{Utils.hash_files([benchmark_dataset])[:16]}.gold.json")
+
+def build_gold_index(benchmark_dataset, index_path):
+    """
+    Extracts and normalizes the embedded answers of every question once and writes them as a compact ID → values index.
+    The benchmark is streamed, so only the normalized answers are held in memory.
+    """
+    import dataset_reader
+
+    answers = {}
+    num_questions = 0
+    for entry in dataset_reader.iter_questions(benchmark_dataset):
+        num_questions += 1
+        values = normalize_answer_block(entry.get("answers")) if isinstance(entry, dict) else None
+        if values is not None:
+            answers[str(entry.get("id"))] = values
+
+    index = {"benchmark": os.path.abspath(benchmark_dataset), "num_questions": num_questions, "answers": answers}
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+
+    print(f"🏅 Gold answers of {len(answers)}/{num_questions} questions indexed in {index_path}")
+    return index
+
+def load_gold_answers(benchmark_dataset, cache_dir="./cache/gold"):
+    """
+    Returns the question ID → gold values dict of a benchmark.
+    The index is built on first use and shared by all later runs on the same benchmark content.
+    """
+    index_path = gold_index_path(benchmark_dataset, cache_dir)
+    with _gold_lock:
+        if index_path not in _gold_indexes:
+            # Runs starting at the same time build the index once, the others wait and read it
+            with run_allocator.file_lock(index_path):
+                if os.path.exists(index_path):
+                    with open(index_path, "r", encoding="utf-8") as f:
+                        index = json.load(f)
+                    print(f"🏅 Using gold answer index {index_path} ({len(index['answers'])} questions)")
+                else:
+                    index = build_gold_index(benchmark_dataset, index_path)
+            _gold_indexes[index_path] = index["answers"]
+        return _gold_indexes[index_path]
+
+def compare_with_live(gold_values, live_result):
+    """Describes the drift between the embedded gold answers and a live re-execution of the gold query."""
+    if isinstance(live_result, dict):
+        return {"drifted": None, "error": live_result.get("error")}
+    gold_set, live_set = set(gold_values), set(live_result)
+    return {
+        "drifted": gold_set != live_set,
+        "live_count": len(live_result),
+        "missing_live": len(gold_set - live_set),
+        "extra_live": len(live_set - gold_set),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the embedded gold answers of a QALD benchmark into a compact index.")
+    parser.add_argument("--benchmark_dataset", type=str, required=True, help="Path to the QALD benchmark JSON file.")
+    parser.add_argument("--gold_cache_dir", type=str, default="./cache/gold", help="Directory of the gold answer indexes.")
+    args = parser.parse_args()
+
+    build_gold_index(args.benchmark_dataset, gold_index_path(args.benchmark_dataset, args.gold_cache_dir))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import tracing
+
+class StageJournal:
+    """
+    Append-only JSONL journal of per-question records completed by one pipeline stage.
+    Every record is flushed and fsynced as soon as it is appended, so an interrupted run
+    loses at most the question that was in flight. With resume=True the records of an
+    existing journal are loaded and their question IDs are skipped by the stage.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.completed = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self.completed = self._load(path)
+            print(f"♻️ Resuming from {path}: {len(self.completed)} completed question(s)")
+        else:
+            # Start a fresh journal for a new run
+            open(path, "w", encoding="utf-8").close()
+
+    @staticmethod
+    def path_for(json_path: str, stage: str) -> str:
+        """Returns the journal path of a stage next to the experiment JSON."""
+        base = json_path[:-len(".json")] if json_path.endswith(".json") else json_path
+        return f"{base}.{stage}.journal.jsonl"
+
+    @staticmethod
+    def _repair_tail(path: str):
+        """
+        Ends the journal with a newline so the next append starts a line of its own.
+        A final line without newline is kept if it is a complete record, otherwise it is truncated.
+        """
+        with open(path, "rb") as f:
+            content = f.read()
+        complete_end = content.rfind(b"\n") + 1
+        if complete_end == len(content):
+            return
+        tail = content[complete_end:]
+        try:
+            json.loads(tail.decode("utf-8"))
+            torn = False
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            torn = True
+        with open(path, "r+b") as f:
+            if torn:
+                print(f"⚠️ Truncating incomplete final journal line in {path}")
+                f.truncate(complete_end)
+            else:
+                f.seek(0, os.SEEK_END)
+                f.write(b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _load(path: str) -> dict:
+        """Reads the journal, keeping the last record per question ID and dropping a torn final line."""
+        StageJournal._repair_tail(path)
+        completed = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️ Ignoring incomplete journal line {line_number} in {path}")
+                    continue
+                completed[str(item["id"])] = item["record"]
+        return completed
+
+    def is_completed(self, question_id) -> bool:
+        return str(question_id) in self.completed
+
+    def get(self, question_id):
+        return self.completed.get(str(question_id))
+
+    def append(self, question_id, record):
+        """Durably appends the completed record of one question."""
+        line = json.dumps({"id": str(question_id), "record": record}, ensure_ascii=False)
+        with self._lock, tracing.span("journal.append", path=self.path):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.completed[str(question_id)] = record
@@ -0,0 +1,306 @@
+import argparse
+import difflib
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+
+# File layout: header, fixed-width entries sorted by normalized label, then a blob of UTF-8 strings.
+# Entries are read straight from the memory map, so opening an index costs nothing and lookups
+# only touch the pages they binary search through.
+MAGIC = b"KGLABEL1"
+HEADER = struct.Struct("<8sQQ")       # magic, number of entries, offset of the string blob
+ENTRY = struct.Struct("<QIQIQII")     # key offset/length, label offset/length, entity offset/length, popularity
+
+LABEL_PREDICATES = {
+    "http://www.w3.org/2000/01/rdf-schema#label",
+    "http://www.w3.org/2004/02/skos/core#prefLabel",
+    "http://www.w3.org/2004/02/skos/core#altLabel",
+    "http://schema.org/name",
+    "https://schema.org/name",
+    "http://xmlns.com/foaf/0.1/name",
+}
+
+# Subject, predicate and object of one N-Triples/N-Quads line, the object either an IRI or a literal with optional tag
+NT_LINE = re.compile(r'^<([^>]*)>\s+<([^>]*)>\s+(?:<([^>]*)>|"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<[^>]*>)?)')
+NT_ESCAPES = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+
+# Fuzzy lookup compares against the entries sharing the first characters of the name, at most this many
+FUZZY_PREFIX = 3
+FUZZY_SCAN = 20000
+
+# Label indexes opened in this process, keyed by path
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+def normalize_label(label: str) -> str:
+    """Unicode-normalizes, collapses whitespace and case-folds a label; the sort and lookup key of the index."""
+    return " ".join(unicodedata.normalize("NFKC", label).split()).casefold()
+
+def _unescape_nt(value: str) -> str:
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] in "uU":
+            return chr(int(escape[1:], 16))
+        return {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f"}.get(escape, escape)
+    return NT_ESCAPES.sub(replace, value)
+
+def read_tsv_labels(path):
+    """Yields (entity, label, popularity) from a dump with entity<TAB>label[<TAB>popularity] lines; aliases are extra lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 2 or not fields[0] or not fields[1] or line.startswith("#"):
+                continue
+            popularity = int(fields[2]) if len(fields) > 2 and fields[2].strip().isdigit() else 0
+            yield fields[0], fields[1], popularity
+
+def _ntriples(path):
+    """Streams the (subject, predicate, object IRI, literal, language tag) of the lines of an N-Triples/N-Quads file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = NT_LINE.match(line)
+            if match:
+                yield match.groups()
+
+def read_ntriples_labels(path, language="en"):
+    """
+    Yields (entity, label, popularity) from an N-Triples/N-Quads labels dump, read in two streaming passes.
+    The first pass collects the labels, the second counts the lines each labelled entity occurs in (its popularity,
+    i.e. its label/alias count in a pure labels dump). Entities without a label are never held in memory.
+    """
+    labels = []
+    occurrences = {}
+    for subject, predicate, object_iri, literal, tag in _ntriples(path):
+        if literal is not None and predicate in LABEL_PREDICATES and (not language or tag is None or tag.lower() == language):
+            labels.append((subject, _unescape_nt(literal)))
+            occurrences[subject] = 0
+
+    for subject, _, object_iri, _, _ in _ntriples(path):
+        if subject in occurrences:
+            occurrences[subject] += 1
+        if object_iri in occurrences:
+            occurrences[object_iri] += 1
+    for entity, label in labels:
+        yield entity, label, occurrences[entity]
+
+def read_graph_labels(graph_folder, language="en"):
+    """Yields (entity, label, popularity) from the label triples of a local graph; popularity is the node degree."""
+    from utility import Utils
+    from rdflib import Literal, URIRef
+
+    graph = Utils.load_local_graph(graph_folder)
+    degree = {}
+    for subject, _, obj in graph:
+        degree[subject] = degree.get(subject, 0) + 1
+        if isinstance(obj, URIRef):
+            degree[obj] = degree.get(obj, 0) + 1
+
+    for subject, predicate, obj in graph:
+        if str(predicate) not in LABEL_PREDICATES or not isinstance(subject, URIRef) or not isinstance(obj, Literal):
+            continue
+        if language and obj.language and obj.language.lower() != language:
+            continue
+        yield str(subject), str(obj), degree.get(subject, 0)
+
+def read_labels(source, language="en"):
+    """Picks the reader of a labels source: a local graph folder, an N-Triples/N-Quads dump or a TSV dump."""
+    if os.path.isdir(source):
+        return read_graph_labels(source, language)
+    if source.endswith((".nt", ".nq")):
+        return read_ntriples_labels(source, language)
+    return read_tsv_labels(source)
+
+def build_index(labels, index_path):
+    """
+    Writes the label index of (entity, label, popularity) triples.
+    Entries are sorted by normalized label and then by descending popularity, so the first entry of a label is its most popular entity.
+    """
+    entries = {}
+    for entity, label, popularity in labels:
+        key = normalize_label(label)
+        if not key:
+            continue
+        previous = entries.get((key, entity))
+        if previous is None or popularity > previous[1]:
+            entries[(key, entity)] = (label, popularity)
+
+    ordered = sorted(
+        ((key.encode("utf-8"), label, entity, popularity) for (key, entity), (label, popularity) in entries.items()),
+        key=lambda entry: (entry[0], -entry[3], entry[2]),
+    )
+
+    blob = bytearray()
+    interned = {}
+
+    def intern(value: str):
+        if value not in interned:
+            encoded = value.encode("utf-8")
+            interned[value] = (len(blob), len(encoded))
+            blob.extend(encoded)
+        return interned[value]
+
+    packed = bytearray()
+    for key, label, entity, popularity in ordered:
+        key_offset, key_length = intern(key.decode("utf-8"))
+        label_offset, label_length = intern(label)
+        entity_offset, entity_length = intern(entity)
+        packed.extend(ENTRY.pack(key_offset, key_length, label_offset, label_length, entity_offset, entity_length, min(popularity, 0xFFFFFFFF)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ordered), HEADER.size + len(packed)))
+        f.write(packed)
+        f.write(blob)
+    os.replace(tmp_path, index_path)
+
+    print(f"🏷️ {len(ordered)} labels of {len({entry[2] for entry in ordered})} entities indexed in {index_path}")
+    return index_path
+
+class LabelIndex:
+    """
+    Read-only view of a label index file through a memory map.
+    Lookups return dicts with the entity, its label, popularity and the match type, most popular first.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size, self._strings = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a label index.")
+
+    def __len__(self):
+        return self.size
+
+    def _string(self, offset, length) -> bytes:
+        start = self._strings + offset
+        return self._map[start:start + length]
+
+    def _key(self, position: int) -> bytes:
+        key_offset, key_length = struct.unpack_from("<QI", self._map, HEADER.size + position * ENTRY.size)
+        return self._string(key_offset, key_length)
+
+    def _match(self, position: int, match: str) -> dict:
+        _, _, label_offset, label_length, entity_offset, entity_length, popularity = ENTRY.unpack_from(self._map, HEADER.size + position * ENTRY.size)
+        return {
+            "entity": self._string(entity_offset, entity_length).decode("utf-8"),
+            "label": self._string(label_offset, label_length).decode("utf-8"),
+            "popularity": popularity,
+            "match": match,
+        }
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _range(self, prefix: bytes, limit: int):
+        """Positions of the entries whose key starts with prefix, at most limit."""
+        position = self._lower_bound(prefix)
+        end = min(self.size, position + limit)
+        while position < end and self._key(position).startswith(prefix):
+            yield position
+            position += 1
+
+    def casefold(self, name: str, limit: int = 5) -> list:
+        """Entries whose label equals the name after case folding and whitespace normalization."""
+        key = normalize_label(name).encode("utf-8")
+        if not key:
+            return []
+        matches = []
+        for position in self._range(key, FUZZY_SCAN):
+            if self._key(position) != key:
+                break
+            matches.append(self._match(position, "casefold"))
+        for match in matches:
+            if match["label"] == name:
+                match["match"] = "exact"
+        # Exact spellings first, then by popularity
+        return sorted(matches, key=lambda match: (match["match"] != "exact", -match["popularity"]))[:limit]
+
+    def exact(self, name: str, limit: int = 5) -> list:
+        return [match for match in self.casefold(name, limit=FUZZY_SCAN) if match["match"] == "exact"][:limit]
+
+    def prefix(self, prefix: str, limit: int = 10) -> list:
+        """The most popular entries whose normalized label starts with the prefix."""
+        key = normalize_label(prefix).encode("utf-8")
+        if not key:
+            return []
+        matches = [self._match(position, "prefix") for position in self._range(key, FUZZY_SCAN)]
+        return sorted(matches, key=lambda match: -match["popularity"])[:limit]
+
+    def fuzzy(self, name: str, limit: int = 5, cutoff: float = 0.8) -> list:
+        """
+        Entries whose normalized label is similar to the name (difflib ratio >= cutoff), best first, ties broken by popularity.
+        Only labels sharing the first FUZZY_PREFIX characters are compared, so typos in the first characters are not found.
+        """
+        key = normalize_label(name)
+        if not key:
+            return []
+        matches = []
+        for position in self._range(key[:FUZZY_PREFIX].encode("utf-8"), FUZZY_SCAN):
+            candidate = self._key(position).decode("utf-8")
+            if abs(len(candidate) - len(key)) > max(1, len(key) * (1 - cutoff) * 2):
+                continue
+            matcher = difflib.SequenceMatcher(None, key, candidate)
+            if matcher.quick_ratio() < cutoff:
+                continue
+            score = matcher.ratio()
+            if score >= cutoff:
+                match = self._match(position, "fuzzy")
+                match["score"] = round(score, 4)
+                matches.append(match)
+        return sorted(matches, key=lambda match: (-match["score"], -match["popularity"]))[:limit]
+
+    def resolve(self, name: str, fuzzy_cutoff: float = 0.8, fuzzy: bool = True):
+        """
+        Best entity for a name: exact spelling, then case-folded, then fuzzy (unless fuzzy is False); None if nothing matches.
+        The "match" of the result tells which of them matched.
+        """
+        matches = self.casefold(name, limit=1)
+        if not matches and fuzzy:
+            matches = self.fuzzy(name, limit=1, cutoff=fuzzy_cutoff)
+        return matches[0] if matches else None
+
+    def close(self):
+        self._map.close()
+
+def open_index(index_path: str) -> LabelIndex:
+    """Returns the process-wide LabelIndex of a file, mapping it on first use."""
+    with _open_lock:
+        if index_path not in _open_indexes:
+            _open_indexes[index_path] = LabelIndex(index_path)
+            print(f"🏷️ Using label index {index_path} ({len(_open_indexes[index_path])} labels)")
+        return _open_indexes[index_path]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a memory-mapped label index for offline entity resolution.")
+    parser.add_argument("--index", type=str, required=True, help="Path of the label index file.")
+    parser.add_argument("--source", type=str, help="Build the index from a TSV dump (entity, label, popularity), an N-Triples/N-Quads labels dump or a local graph folder.")
+    parser.add_argument("--language", type=str, default="en", help="Language tag of the labels to index (\"\" for all).")
+    parser.add_argument("--lookup", type=str, nargs="*", default=[], help="Names to resolve with the index.")
+    parser.add_argument("--prefix", type=str, help="List the most popular labels starting with this prefix.")
+    args = parser.parse_args()
+
+    if args.source:
+        build_index(read_labels(args.source, args.language), args.index)
+
+    index = open_index(args.index)
+    for name in args.lookup:
+        print(f"{name!r}: {index.resolve(name)}")
+    if args.prefix:
+        for match in index.prefix(args.prefix):
+            print(f"{match['label']!r} → {match['entity']} ({match['popularity']})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import copy
+import itertools
+import json
+import os
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from utility import Utils
+from journal import StageJournal
+import pipeline
+import verify_sparql
+import result_sidecar
+import tracing
+import retry_policy
+import multilingual
+import operational_metrics
+
+class SharedStageOutputs:
+    """
+    Memoizes stage outputs by the fingerprint of their inputs.
+    The first cell that needs an output computes it, every other cell with the same key waits for that result.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.reused = 0
+
+    def get(self, key, compute):
+        return self.get_owned(key, compute)[0]
+
+    def get_owned(self, key, compute):
+        """The stage output of a key and whether this call computed it (False if it was computed for another cell)."""
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._futures[key] = future
+                self.computed += 1
+            else:
+                self.reused += 1
+
+        if owner:
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result(), owner
+
+def load_grid_spec(spec_path):
+    """Reads the grid spec and expands it into one (cell name, overrides) pair per grid cell."""
+    with open(spec_path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+
+    if "grid" not in spec or not isinstance(spec["grid"], dict):
+        raise ValueError(f"Invalid grid spec {spec_path}: expected a 'grid' dictionary of axes.")
+
+    axes = []
+    for axis_name, values in spec["grid"].items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Invalid grid spec {spec_path}: axis '{axis_name}' must be a non-empty list.")
+        axis = []
+        for value in values:
+            # Dict values set several arguments at once (e.g. a dataset with its endpoint), scalars set the axis argument
+            if isinstance(value, dict):
+                overrides = {k: v for k, v in value.items() if k != "name"}
+                label = str(value.get("name", "-".join(str(v) for v in overrides.values())))
+            else:
+                overrides = {axis_name: value}
+                label = f"{axis_name}={value}"
+            axis.append((label, overrides))
+        axes.append(axis)
+
+    cells = []
+    for combination in itertools.product(*axes):
+        overrides = dict(spec.get("base", {}))
+        for _, axis_overrides in combination:
+            overrides.update(axis_overrides)
+        cell_name = "__".join(label for label, _ in combination).replace("/", "_").replace(" ", "_")
+        cells.append((cell_name, overrides))
+
+    return spec, cells
+
+def build_cell_args(overrides, cell_dir):
+    """Builds the pipeline arguments of one cell from the pipeline defaults and the cell overrides."""
+    parser = pipeline.build_parser()
+    defaults = {action.dest: action.default for action in parser._actions if action.dest != "help"}
+    args = argparse.Namespace(**defaults)
+
+    for key, value in overrides.items():
+        if key not in defaults:
+            raise ValueError(f"Unknown pipeline argument in grid spec: {key}")
+        # Boolean flags may be given as strings, like in the .env file
+        if isinstance(value, str) and key in ("is_local_graph", "annotation", "baseline_run", "streaming", "resume", "gold_answers", "gold_drift_check", "label_index_fallback"):
+            value = Utils.str_to_bool(value)
+        setattr(args, key, value)
+
+    for key in ("local_graph_location", "sparql_endpoint_url", "existing_shape_path", "shape_cache_dir", "results_db", "result_store_dir", "label_index", "languages"):
+        if getattr(args, key) in ("", "None"):
+            setattr(args, key, None)
+
+    args.json_path = os.path.join(cell_dir, "experiment.json")
+    args.shape_output_path = os.path.join(cell_dir, "shapes")
+    args.log_dir = cell_dir
+    return args
+
+def file_fingerprint(path):
+    return Utils.hash_files([path]) if path and os.path.isfile(path) else None
+
+def graph_fingerprint(args):
+    if args.is_local_graph and args.local_graph_location and os.path.isdir(args.local_graph_location):
+        return Utils.hash_files(Utils.list_rdf_files(args.local_graph_location))
+    return None
+
+def compute_stage_keys(args):
+    """
+    Derives the key of every stage output from the inputs that actually influence it,
+    so identical stages of different cells map to the same key.
+    """
+    extracts_entities = not args.is_local_graph and not args.baseline_run
+    extract_key = Utils.fingerprint({
+        "stage": "extract_entity_list",
+        "benchmark": file_fingerprint(args.benchmark_dataset),
+        "num_questions": args.num_questions,
+        "selection": [args.question_ids, args.sample_size, args.sample_seed if args.sample_size else None],
+        "languages": multilingual.parse_languages(args.languages),
+        "shard": [args.shard_index, args.shard_count],
+        "is_local_graph": args.is_local_graph,
+        "graph": graph_fingerprint(args) if args.is_local_graph else args.sparql_endpoint_url,
+        "baseline_run": args.baseline_run,
+        "gold_answers": args.gold_answers,
+        "dataset_type": args.dataset_type if extracts_entities else None,
+        "label_index": [file_fingerprint(args.label_index), args.label_index_fallback] if extracts_entities else None,
+        "llm": [
+            args.llm_provider_entity_extraction, args.model_entity_extraction, args.max_tokens_entity_extraction,
+            args.temperature_entity_extraction, file_fingerprint(args.system_prompt_entity_extraction),
+        ] if extracts_entities else None,
+        "batch": [
+            args.batch_size_entity_extraction, file_fingerprint(args.system_prompt_entity_extraction_batch),
+        ] if extracts_entities and args.batch_size_entity_extraction > 1 else None,
+    })
+
+    shape_key = None
+    if not args.baseline_run:
+        shape_key = Utils.fingerprint({
+            "stage": "generate_shape",
+            "records": None if args.is_local_graph else extract_key,
+            "graph": graph_fingerprint(args) if args.is_local_graph else args.sparql_endpoint_url,
+            "shape_type": args.shape_type,
+            "dataset_type": args.dataset_type,
+            "annotation": None if args.is_local_graph else args.annotation,
+            "existing_shape": file_fingerprint(args.existing_shape_path) if args.is_local_graph else None,
+        })
+
+    system_prompt = args.system_prompt_sparql_generation_baseline_run if args.baseline_run else args.system_prompt_sparql_generation
+    generate_key = Utils.fingerprint({
+        "stage": "call_llm_api",
+        "records": extract_key,
+        "shapes": shape_key,
+        "shape_type": None if args.baseline_run else args.shape_type,
+        "shape_format": None if args.baseline_run else args.shape_format,
+        "dataset_type": args.dataset_type,
+        "llm": [
+            args.llm_provider_sparql_generation, args.model_sparql_generation, args.max_tokens_sparql_generation,
+            args.temperature_sparql_generation, args.max_retries, file_fingerprint(system_prompt),
+        ],
+        "retry_policy": retry_policy.from_args(args).fingerprint(),
+    })
+
+    verify_key = Utils.fingerprint({
+        "stage": "verify_sparql", "records": generate_key, "gold_answers": args.gold_answers, "drift_check": args.gold_drift_check,
+    })
+
+    return {"extract_entity_list": extract_key, "generate_shape": shape_key, "call_llm_api": generate_key, "verify_sparql": verify_key}
+
+def without_usage(records):
+    """Copies of the records without operational metrics, so every shared stage output carries only the usage of its own stage."""
+    records = copy.deepcopy(records)
+    for record in records:
+        if isinstance(record, dict):
+            record.pop("operational_metrics", None)
+    return records
+
+def attribute_usage(data, stage_outputs):
+    """
+    Sets the operational metrics of the cell's records to the usage of the stages the cell computed itself.
+    The usage of stage outputs computed by another cell goes to "shared_operational_metrics", so the wall-clock
+    seconds, calls and bytes of shared work are not reported (and summed over the grid) once per cell.
+    """
+    usage_by_id = {}
+    for records, owned in stage_outputs:
+        for record in records:
+            if isinstance(record, dict) and record.get("operational_metrics"):
+                usage_by_id.setdefault(str(record.get("baseline_id")), []).append((record, owned))
+
+    for record in data:
+        if not isinstance(record, dict):
+            continue
+        record.pop("operational_metrics", None)
+        for stage_record, owned in usage_by_id.get(str(record.get("baseline_id")), []):
+            usage = operational_metrics.QuestionUsage.from_record(stage_record)
+            usage.add_to(record, "operational_metrics" if owned else "shared_operational_metrics")
+    return data
+
+def _run_cell(cell_name, args, shared, shared_dir, resume):
+    """Runs one grid cell, taking every stage output from the shared outputs when another cell already produced it."""
+    keys = compute_stage_keys(args)
+    num_questions = None if args.num_questions in (None, 0) else args.num_questions
+
+    def journal(stage):
+        return StageJournal(os.path.join(shared_dir, f"{keys[stage][:16]}.{stage}.journal.jsonl"), resume)
+
+    print(f"▶️ Cell {cell_name}")
+    records, extracted = shared.get_owned(
+        keys["extract_entity_list"], lambda: pipeline.run_extract_stage(args, num_questions, journal("extract_entity_list"))
+    )
+
+    shapes = {}
+    if keys["generate_shape"]:
+        # Shapes are written once to a shared folder that all cells with the same shape key read from
+        args.shape_output_path = os.path.join(shared_dir, "shapes", keys["generate_shape"][:16])
+        shapes = shared.get(keys["generate_shape"], lambda: pipeline.run_shape_stage(args, copy.deepcopy(records), journal("generate_shape")))
+
+    generated, generated_here = shared.get_owned(
+        keys["call_llm_api"], lambda: pipeline.run_generate_stage(args, without_usage(records), shapes, journal("call_llm_api"))
+    )
+
+    def verify():
+        data = without_usage(generated)
+        verify_sparql.verify_records(
+            data, args.sparql_endpoint_url, args.is_local_graph, args.local_graph_location, journal("verify_sparql"),
+            pipeline.load_gold(args), args.gold_drift_check, result_sidecar.open_sidecar(args.result_store_dir)
+        )
+        return data
+
+    verified, verified_here = shared.get_owned(keys["verify_sparql"], verify)
+    data = attribute_usage(copy.deepcopy(verified), [(records, extracted), (generated, generated_here), (verified, verified_here)])
+
+    os.makedirs(os.path.dirname(args.json_path), exist_ok=True)
+    metrics = verify_sparql.compute_metrics(data)
+    args.run_index = cell_name
+    pipeline.write_run_results(args, data, metrics)
+    with open(args.json_path, "w", encoding="utf-8") as file:
+        json.dump(result_sidecar.externalize_records(data, result_sidecar.open_sidecar(args.result_store_dir)), file, indent=4, ensure_ascii=False)
+
+    print(f"✅ Cell {cell_name} finished")
+    return metrics
+
+def run_cell(cell_name, args, shared, shared_dir, resume):
+    """Runs one grid cell with its spans tagged by cell name, so each cell's summary reports only its own latencies."""
+    with tracing.context(cell=cell_name):
+        return _run_cell(cell_name, args, shared, shared_dir, resume)
+
+def run_matrix(spec_path, output_dir=None, max_parallel_cells=None, llm_concurrency=None, endpoint_concurrency=None, resume=False):
+    """Runs all cells of a grid spec concurrently while computing every distinct stage output only once."""
+    spec, cells = load_grid_spec(spec_path)
+    output_dir = output_dir or spec.get("output_dir", "Experiment_Results/matrix")
+    max_parallel_cells = max_parallel_cells or spec.get("max_parallel_cells", 4)
+    Utils.configure_concurrency(
+        llm_concurrency or spec.get("llm_concurrency"),
+        endpoint_concurrency or spec.get("endpoint_concurrency"),
+    )
+
+    shared_dir = os.path.join(output_dir, "_shared")
+    os.makedirs(shared_dir, exist_ok=True)
+    shared = SharedStageOutputs()
+
+    print(f"📐 {len(cells)} cell(s), up to {max_parallel_cells} in parallel")
+    cell_args = [(name, build_cell_args(overrides, os.path.join(output_dir, name))) for name, overrides in cells]
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_parallel_cells) as executor:
+        futures = {executor.submit(run_cell, name, args, shared, shared_dir, resume): name for name, args in cell_args}
+        for future, name in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"❌ Cell {name} failed: {e}")
+                traceback.print_exc()
+                failures.append(name)
+
+    print(f"\n📊 Stage outputs computed: {shared.computed}, reused across cells: {shared.reused}")
+    if failures:
+        raise RuntimeError(f"{len(failures)} cell(s) failed: {', '.join(failures)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an experiment grid, sharing identical stage outputs across cells.")
+    parser.add_argument("--spec", type=str, required=True, help="Path to the JSON grid spec.")
+    parser.add_argument("--output_dir", type=str, help="Directory for the cell results (overrides the spec).")
+    parser.add_argument("--max_parallel_cells", type=int, help="Number of cells running concurrently (overrides the spec).")
+    parser.add_argument("--llm_concurrency", type=int, help="Global limit of concurrent LLM calls (overrides the spec).")
+    parser.add_argument("--endpoint_concurrency", type=int, help="Global limit of concurrent endpoint requests (overrides the spec).")
+    parser.add_argument("--resume", type=Utils.str_to_bool, default=False, help="Resume stage journals of an interrupted matrix run.")
+    Utils.add_runtime_arguments(parser)
+    args = parser.parse_args()
+    Utils.configure_runtime(args, "matrix")
+
+    run_matrix(args.spec, args.output_dir, args.max_parallel_cells, args.llm_concurrency, args.endpoint_concurrency, args.resume)
+
+if __name__ == "__main__":
+    main()
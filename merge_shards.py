@@ -0,0 +1,86 @@
+import argparse
+import json
+from utility import Utils
+import verify_sparql
+import result_sidecar
+
+def interleave_shards(shards):
+    """
+    Restores the single-node question order from round-robin shards.
+    shards must be ordered by shard index; question i of the full run is question i // k of shard i % k.
+    """
+    shard_count = len(shards)
+    total = sum(len(shard) for shard in shards)
+
+    for shard_index, shard in enumerate(shards):
+        expected = len(range(shard_index, total, shard_count))
+        if len(shard) != expected:
+            raise ValueError(
+                f"Shard {shard_index} has {len(shard)} questions, expected {expected} for {total} questions in {shard_count} shards. "
+                "Are all shards complete and given in shard index order?"
+            )
+
+    return [shards[i % shard_count][i // shard_count] for i in range(total)]
+
+def merge_shards(shard_paths, output_path, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index, results_db=None, result_store_dir=None):
+    """Merges verified shard outputs into one experiment JSON and recomputes the summary metrics over all questions."""
+    shards = []
+    for shard_path in shard_paths:
+        with open(shard_path, "r", encoding="utf-8") as file:
+            shards.append(json.load(file))
+        print(f"📥 Loaded {len(shards[-1])} questions from {shard_path}")
+
+    data = interleave_shards(shards)
+    sidecar = result_sidecar.open_sidecar(result_store_dir)
+    result_sidecar.resolve_records(data, sidecar)
+
+    seen_ids = set()
+    for entry in data:
+        question_id = entry.get("baseline_id")
+        if question_id in seen_ids:
+            raise ValueError(f"Question ID {question_id} appears in more than one shard.")
+        seen_ids.add(question_id)
+        if not entry.get("sparql_comparison_result", {}).get("is_correct"):
+            print(f"⚠️ Question ID {question_id} has not been verified in its shard")
+
+    # The metrics only depend on the per-question classifications and token counts, so they match a single-node run
+    metrics = verify_sparql.compute_metrics(data)
+    summary_path = output_path.replace(".json", "_summary.txt")
+    verify_sparql.write_summary(summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index)
+    verify_sparql.store_results(results_db, data, summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index)
+
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump(result_sidecar.externalize_records(data, sidecar), file, indent=4, ensure_ascii=False)
+
+    print(f"✅ Merged {len(shards)} shards ({len(data)} questions) into {output_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge sharded experiment JSON files and recompute the evaluation summary.")
+    parser.add_argument("--inputs", nargs="+", required=True, help="Verified shard experiment JSON files, in shard index order.")
+    parser.add_argument("--output", type=str, required=True, help="Path of the merged experiment JSON.")
+    parser.add_argument("--sparql_endpoint_url", type=str, help="SPARQL endpoint URL used by the shards.")
+    parser.add_argument("--local_graph_location", type=str, help="Path to the local RDF graph used by the shards.")
+    parser.add_argument("--num_questions", type=int, help="Number of questions of the full run.")
+    parser.add_argument("--max_retries", type=int, help="Maximum number of consecutive retries.")
+    parser.add_argument("--log_dir", type=str, help="Directory to store logs.")
+    parser.add_argument("--llm_provider_sparql_generation", type=str, help="LLM provider for SPARQL generation.")
+    parser.add_argument("--llm_provider_entity_extraction", type=str, help="LLM provider for entity extraction.")
+    parser.add_argument("--model_entity_extraction", type=str, help="Model used for entity extraction.")
+    parser.add_argument("--model_sparql_generation", type=str, help="Model used for SPARQL generation.")
+    parser.add_argument("--benchmark_dataset", type=str, help="Benchmark dataset to use.")
+    parser.add_argument("--shape_type", type=str, help="Shape type for the dataset.")
+    parser.add_argument("--dataset_type", type=str, help="Type of dataset being processed.")
+    parser.add_argument("--annotation", type=str, help="Annotation type for the dataset.")
+    parser.add_argument("--baseline_run", type=Utils.str_to_bool, default=False, help="Indicates if this is a baseline run.")
+    parser.add_argument("--run_index", type=str, help="Run ID of the merged run.")
+    parser.add_argument("--results_db", type=str, help="SQLite results store the merged run is appended to (default: none).")
+    parser.add_argument("--result_store_dir", type=str, default="./cache/results", help="Result store the shards' query results are referenced in (\"None\" if they are inline).")
+    args = parser.parse_args()
+
+    if not args.output.endswith(".json"):
+        parser.error("--output must be a .json file.")
+
+    merge_shards(args.inputs, args.output, args.sparql_endpoint_url, args.local_graph_location, args.num_questions, args.max_retries, args.log_dir, args.llm_provider_sparql_generation, args.llm_provider_entity_extraction, args.model_entity_extraction, args.model_sparql_generation, args.benchmark_dataset, args.shape_type, args.dataset_type, args.annotation, args.baseline_run, args.run_index, args.results_db, args.result_store_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import copy
+
+# Fields of a record that exist once per language in multilingual runs
+LANGUAGE_FIELDS = ("baseline_question_text", "LLM_generated_sparql_query", "sparql_comparison_result")
+
+def parse_languages(spec):
+    """
+    Parses a --languages value: None for the default English-only run, "all" for every language
+    of each question, otherwise the list of language codes, e.g. "en,de,ru".
+    """
+    if spec in (None, "", "None"):
+        return None
+    if isinstance(spec, (list, tuple)):
+        return [str(language).strip().lower() for language in spec if str(language).strip()]
+    if spec.strip().lower() == "all":
+        return "all"
+    return [language.strip().lower() for language in spec.split(",") if language.strip()]
+
+def question_texts(entry, languages) -> dict:
+    """
+    Language → question string of a QALD entry for the selected languages.
+    Requested languages keep the requested order and are left out if the question lacks them; with "all",
+    English comes first and the others follow in benchmark order. The first language is the record's primary language.
+    """
+    available = {}
+    for question in entry.get("question", []):
+        if question.get("language") and question.get("string"):
+            available.setdefault(question["language"].lower(), question["string"])
+    if languages == "all":
+        order = sorted(available, key=lambda language: language != "en")
+    else:
+        order = [language for language in languages if language in available]
+    return {language: available[language] for language in order}
+
+def languages_of(entry) -> list:
+    """Languages of a multilingual record, primary language first; empty for single-language records."""
+    if not isinstance(entry, dict):
+        return []
+    return list(entry.get("baseline_question_texts") or {})
+
+def language_view(entry, language) -> dict:
+    """
+    Copy of a multilingual record as a single-language record of one language, for the code that reads
+    the top-level question, attempts and comparison. Language-independent fields are shared with the record.
+    """
+    view = {key: value for key, value in entry.items() if key not in ("languages", "baseline_question_texts")}
+    for field in LANGUAGE_FIELDS:
+        view.pop(field, None)
+    view.update(copy.deepcopy(entry.get("languages", {}).get(language, {})))
+    view["baseline_question_text"] = entry["baseline_question_texts"][language]
+    return view
+
+def store_view(entry, language, view):
+    """Writes the language fields of a view back into the record; the primary language is also kept at the top level."""
+    fields = {field: view[field] for field in LANGUAGE_FIELDS if field in view}
+    entry.setdefault("languages", {})[language] = fields
+    if languages_of(entry)[:1] == [language]:
+        entry.update(copy.deepcopy(fields))
+
+def split_by_language(data) -> dict:
+    """Language → single-language views of the multilingual records, for per-language metrics."""
+    views = {}
+    for entry in data:
+        for language in languages_of(entry):
+            if language in entry.get("languages", {}):
+                views.setdefault(language, []).append(language_view(entry, language))
+    return views
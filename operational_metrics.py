@@ -0,0 +1,151 @@
+import contextlib
+import contextvars
+import math
+import time
+
+# Counters of the question currently being processed in this thread (None outside of a question)
+_current = contextvars.ContextVar("question_usage", default=None)
+
+class QuestionUsage:
+    """Wall-clock time and call/byte/cache counters of one question in one stage."""
+
+    def __init__(self):
+        self.counters = {}
+        self.started_at = None
+        self.finished_at = None
+        self.wall_seconds = 0.0
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @classmethod
+    def from_record(cls, record, key: str = "operational_metrics"):
+        """The usage stored on a record by add_to, e.g. to move it to another record."""
+        usage = cls()
+        stored = record.get(key) if isinstance(record, dict) else None
+        if stored:
+            usage.wall_seconds = stored.get("wall_seconds", 0.0)
+            usage.started_at, usage.finished_at = stored.get("started_at"), stored.get("finished_at")
+            usage.counters = dict(stored.get("counters", {}))
+        return usage
+
+    def split(self, parts: int) -> list:
+        """
+        Divides the usage of work shared by several questions (e.g. one batched LLM call) into equal shares.
+        Counters stay integers, the first shares take the remainder, so the shares sum up to the original.
+        """
+        shares = []
+        for index in range(parts):
+            share = QuestionUsage()
+            share.started_at, share.finished_at = self.started_at, self.finished_at
+            share.wall_seconds = self.wall_seconds / parts
+            for name, amount in self.counters.items():
+                base, remainder = divmod(amount, parts)
+                if base + (index < remainder):
+                    share.counters[name] = base + (index < remainder)
+            shares.append(share)
+        return shares
+
+    def add_to(self, record, key: str = "operational_metrics"):
+        """
+        Adds the usage to the record's "operational_metrics", summing it with the stages that already ran.
+        The metrics travel with the record through the experiment JSON and the stage journals.
+        """
+        if not isinstance(record, dict):
+            return record
+        usage = record.setdefault(key, {})
+        usage["wall_seconds"] = round(usage.get("wall_seconds", 0.0) + self.wall_seconds, 6)
+        usage["started_at"] = min(filter(None, (usage.get("started_at"), self.started_at)), default=None)
+        usage["finished_at"] = max(filter(None, (usage.get("finished_at"), self.finished_at)), default=None)
+        counters = usage.setdefault("counters", {})
+        for name, amount in self.counters.items():
+            counters[name] = counters.get(name, 0) + amount
+        return record
+
+@contextlib.contextmanager
+def measure():
+    """Collects the usage of the enclosed per-question work; call add_to(record) on the yielded object afterwards."""
+    usage = QuestionUsage()
+    token = _current.set(usage)
+    usage.started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        usage.wall_seconds = time.perf_counter() - start
+        usage.finished_at = time.time()
+        _current.reset(token)
+
+def count(name: str, amount: int = 1):
+    """Increments a counter of the current question; a no-op outside of measure()."""
+    usage = _current.get()
+    if usage is not None:
+        usage.count(name, amount)
+
+def absorb(usage: QuestionUsage):
+    """Adds the counters of work measured in a worker thread of the current question (e.g. one language) to it."""
+    for name, amount in usage.counters.items():
+        count(name, amount)
+
+def cache(name: str, hit: bool):
+    """Records a lookup in one of the caches (local graphs, gold answers, result store, ...)."""
+    count(f"{name}_cache_hits" if hit else f"{name}_cache_misses")
+
+def payload_size(value) -> int:
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value or b"")
+
+def summarize_records(data) -> dict:
+    """Aggregates the operational metrics of all records of a run."""
+    counters = {}
+    wall_seconds = 0.0
+    measured = 0
+    started, finished = [], []
+    # Records of matrix cells whose stage outputs were computed by another cell (matrix.attribute_usage)
+    shared = sum(1 for entry in data if isinstance(entry, dict) and entry.get("shared_operational_metrics"))
+    for entry in data:
+        usage = entry.get("operational_metrics") if isinstance(entry, dict) else None
+        if not usage:
+            continue
+        measured += 1
+        wall_seconds += usage.get("wall_seconds", 0.0)
+        if usage.get("started_at"):
+            started.append(usage["started_at"])
+        if usage.get("finished_at"):
+            finished.append(usage["finished_at"])
+        for name, amount in usage.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + amount
+
+    # Elapsed time from the first question starting to the last one finishing, across all stages and processes
+    run_wall_seconds = max(finished) - min(started) if started and finished else 0.0
+
+    cache_hit_rates = {}
+    for name in sorted({key.rsplit("_cache_", 1)[0] for key in counters if "_cache_" in key}):
+        hits, misses = counters.get(f"{name}_cache_hits", 0), counters.get(f"{name}_cache_misses", 0)
+        cache_hit_rates[name] = hits / (hits + misses) if hits + misses else 0.0
+    total_hits = sum(amount for key, amount in counters.items() if key.endswith("_cache_hits"))
+    total_lookups = total_hits + sum(amount for key, amount in counters.items() if key.endswith("_cache_misses"))
+
+    return {
+        "measured_questions": measured,
+        "shared_questions": shared,
+        "wall_seconds": wall_seconds,
+        "avg_wall_seconds_per_question": wall_seconds / measured if measured else 0.0,
+        "run_wall_seconds": run_wall_seconds,
+        "throughput_qpm": measured * 60 / run_wall_seconds if run_wall_seconds > 0 else 0.0,
+        "llm_calls": counters.get("llm_calls", 0),
+        "endpoint_queries": counters.get("endpoint_queries", 0),
+        "graph_queries": counters.get("graph_queries", 0),
+        "bytes_sent": counters.get("bytes_sent", 0),
+        "bytes_received": counters.get("bytes_received", 0),
+        "cache_hit_rate": total_hits / total_lookups if total_lookups else 0.0,
+        "cache_hit_rates": cache_hit_rates,
+        "counters": counters,
+    }
+
+def time_normalized_accuracy(ena_score, avg_wall_seconds):
+    """
+    ENA additionally discounted by the wall-clock seconds per question.
+    The factor 1 + log10(1 + seconds) is 1 for instant questions, so the score equals ENA there
+    and drops by a constant step for every order of magnitude of latency.
+    """
+    return ena_score / (1 + math.log10(1 + max(avg_wall_seconds, 0.0)))
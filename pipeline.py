@@ -0,0 +1,389 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import tracing
+import operational_metrics
+from utility import Utils
+from journal import StageJournal
+import extract_entity_list
+import generate_shape
+import call_llm_api
+import verify_sparql
+import result_sidecar
+import retry_policy
+import multilingual
+import compact_shape
+
+STAGES = ["extract_entity_list", "generate_shape", "call_llm_api", "verify_sparql"]
+
+def open_journals(args):
+    """Opens one append-only journal per stage next to the experiment JSON (resuming them with --resume)."""
+    return {stage: StageJournal(StageJournal.path_for(args.json_path, stage), args.resume) for stage in STAGES}
+
+def load_gold(args):
+    """Returns the embedded gold answers of the benchmark with --gold_answers, otherwise None."""
+    if not args.gold_answers:
+        return None
+    import gold_answers
+    return gold_answers.load_gold_answers(args.benchmark_dataset, args.gold_cache_dir)
+
+def load_label_index(args):
+    """Returns the memory-mapped label index given with --label_index, otherwise None."""
+    if args.label_index in (None, "", "None"):
+        return None
+    import label_index
+    return label_index.open_index(args.label_index)
+
+def run_extract_stage(args, num_questions, journal=None):
+    """Stage 1: load the benchmark, execute gold queries and extract/resolve entities."""
+    questions_list = extract_entity_list.load_benchmark_questions(
+        args.benchmark_dataset, num_questions, args.shard_index, args.shard_count, args.question_ids, args.sample_size, args.sample_seed
+    )
+    return extract_entity_list.transform_questions(
+        questions_list, args.api_key_entity_extraction, args.model_entity_extraction, args.llm_provider_entity_extraction,
+        args.is_local_graph, args.local_graph_location, args.sparql_endpoint_url, args.system_prompt_entity_extraction,
+        args.max_tokens_entity_extraction, args.temperature_entity_extraction, args.dataset_type, args.baseline_run, journal,
+        load_gold(args), load_label_index(args), args.label_index_fallback,
+        args.batch_size_entity_extraction, args.system_prompt_entity_extraction_batch, multilingual.parse_languages(args.languages)
+    )
+
+def run_shape_stage(args, data, journal=None):
+    """
+    Stage 2: generate shapes for the in-memory records.
+    Returns a dict of question ID (or "local_graph") to shape text for the SPARQL generation stage.
+    """
+    if args.baseline_run:
+        print("⚠️ Baseline run is enabled. No shape generation will occur.")
+        return {}
+
+    if args.is_local_graph:
+        shape = generate_shape.generate_shape_from_local_graph(
+            args.local_graph_location, args.shape_output_path, args.shape_type, args.existing_shape_path, args.shape_cache_dir
+        )
+        return {"local_graph": shape} if shape else {}
+
+    return generate_shape.generate_shapes_for_records(
+        data, args.shape_output_path, args.shape_type, args.dataset_type, args.annotation, args.sparql_endpoint_url, journal
+    )
+
+def run_generate_stage(args, data, shapes, journal=None):
+    """Stage 3: generate and execute SPARQL queries with the LLM."""
+    return call_llm_api.process_records(
+        data, args.shape_output_path, args.system_prompt_sparql_generation, args.api_key_sparql_generation,
+        args.model_sparql_generation, args.max_tokens_sparql_generation, args.temperature_sparql_generation,
+        args.llm_provider_sparql_generation, args.is_local_graph, args.max_retries, args.sparql_endpoint_url,
+        args.local_graph_location, args.shape_type, args.dataset_type, args.baseline_run,
+        args.system_prompt_sparql_generation_baseline_run, shapes=shapes, journal=journal,
+        sidecar=result_sidecar.open_sidecar(args.result_store_dir), policy=retry_policy.from_args(args),
+        shape_format=args.shape_format
+    )
+
+def run_verify_stage(args, data, journal=None):
+    """Stage 4: verify the generated queries against the gold answers and write the summary."""
+    metrics = verify_sparql.verify_records(
+        data, args.sparql_endpoint_url, args.is_local_graph, args.local_graph_location, journal, load_gold(args), args.gold_drift_check,
+        result_sidecar.open_sidecar(args.result_store_dir)
+    )
+    write_run_results(args, data, metrics)
+    return metrics
+
+def write_run_results(args, data, metrics):
+    """Writes the text summary next to the experiment JSON and appends the run to the results store."""
+    summary_path = args.json_path.replace(".json", "_summary.txt")
+    summary_args = (
+        summary_path, metrics, args.sparql_endpoint_url, args.local_graph_location, args.num_questions, args.max_retries,
+        args.log_dir, args.llm_provider_sparql_generation, args.llm_provider_entity_extraction, args.model_entity_extraction,
+        args.model_sparql_generation, args.benchmark_dataset, args.shape_type, args.dataset_type, args.annotation,
+        args.baseline_run, args.run_index
+    )
+    verify_sparql.write_summary(*summary_args)
+    verify_sparql.store_results(args.results_db, data, *summary_args)
+
+def timed_stage(stage_name, func, *args):
+    """Runs one stage function and prints its wall-clock duration."""
+    print(f"\n🚀 Stage {stage_name}")
+    start = time.perf_counter()
+    with tracing.span("stage", stage=stage_name):
+        result = func(*args)
+    print(f"⏱️ Stage {stage_name} finished in {time.perf_counter() - start:.1f}s")
+    return result
+
+def run_pipeline(args):
+    """Runs extract → shape → generate → verify in one process, handing the records over in memory."""
+    num_questions = None if args.num_questions in (None, 0) else args.num_questions
+
+    journals = open_journals(args)
+
+    data = timed_stage("extract_entity_list", run_extract_stage, args, num_questions, journals["extract_entity_list"])
+    shapes = timed_stage("generate_shape", run_shape_stage, args, data, journals["generate_shape"])
+    timed_stage("call_llm_api", run_generate_stage, args, data, shapes, journals["call_llm_api"])
+    timed_stage("verify_sparql", run_verify_stage, args, data, journals["verify_sparql"])
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+    with tracing.span("file.write", path=args.json_path), open(args.json_path, "w", encoding="utf-8") as file:
+        json.dump(result_sidecar.externalize_records(data, result_sidecar.open_sidecar(args.result_store_dir)), file, indent=4, ensure_ascii=False)
+
+    print(f"✅ Pipeline finished, results saved to {args.json_path}")
+    return data
+
+_STOP = object()
+
+def stage_worker(stage_name, func, in_queue, out_queue, state):
+    """
+    Consumes (index, record) items from in_queue, applies func and forwards the result.
+    The last worker of a stage to finish passes one stop marker per downstream worker on.
+    After the first failure in any stage, records are drained without being processed.
+    """
+    while True:
+        item = in_queue.get()
+        if item is _STOP:
+            break
+        index, record = item
+        if state["failed"].is_set():
+            continue
+        try:
+            out_queue.put((index, func(record)))
+        except Exception as e:
+            print(f"❌ Stage {stage_name} failed for record {index}: {e}")
+            state["errors"].append(e)
+            state["failed"].set()
+
+    with state["lock"]:
+        state["running"][stage_name] -= 1
+        last_worker = state["running"][stage_name] == 0
+    if last_worker:
+        for _ in range(state["downstream_workers"][stage_name]):
+            out_queue.put(_STOP)
+
+def run_streaming_pipeline(args):
+    """
+    Streams every question independently through extract → shape → generate → verify.
+    Stages are connected by bounded queues and run in their own worker threads, so endpoint-bound
+    and LLM-bound stages overlap instead of each stage waiting for all questions of the previous one.
+    """
+    num_questions = None if args.num_questions in (None, 0) else args.num_questions
+    questions_list = extract_entity_list.load_benchmark_questions(
+        args.benchmark_dataset, num_questions, args.shard_index, args.shard_count, args.question_ids, args.sample_size, args.sample_seed
+    )
+    if args.batch_size_entity_extraction > 1:
+        print("⚠️ Streaming extracts the entities of every question separately, --batch_size_entity_extraction is ignored.")
+
+    # The local graph shape covers all questions, so it's produced once before streaming starts
+    local_shape_data = None
+    if args.is_local_graph and not args.baseline_run:
+        local_shape_data = run_shape_stage(args, []).get("local_graph")
+        if local_shape_data is None:
+            local_shape_data = call_llm_api.load_local_shape(args.shape_output_path, args.shape_type)
+
+    system_prompt = call_llm_api.load_system_prompt(
+        args.system_prompt_sparql_generation, args.baseline_run, args.system_prompt_sparql_generation_baseline_run
+    )
+    journals = open_journals(args)
+    gold = load_gold(args)
+    labels = load_label_index(args)
+    sidecar = result_sidecar.open_sidecar(args.result_store_dir)
+    policy = retry_policy.from_args(args)
+    languages = multilingual.parse_languages(args.languages)
+
+    def extract(entry):
+        journal = journals["extract_entity_list"]
+        if journal.is_completed(entry.get("id")):
+            return journal.get(entry.get("id"))
+        with tracing.context(question_id=entry.get("id")), operational_metrics.measure() as usage:
+            record = extract_entity_list.transform_entry(
+                entry, args.api_key_entity_extraction, args.model_entity_extraction, args.llm_provider_entity_extraction,
+                args.is_local_graph, args.local_graph_location, args.sparql_endpoint_url, args.system_prompt_entity_extraction,
+                args.max_tokens_entity_extraction, args.temperature_entity_extraction, args.dataset_type, args.baseline_run, gold,
+                labels, args.label_index_fallback, languages=languages
+            )
+        usage.add_to(record)
+        journal.append(entry.get("id"), record)
+        return record
+
+    def shape(record):
+        # Records travel together with their shape text between the shape and generation stages
+        if args.baseline_run or args.is_local_graph:
+            return record, {}
+        question_id = record.get("baseline_id")
+        journal = journals["generate_shape"]
+        if journal.is_completed(question_id):
+            shape_text = journal.get(question_id)["shape"]
+            generate_shape.restore_journaled_shape(question_id, shape_text, args.shape_output_path, args.shape_type)
+            if journal.get(question_id).get("operational_metrics"):
+                record["operational_metrics"] = journal.get(question_id)["operational_metrics"]
+        else:
+            with tracing.context(question_id=question_id), operational_metrics.measure() as usage:
+                shape_text = generate_shape.generate_shape_for_entry(
+                    record, args.shape_output_path, args.shape_type, args.dataset_type, args.annotation, args.sparql_endpoint_url
+                )
+                if args.dataset_type == "wikidata":
+                    Utils.throttle(15, "wikidata_rate_limit", args.sparql_endpoint_url)  # adjust if needed
+            usage.add_to(record)
+            journal.append(question_id, {"shape": shape_text, "operational_metrics": record.get("operational_metrics")})
+        return record, ({question_id: shape_text} if shape_text else {})
+
+    def generate(record_with_shapes):
+        record, record_shapes = record_with_shapes
+        journal = journals["call_llm_api"]
+        if journal.is_completed(record.get("baseline_id")):
+            record.update(journal.get(record.get("baseline_id")))
+            return result_sidecar.resolve_entry(record, sidecar)
+        call_llm_api.process_entry(
+            record, system_prompt, local_shape_data, args.shape_output_path, record_shapes, args.api_key_sparql_generation,
+            args.model_sparql_generation, args.max_tokens_sparql_generation, args.temperature_sparql_generation,
+            args.llm_provider_sparql_generation, args.is_local_graph, args.max_retries, args.sparql_endpoint_url,
+            args.local_graph_location, args.shape_type, args.dataset_type, args.baseline_run, policy, args.shape_format
+        )
+        journal.append(record.get("baseline_id"), result_sidecar.externalize_entry(record, sidecar))
+        return record
+
+    def verify(record):
+        journal = journals["verify_sparql"]
+        if journal.is_completed(record.get("baseline_id")):
+            record.update(journal.get(record.get("baseline_id")))
+            return result_sidecar.resolve_entry(record, sidecar)
+        with tracing.context(question_id=record.get("baseline_id")), operational_metrics.measure() as usage:
+            verify_sparql.verify_entry(record, args.sparql_endpoint_url, args.is_local_graph, args.local_graph_location, gold, args.gold_drift_check)
+            if verify_sparql.queries_endpoint(record, args.is_local_graph, gold, args.gold_drift_check):
+                Utils.throttle(1, "endpoint_throttle", args.sparql_endpoint_url)  # avoid overloading the endpoint
+        usage.add_to(record)
+        journal.append(record.get("baseline_id"), result_sidecar.externalize_entry(record, sidecar))
+        return record
+
+    stages = [("extract_entity_list", extract), ("generate_shape", shape), ("call_llm_api", generate), ("verify_sparql", verify)]
+    workers = args.stage_workers
+    queues = [queue.Queue(maxsize=args.queue_size) for _ in range(len(stages))]
+    results_queue = queue.Queue()
+    state = {
+        "lock": threading.Lock(),
+        "failed": threading.Event(),
+        "errors": [],
+        "running": {stage_name: workers for stage_name, _ in stages},
+        "downstream_workers": {stage_name: (workers if i + 1 < len(stages) else 1) for i, (stage_name, _) in enumerate(stages)},
+    }
+
+    threads = []
+    for i, (stage_name, func) in enumerate(stages):
+        out_queue = queues[i + 1] if i + 1 < len(stages) else results_queue
+        for _ in range(workers):
+            thread = threading.Thread(target=stage_worker, args=(stage_name, func, queues[i], out_queue, state), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    start = time.perf_counter()
+    for index, entry in enumerate(questions_list):
+        queues[0].put((index, entry))
+    for _ in range(workers):
+        queues[0].put(_STOP)
+
+    results = []
+    while True:
+        item = results_queue.get()
+        if item is _STOP:
+            break
+        results.append(item)
+
+    for thread in threads:
+        thread.join()
+
+    if state["errors"]:
+        raise state["errors"][0]
+
+    data = [record for _, record in sorted(results, key=lambda item: item[0])]
+    print(f"⏱️ Streaming stages finished in {time.perf_counter() - start:.1f}s")
+
+    write_run_results(args, data, verify_sparql.compute_metrics(data))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+    with tracing.span("file.write", path=args.json_path), open(args.json_path, "w", encoding="utf-8") as file:
+        json.dump(result_sidecar.externalize_records(data, sidecar), file, indent=4, ensure_ascii=False)
+
+    print(f"✅ Streaming pipeline finished, results saved to {args.json_path}")
+    return data
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the complete pipeline (extract → shape → generate → verify) in a single process.")
+    parser.add_argument("--benchmark_dataset", type=str, required=True, help="Path to the input benchmark JSON file.")
+    parser.add_argument("--json_path", type=str, required=True, help="Path of the experiment JSON written at the end of the run.")
+    parser.add_argument("--shape_output_path", type=str, required=True, help="Directory for saving generated shapes.")
+    parser.add_argument("--num_questions", type=int, default=0, help="Number of questions to process (0 = all).")
+    parser.add_argument("--llm_provider_entity_extraction", type=str, default="openai")
+    parser.add_argument("--llm_provider_sparql_generation", type=str, default="openai")
+    parser.add_argument("--model_entity_extraction", type=str, default="gpt-4o-mini")
+    parser.add_argument("--model_sparql_generation", type=str, default="gpt-4o-mini")
+    parser.add_argument("--api_key_entity_extraction", type=str, default="")
+    parser.add_argument("--api_key_sparql_generation", type=str, default="")
+    parser.add_argument("--max_tokens_entity_extraction", type=int, default=50)
+    parser.add_argument("--temperature_entity_extraction", type=float, default=0.2)
+    parser.add_argument("--max_tokens_sparql_generation", type=int, default=512)
+    parser.add_argument("--temperature_sparql_generation", type=float, default=0.2)
+    parser.add_argument("--system_prompt_entity_extraction", type=str, default="./prompts/system_prompt_entity_extraction.txt")
+    parser.add_argument("--system_prompt_entity_extraction_batch", type=str, default="./prompts/system_prompt_entity_extraction_batch.txt")
+    parser.add_argument("--batch_size_entity_extraction", type=int, default=1, help="Questions whose entities are extracted with one LLM call (1 = one call per question).")
+    parser.add_argument("--system_prompt_sparql_generation", type=str, default="./prompts/system_prompt_SPARQL_generation.txt")
+    parser.add_argument("--system_prompt_sparql_generation_baseline_run", type=str, default="./prompts/system_prompt_SPARQL_generation_baseline_run.txt")
+    parser.add_argument("--is_local_graph", type=Utils.str_to_bool, required=True, help="Set True or False.")
+    parser.add_argument("--local_graph_location", type=str, help="Path to the local RDF graph folder.")
+    parser.add_argument("--sparql_endpoint_url", type=str, help="SPARQL endpoint URL (ignored if --is_local_graph is used).")
+    parser.add_argument("--existing_shape_path", type=str, help="Path to an existing shape file for SHACL generation.")
+    parser.add_argument("--shape_cache_dir", type=str, default="./cache/shapes", help="Directory for caching local graph shapes.")
+    parser.add_argument("--shape_type", type=str, choices=["shex", "shacl"], required=True)
+    parser.add_argument("--shape_format", type=str, choices=compact_shape.FORMATS, default=compact_shape.NATIVE, help="Shape serialization in the SPARQL generation prompt: the shape text or one compact line per property.")
+    parser.add_argument("--dataset_type", type=str, choices=["wikidata", "dbpedia", "corporate_graphs"], required=True)
+    parser.add_argument("--annotation", type=Utils.str_to_bool, default=False)
+    parser.add_argument("--baseline_run", type=Utils.str_to_bool, default=False)
+    parser.add_argument("--max_retries", type=int, default=2)
+    parser.add_argument("--log_dir", type=str, help="Directory to store logs.")
+    parser.add_argument("--run_index", type=str, help="Run ID for the current execution.")
+    parser.add_argument("--resume", type=Utils.str_to_bool, default=False, help="Skip questions already completed in the stage journals and compact them into the experiment JSON.")
+    parser.add_argument("--languages", type=str, help="Multilingual run: generate SPARQL for the questions in these languages (e.g. \"en,de,ru\" or \"all\") concurrently, sharing entities, shapes and gold answers.")
+    parser.add_argument("--question_ids", type=str, help="Only process these question IDs, e.g. \"1-50,77,100-\".")
+    parser.add_argument("--sample_size", type=int, help="Process a uniform random sample of this many questions.")
+    parser.add_argument("--sample_seed", type=int, default=0, help="Seed of the random sample.")
+    parser.add_argument("--shard_index", type=int, default=0, help="Index of the shard processed by this node (0-based).")
+    parser.add_argument("--shard_count", type=int, default=1, help="Total number of shards the questions are split into.")
+    parser.add_argument("--llm_concurrency", type=int, help="Limit of concurrent LLM calls in this process (default: unlimited).")
+    parser.add_argument("--endpoint_concurrency", type=int, help="Limit of concurrent endpoint requests in this process (default: unlimited).")
+    parser.add_argument("--streaming", type=Utils.str_to_bool, default=False, help="Stream each question through all stages with overlapped stage workers.")
+    parser.add_argument("--stage_workers", type=int, default=1, help="Worker threads per stage in streaming mode.")
+    parser.add_argument("--results_db", type=str, help="SQLite results store the run is appended to (default: none).")
+    parser.add_argument("--result_store_dir", type=str, default="./cache/results", help="Content-addressed store for query results referenced from the JSON (\"None\" keeps results inline).")
+    parser.add_argument("--gold_answers", type=Utils.str_to_bool, default=False, help="Use the benchmark's embedded answers instead of executing the gold queries.")
+    parser.add_argument("--gold_cache_dir", type=str, default="./cache/gold", help="Directory of the gold answer indexes.")
+    parser.add_argument("--label_index", type=str, help="Label index (see label_index.py) used to resolve entity names before querying the endpoint.")
+    parser.add_argument("--label_index_fallback", type=Utils.str_to_bool, default=True, help="Query the endpoint for names missing from the label index (False resolves offline only).")
+    parser.add_argument("--gold_drift_check", type=Utils.str_to_bool, default=False, help="With --gold_answers, also re-execute the gold queries during verification and report drift.")
+    parser.add_argument("--queue_size", type=int, default=4, help="Capacity of the bounded queues between stages in streaming mode.")
+    retry_policy.add_arguments(parser)
+    Utils.add_runtime_arguments(parser)
+    return parser
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.num_questions < 0:
+        parser.error("--num_questions must be zero or a positive integer.")
+    if args.is_local_graph and not args.local_graph_location:
+        parser.error("--local_graph_location is required when --is_local_graph is True.")
+    if not args.is_local_graph and not args.sparql_endpoint_url:
+        parser.error("--sparql_endpoint_url is required when --is_local_graph is False.")
+    if args.stage_workers < 1 or args.queue_size < 1:
+        parser.error("--stage_workers and --queue_size must be positive integers.")
+    if args.shape_cache_dir in ("", "None"):
+        args.shape_cache_dir = None
+
+    print(f"⚠️ baseline_run: {args.baseline_run}")
+    print(f"✅ is_local_graph: {args.is_local_graph}")
+    Utils.configure_concurrency(args.llm_concurrency, args.endpoint_concurrency)
+    Utils.configure_runtime(args, "pipeline")
+    if args.streaming:
+        run_streaming_pipeline(args)
+    else:
+        run_pipeline(args)
+
+if __name__ == "__main__":
+    main()
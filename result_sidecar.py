@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+
+MAGIC = b"RSC1"
+HEADER = struct.Struct("<4sBI")  # magic, flags, number of values
+FLAG_ZLIB = 1
+PREVIEW_SIZE = 5
+
+# Payloads smaller than this are stored uncompressed, zlib would not save anything worth the CPU
+COMPRESSION_THRESHOLD = 256
+
+class ResultSidecar:
+    """
+    Content-addressed store for SPARQL result lists, kept outside the experiment JSON.
+    Every distinct result set is written once to <store_dir>/<xx>/<sha256>.rsc as a small header
+    (value count) plus a zlib-compressed JSON payload. Files are immutable and read through mmap,
+    so counts can be read without decompressing and identical results of different attempts,
+    questions and runs share one file.
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.store_dir, digest[:2], f"{digest}.rsc")
+
+    def put(self, values: list) -> str:
+        """Stores a result list unless the same content is already stored and returns its hash."""
+        payload = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            return digest
+
+        flags = 0
+        if len(payload) >= COMPRESSION_THRESHOLD:
+            compressed = zlib.compress(payload, 6)
+            if len(compressed) < len(payload):
+                payload, flags = compressed, FLAG_ZLIB
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, flags, len(values)))
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return digest
+
+    def _open(self, digest: str):
+        path = self._path(digest)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Result {digest} not found in result store {self.store_dir}")
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, flags, count = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC:
+            mapped.close()
+            raise ValueError(f"Invalid result file {path}")
+        return mapped, flags, count
+
+    def count(self, digest: str) -> int:
+        mapped, _, count = self._open(digest)
+        mapped.close()
+        return count
+
+    def get(self, digest: str) -> list:
+        mapped, flags, _ = self._open(digest)
+        try:
+            payload = mapped[HEADER.size:]
+        finally:
+            mapped.close()
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+
+def open_sidecar(store_dir):
+    """Returns the result store of a --result_store_dir argument, or None if results stay inline."""
+    if store_dir in (None, "", "None"):
+        return None
+    return ResultSidecar(store_dir)
+
+def externalize_entry(entry, sidecar):
+    """
+    Returns a copy of an experiment record whose attempt results are replaced by a reference,
+    the value count and a short preview. Error results and empty lists stay inline.
+    """
+    if sidecar is None or not isinstance(entry, dict) or not entry.get("LLM_generated_sparql_query"):
+        return entry
+
+    externalized = {**entry, "LLM_generated_sparql_query": _externalize_attempts(entry["LLM_generated_sparql_query"], sidecar)}
+    # The attempts of each language of a multilingual record (see multilingual.py)
+    if entry.get("languages"):
+        externalized["languages"] = {
+            language: {**fields, "LLM_generated_sparql_query": _externalize_attempts(fields["LLM_generated_sparql_query"], sidecar)}
+            if fields.get("LLM_generated_sparql_query") else fields
+            for language, fields in entry["languages"].items()
+        }
+    return externalized
+
+def _externalize_attempts(attempts, sidecar):
+    externalized = []
+    for attempt in attempts:
+        result = attempt.get("result")
+        if isinstance(result, list) and result:
+            attempt = {key: value for key, value in attempt.items() if key != "result"}
+            attempt["result_ref"] = sidecar.put(result)
+            attempt["result_count"] = len(result)
+            attempt["result_preview"] = result[:PREVIEW_SIZE]
+        externalized.append(attempt)
+    return externalized
+
+def externalize_records(data, sidecar):
+    if sidecar is None:
+        return data
+    return [externalize_entry(entry, sidecar) for entry in data]
+
+def resolve_entry(entry, sidecar):
+    """Loads the results of referenced attempts back into the record (in place)."""
+    if not isinstance(entry, dict):
+        return entry
+    attempts = list(entry.get("LLM_generated_sparql_query", []) or [])
+    for fields in (entry.get("languages") or {}).values():
+        attempts.extend(fields.get("LLM_generated_sparql_query", []) or [])
+    for attempt in attempts:
+        if "result" not in attempt and "result_ref" in attempt:
+            if sidecar is None:
+                raise ValueError(
+                    f"Question ID {entry.get('baseline_id')} references stored results, but no --result_store_dir was given."
+                )
+            attempt["result"] = sidecar.get(attempt["result_ref"])
+    return entry
+
+def resolve_records(data, sidecar):
+    for entry in data:
+        resolve_entry(entry, sidecar)
+    return data
+
+def inline_records(data, sidecar):
+    """Resolves the referenced results of the records and drops the references, so the JSON no longer needs the store."""
+    resolve_records(data, sidecar)
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        attempts = list(entry.get("LLM_generated_sparql_query", []) or [])
+        for fields in (entry.get("languages") or {}).values():
+            attempts.extend(fields.get("LLM_generated_sparql_query", []) or [])
+        for attempt in attempts:
+            for key in ("result_ref", "result_count", "result_preview"):
+                attempt.pop(key, None)
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a copy of an experiment JSON with its stored query results inline, e.g. to archive it without the result store.")
+    parser.add_argument("--input", type=str, required=True, help="Experiment JSON referencing stored results.")
+    parser.add_argument("--output", type=str, required=True, help="Path of the self-contained copy.")
+    parser.add_argument("--result_store_dir", type=str, default="./cache/results", help="Result store referenced by the experiment JSON.")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        data = inline_records(json.load(f), open_sidecar(args.result_store_dir))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmp_path = f"{args.output}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, args.output)
+    print(f"✅ Wrote {args.output} with results inline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,474 @@
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+from datetime import datetime
+import run_allocator
+
+# Column order of results.csv
+CSV_COLUMNS = [
+    "id", "file", "llm_sparql", "llm_entity", "model_entity", "model_sparql", "benchmark", "shape_type", "dataset_type",
+    "annotation", "baseline_run", "num_questions", "max_retries", "prompt_tokens", "completion_tokens", "total_tokens",
+    "avg_prompt_tokens", "avg_completion_tokens", "avg_total_tokens", "total_retries", "avg_retries", "tp", "fp", "fn",
+    "invalid", "precision", "recall", "f1_score", "accuracy", "ena", "avg_wall_seconds", "run_wall_seconds", "throughput_qpm",
+    "llm_calls", "endpoint_queries", "graph_queries", "bytes_sent", "bytes_received", "cache_hit_rate", "time_normalized_ena",
+    "shape_format", "avg_shape_tokens", "avg_shape_tokens_saved",
+]
+
+# Columns that are rounded like in the text summary when exported
+ROUNDED_COLUMNS = {
+    "avg_prompt_tokens", "avg_completion_tokens", "avg_total_tokens", "avg_retries", "precision", "recall", "f1_score", "accuracy", "ena",
+    "avg_wall_seconds", "run_wall_seconds", "throughput_qpm", "cache_hit_rate", "time_normalized_ena", "avg_shape_tokens",
+    "avg_shape_tokens_saved",
+}
+
+# Summary label → column, for importing summaries written before the results store existed
+SUMMARY_LABELS = {
+    "LLM Provider for SPARQL Generation": "llm_sparql",
+    "LLM Provider for Entity Extraction": "llm_entity",
+    "Model for Entity Extraction": "model_entity",
+    "Model for SPARQL Generation": "model_sparql",
+    "Benchmark Dataset": "benchmark",
+    "Shape Type": "shape_type",
+    "Dataset Type": "dataset_type",
+    "Annotation": "annotation",
+    "Baseline Run": "baseline_run",
+    "SPARQL Endpoint URL": "sparql_endpoint_url",
+    "Local Graph Location": "local_graph_location",
+    "Number of Questions": "num_questions",
+    "Max Retries": "max_retries",
+    "Log Directory": "log_dir",
+    "ID": "id",
+    "Total Prompt Tokens": "prompt_tokens",
+    "Total Completion Tokens": "completion_tokens",
+    "Total Tokens": "total_tokens",
+    "Average Prompt Tokens per Q": "avg_prompt_tokens",
+    "Average Completion Tokens per Q": "avg_completion_tokens",
+    "Average Total Tokens per Q": "avg_total_tokens",
+    "Total Retries": "total_retries",
+    "Avg. Retries per Q": "avg_retries",
+    "True Positives (TP)": "tp",
+    "False Positives (FP)": "fp",
+    "False Negatives (FN)": "fn",
+    "Invalid Baseline Entries": "invalid",
+    "Precision": "precision",
+    "Recall": "recall",
+    "F1-score": "f1_score",
+    "Execution Accuracy (TP rate)": "accuracy",
+    "Effort-Normalized Accuracy (ENA)": "ena",
+    "Avg. Wall-Clock Seconds per Q": "avg_wall_seconds",
+    "Run Wall-Clock Seconds": "run_wall_seconds",
+    "Throughput (Qs/min)": "throughput_qpm",
+    "LLM Calls": "llm_calls",
+    "Endpoint Queries": "endpoint_queries",
+    "Local Graph Queries": "graph_queries",
+    "Bytes Sent": "bytes_sent",
+    "Bytes Received": "bytes_received",
+    "Cache Hit Rate": "cache_hit_rate",
+    "Time-Normalized ENA (T-ENA)": "time_normalized_ena",
+    "Shape Format": "shape_format",
+    "Avg. Prompt Shape Tokens per Q": "avg_shape_tokens",
+    "Avg. Shape Tokens Saved per Q": "avg_shape_tokens_saved",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_pk INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    file TEXT NOT NULL,
+    created TEXT NOT NULL,
+    llm_sparql TEXT,
+    llm_entity TEXT,
+    model_entity TEXT,
+    model_sparql TEXT,
+    benchmark TEXT,
+    shape_type TEXT,
+    dataset_type TEXT,
+    annotation TEXT,
+    baseline_run TEXT,
+    sparql_endpoint_url TEXT,
+    local_graph_location TEXT,
+    log_dir TEXT,
+    num_questions INTEGER,
+    max_retries INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER,
+    avg_prompt_tokens REAL,
+    avg_completion_tokens REAL,
+    avg_total_tokens REAL,
+    total_retries INTEGER,
+    avg_retries REAL,
+    tp INTEGER,
+    fp INTEGER,
+    fn INTEGER,
+    invalid INTEGER,
+    precision REAL,
+    recall REAL,
+    f1_score REAL,
+    accuracy REAL,
+    ena REAL,
+    avg_wall_seconds REAL,
+    run_wall_seconds REAL,
+    throughput_qpm REAL,
+    llm_calls INTEGER,
+    endpoint_queries INTEGER,
+    graph_queries INTEGER,
+    bytes_sent INTEGER,
+    bytes_received INTEGER,
+    cache_hit_rate REAL,
+    time_normalized_ena REAL,
+    shape_format TEXT,
+    avg_shape_tokens REAL,
+    avg_shape_tokens_saved REAL,
+    UNIQUE (id, file)
+);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (benchmark, dataset_type, shape_type, model_sparql);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created);
+
+CREATE TABLE IF NOT EXISTS questions (
+    run_pk INTEGER NOT NULL REFERENCES runs (run_pk) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    question_id TEXT,
+    question_text TEXT,
+    classification TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER,
+    failed_attempts INTEGER,
+    gold_count INTEGER,
+    llm_count INTEGER,
+    wall_seconds REAL,
+    llm_calls INTEGER,
+    endpoint_queries INTEGER,
+    bytes_transferred INTEGER,
+    shape_tokens INTEGER,
+    shape_tokens_saved INTEGER,
+    PRIMARY KEY (run_pk, position)
+);
+CREATE INDEX IF NOT EXISTS questions_by_id ON questions (question_id, classification);
+"""
+
+# Columns added after the first schema version, added to existing databases on connect
+ADDED_COLUMNS = {
+    "runs": [
+        ("avg_wall_seconds", "REAL"), ("run_wall_seconds", "REAL"), ("throughput_qpm", "REAL"), ("llm_calls", "INTEGER"),
+        ("endpoint_queries", "INTEGER"), ("graph_queries", "INTEGER"), ("bytes_sent", "INTEGER"), ("bytes_received", "INTEGER"),
+        ("cache_hit_rate", "REAL"), ("time_normalized_ena", "REAL"), ("shape_format", "TEXT"), ("avg_shape_tokens", "REAL"),
+        ("avg_shape_tokens_saved", "REAL"),
+    ],
+    "questions": [
+        ("wall_seconds", "REAL"), ("llm_calls", "INTEGER"), ("endpoint_queries", "INTEGER"), ("bytes_transferred", "INTEGER"),
+        ("shape_tokens", "INTEGER"), ("shape_tokens_saved", "INTEGER"),
+    ],
+}
+
+QUESTION_COLUMNS = [
+    "run_pk", "position", "question_id", "question_text", "classification", "prompt_tokens", "completion_tokens", "total_tokens",
+    "failed_attempts", "gold_count", "llm_count", "wall_seconds", "llm_calls", "endpoint_queries", "bytes_transferred",
+    "shape_tokens", "shape_tokens_saved",
+]
+
+class ResultsStore:
+    """
+    SQLite store with one row per run and one row per verified question.
+    Runs are appended incrementally by the verification stage; results.csv is exported from it on demand
+    instead of re-parsing every summary file of the experiment history.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connect(self):
+        # Concurrent writers (matrix cells, parallel jobs) wait for the lock instead of failing
+        connection = sqlite3.connect(self.path, timeout=60)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        connection.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row["name"] for row in connection.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns:
+                if column not in existing:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        return connection
+
+    def record_run(self, run: dict, data=None) -> int:
+        """
+        Inserts one run row and its per-question rows in a single transaction.
+        A run with the same ID and summary file (e.g. a resumed run) replaces the previous row.
+        """
+        run = {"created": datetime.now().isoformat(timespec="seconds"), **run}
+        columns = list(run)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM runs WHERE id IS ? AND file = ?", (run.get("id"), run["file"]))
+                cursor = connection.execute(
+                    f"INSERT INTO runs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [run[column] for column in columns],
+                )
+                run_pk = cursor.lastrowid
+                connection.executemany(
+                    f"INSERT INTO questions ({', '.join(QUESTION_COLUMNS)}) VALUES ({', '.join('?' for _ in QUESTION_COLUMNS)})",
+                    [(run_pk, position, *question_row(entry)) for position, entry in enumerate(data or [])],
+                )
+        finally:
+            connection.close()
+        return run_pk
+
+    def query_runs(self, filters=None, order_by="created"):
+        """Returns the run rows matching all column=value filters."""
+        filters = filters or {}
+        valid_columns = set(CSV_COLUMNS) | {"created", "log_dir", "sparql_endpoint_url", "local_graph_location"}
+        for column in list(filters) + [order_by]:
+            if column not in valid_columns:
+                raise ValueError(f"Unknown results column: {column}")
+
+        where = " AND ".join(f"{column} = ?" for column in filters)
+        sql = f"SELECT * FROM runs {'WHERE ' + where if where else ''} ORDER BY {order_by}, run_pk"
+        connection = self._connect()
+        try:
+            return [dict(row) for row in connection.execute(sql, list(filters.values()))]
+        finally:
+            connection.close()
+
+    def query_questions(self, question_id=None, classification=None):
+        """Returns per-question rows joined with their run ID, optionally for one question ID and/or classification."""
+        conditions, params = [], []
+        if question_id is not None:
+            conditions.append("q.question_id = ?")
+            params.append(str(question_id))
+        if classification is not None:
+            conditions.append("q.classification = ?")
+            params.append(classification)
+
+        sql = (
+            "SELECT r.id AS run_id, r.model_sparql, r.shape_type, q.* FROM questions q JOIN runs r USING (run_pk) "
+            f"{'WHERE ' + ' AND '.join(conditions) if conditions else ''} ORDER BY r.created, q.position"
+        )
+        connection = self._connect()
+        try:
+            return [dict(row) for row in connection.execute(sql, params)]
+        finally:
+            connection.close()
+
+    def export_csv(self, output_path, filters=None, force=False):
+        """
+        Writes the matching runs in the results.csv schema and returns the number of rows.
+        Parallel runs exporting to the same file take turns, and readers never see a partially written file.
+        An existing CSV with runs the export would not contain (e.g. runs from before the store was backfilled)
+        is not overwritten unless force is set; a ValueError names the missing runs instead.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with run_allocator.file_lock(output_path):
+            rows = self.query_runs(filters)
+            missing = [] if force else missing_runs(output_path, rows)
+            if missing:
+                raise ValueError(
+                    f"{output_path} has {len(missing)} run(s) missing from {self.path}, e.g. {missing[0]}. "
+                    "Backfill them with 'results_store.py import' or pass --force to overwrite the file."
+                )
+            tmp_path = f"{output_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+                writer.writeheader()
+                for row in rows:
+                    for column in ROUNDED_COLUMNS:
+                        if isinstance(row[column], float):
+                            row[column] = f"{row[column]:.2f}"
+                    writer.writerow(row)
+            os.replace(tmp_path, output_path)
+        return len(rows)
+
+def _same_file(a, b) -> bool:
+    """Whether two summary paths name the same file, also when one of them is relative to a directory of the other."""
+    a, b = (os.path.normpath(str(path or "")).replace("\\", "/") for path in (a, b))
+    return a == b or a.endswith("/" + b) or b.endswith("/" + a)
+
+def missing_runs(csv_path, rows) -> list:
+    """The summary files of the rows of an existing results.csv that are not among the exported rows."""
+    if not os.path.exists(csv_path):
+        return []
+    exported = [row.get("file") for row in rows]
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        existing = [row.get("file") for row in csv.DictReader(f)]
+    return [path for path in existing if not any(_same_file(path, file) for file in exported)]
+
+def question_row(entry):
+    """Flattens one verified experiment record into the per-question columns."""
+    comparison = entry.get("sparql_comparison_result", {})
+    llm_queries = entry.get("LLM_generated_sparql_query", [])
+    gold = entry.get("baseline_sparql_query_response")
+    llm_result = llm_queries[-1].get("result") if llm_queries else None
+    llm_count = len(llm_result) if isinstance(llm_result, list) else (llm_queries[-1].get("result_count") if llm_queries else None)
+    usage = entry.get("operational_metrics")
+    counters = usage.get("counters", {}) if usage else {}
+    shape = entry.get("shape_serialization") or {}
+    return (
+        str(entry.get("baseline_id")),
+        entry.get("baseline_question_text"),
+        comparison.get("is_correct"),
+        int(comparison.get("prompt_tokens_by_question", 0)),
+        int(comparison.get("completion_tokens_by_question", 0)),
+        int(comparison.get("total_tokens_by_question", 0)),
+        int(comparison.get("llm_failed_attempts", 0)),
+        len(gold) if isinstance(gold, list) else None,
+        llm_count,
+        usage.get("wall_seconds") if usage else None,
+        counters.get("llm_calls", 0) if usage else None,
+        counters.get("endpoint_queries", 0) if usage else None,
+        counters.get("bytes_sent", 0) + counters.get("bytes_received", 0) if usage else None,
+        shape.get("prompt_tokens"),
+        shape.get("saved_tokens"),
+    )
+
+def run_row(summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index):
+    """Builds the run row from the same values that go into the text summary."""
+    token_summary = metrics["token_summary"]
+    num_entries = metrics["num_entries"]
+    operations = metrics.get("operations") or {}
+    shape_serialization = metrics.get("shape_serialization") or {}
+
+    if baseline_run:
+        shape_type = "None"
+        annotation = "None"
+
+    return {
+        "id": None if run_index is None else str(run_index),
+        "file": summary_path,
+        "llm_sparql": llm_provider_sparql_generation,
+        "llm_entity": llm_provider_entity_extraction,
+        "model_entity": model_entity_extraction,
+        "model_sparql": model_sparql_generation,
+        "benchmark": benchmark_dataset,
+        "shape_type": shape_type,
+        "dataset_type": dataset_type,
+        "annotation": None if annotation is None else str(annotation),
+        "baseline_run": None if baseline_run is None else str(baseline_run),
+        "sparql_endpoint_url": sparql_endpoint_url,
+        "local_graph_location": local_graph_location,
+        "log_dir": log_dir,
+        "num_questions": num_questions,
+        "max_retries": max_retries,
+        "prompt_tokens": token_summary["prompt_tokens"],
+        "completion_tokens": token_summary["completion_tokens"],
+        "total_tokens": token_summary["total_tokens"],
+        "avg_prompt_tokens": token_summary["prompt_tokens"] / num_entries if num_entries else 0.0,
+        "avg_completion_tokens": token_summary["completion_tokens"] / num_entries if num_entries else 0.0,
+        "avg_total_tokens": token_summary["total_tokens"] / num_entries if num_entries else 0.0,
+        "total_retries": token_summary["total_retries"],
+        "avg_retries": token_summary["avg_retries_per_question"],
+        "tp": metrics["tp"],
+        "fp": metrics["fp"],
+        "fn": metrics["fn"],
+        "invalid": metrics["invalid"],
+        "precision": metrics["precision"],
+        "recall": metrics["recall"],
+        "f1_score": metrics["f1_score"],
+        "accuracy": metrics["execution_accuracy"],
+        "ena": metrics["ena_score"],
+        "avg_wall_seconds": operations.get("avg_wall_seconds_per_question"),
+        "run_wall_seconds": operations.get("run_wall_seconds"),
+        "throughput_qpm": operations.get("throughput_qpm"),
+        "llm_calls": operations.get("llm_calls"),
+        "endpoint_queries": operations.get("endpoint_queries"),
+        "graph_queries": operations.get("graph_queries"),
+        "bytes_sent": operations.get("bytes_sent"),
+        "bytes_received": operations.get("bytes_received"),
+        "cache_hit_rate": operations.get("cache_hit_rate"),
+        "time_normalized_ena": operations.get("time_normalized_ena"),
+        "shape_format": shape_serialization.get("format"),
+        "avg_shape_tokens": shape_serialization.get("avg_prompt_tokens"),
+        "avg_shape_tokens_saved": shape_serialization.get("avg_saved_tokens"),
+    }
+
+def parse_summary(summary_path):
+    """Reads the "Label: value" lines of a text summary into a run row."""
+    run = {"file": summary_path}
+    with open(summary_path, "r", encoding="utf-8") as f:
+        for line in f:
+            label, separator, value = line.partition(":")
+            column = SUMMARY_LABELS.get(label.strip())
+            if separator and column:
+                value = value.strip()
+                run[column] = None if value == "None" and column in ("num_questions", "max_retries") else value
+    return run
+
+def import_summaries(store, base_dir):
+    """Backfills the store from the *_summary.txt files below base_dir (no per-question rows)."""
+    imported = 0
+    for root, _, files in os.walk(base_dir):
+        for filename in sorted(files):
+            if filename.endswith("_summary.txt"):
+                store.record_run(parse_summary(os.path.join(root, filename)))
+                imported += 1
+    return imported
+
+def backfill_new_store(store, base_dir):
+    """
+    Imports the summaries below base_dir into a store without runs, i.e. when the database is first created,
+    so the history of results.csv is not lost by the first export. Returns the number of imported summaries.
+    """
+    with run_allocator.file_lock(store.path):
+        if store.query_runs():
+            return 0
+        return import_summaries(store, base_dir)
+
+def parse_filters(filter_args):
+    filters = {}
+    for item in filter_args or []:
+        column, separator, value = item.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid filter '{item}', expected column=value")
+        filters[column] = value
+    return filters
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and export the SQLite results store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export runs to a CSV in the results.csv schema.")
+    export_parser.add_argument("--db", type=str, required=True, help="Path to the results database.")
+    export_parser.add_argument("--output", type=str, required=True, help="Path of the CSV file to write.")
+    export_parser.add_argument("--filter", action="append", help="column=value filter (repeatable).")
+    export_parser.add_argument("--force", action="store_true", help="Overwrite the CSV even if it has runs missing from the store.")
+
+    query_parser = subparsers.add_parser("query", help="Print matching runs.")
+    query_parser.add_argument("--db", type=str, required=True, help="Path to the results database.")
+    query_parser.add_argument("--filter", action="append", help="column=value filter (repeatable).")
+    query_parser.add_argument("--question_id", type=str, help="Print the per-question rows of this question ID instead.")
+
+    import_parser = subparsers.add_parser("import", help="Backfill runs from existing *_summary.txt files.")
+    import_parser.add_argument("--db", type=str, required=True, help="Path to the results database.")
+    import_parser.add_argument("--base", type=str, required=True, help="Directory searched recursively for summaries.")
+    import_parser.add_argument("--if_new", action="store_true", help="Only import into a store that has no runs yet.")
+
+    args = parser.parse_args()
+    store = ResultsStore(args.db)
+
+    if args.command == "export":
+        try:
+            count = store.export_csv(args.output, parse_filters(args.filter), args.force)
+        except ValueError as e:
+            print(f"❌ Not exporting: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ Exported {count} run(s) to {args.output}")
+    elif args.command == "query":
+        if args.question_id:
+            rows = store.query_questions(args.question_id)
+            columns = ["run_id", "model_sparql", "shape_type", "classification", "total_tokens", "failed_attempts"]
+        else:
+            rows = store.query_runs(parse_filters(args.filter))
+            columns = ["id", "created", "model_sparql", "benchmark", "shape_type", "num_questions", "f1_score", "accuracy", "ena"]
+        print("\t".join(columns))
+        for row in rows:
+            print("\t".join(str(row[column]) for column in columns))
+    elif args.command == "import":
+        count = backfill_new_store(store, args.base) if args.if_new else import_summaries(store, args.base)
+        print(f"✅ Imported {count} summary file(s) into {args.db}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import re
+
+# Failure classes of one SPARQL generation attempt
+SYNTAX = "syntax"
+TRANSIENT = "endpoint_transient"
+TIMEOUT = "endpoint_timeout"
+EMPTY = "empty_result"
+OVER_CAP = "over_cap"
+DUPLICATE = "duplicate"
+NO_QUERY = "no_query"
+ERROR = "error"
+FAILURE_CLASSES = [SYNTAX, TRANSIENT, TIMEOUT, EMPTY, OVER_CAP, DUPLICATE, NO_QUERY, ERROR]
+
+# What to do about a failed attempt
+REEXECUTE = "reexecute"  # run the same query again, without an LLM call
+REPROMPT = "reprompt"    # ask the LLM again with the failed attempt in the prompt
+ESCALATE = "escalate"    # ask the escalation model instead
+STOP = "stop"            # keep the attempt as the final answer
+ACTIONS = [REEXECUTE, REPROMPT, ESCALATE, STOP]
+
+# Results larger than this are discarded and count as failed
+RESULT_CAP = 10000
+
+# How attempts enter the per-question metrics (llm_failed_attempts, tokens, "failed"):
+# baseline keeps the accounting of runs before the retry policy, full records every classified attempt
+BASELINE_ACCOUNTING = "baseline"
+FULL_ACCOUNTING = "full"
+ACCOUNTINGS = [BASELINE_ACCOUNTING, FULL_ACCOUNTING]
+
+DEFAULT_ACTIONS = {
+    SYNTAX: REPROMPT,
+    TRANSIENT: REEXECUTE,
+    # A cheaper query is needed, re-running the same one would time out again
+    TIMEOUT: REPROMPT,
+    # Empty answers are legitimate for some questions and were never retried
+    EMPTY: STOP,
+    OVER_CAP: REPROMPT,
+    # The model is stuck on this query, only a different model can be expected to do better
+    DUPLICATE: ESCALATE,
+    NO_QUERY: REPROMPT,
+    ERROR: REPROMPT,
+}
+
+# Error kinds set by Utils.query_sparql_endpoint and Utils.query_local_graph
+ERROR_KINDS = {"syntax": SYNTAX, "transient": TRANSIENT, "timeout": TIMEOUT}
+
+REASONS = {
+    SYNTAX: "Query could not be parsed",
+    TRANSIENT: "Endpoint temporarily unavailable",
+    TIMEOUT: "Query timed out",
+    EMPTY: "Empty result",
+    OVER_CAP: f"Result exceeded {RESULT_CAP} entries (truncated)",
+    DUPLICATE: "Same query as a previous attempt",
+    NO_QUERY: "LLM response contained no query",
+    ERROR: "Faulty result",
+}
+
+MEANINGLESS_VALUES = {"0", "0.0", "", "null", "None"}
+
+def normalize_query(query: str) -> str:
+    """Collapses whitespace, so reformatted but otherwise identical queries are recognized as duplicates."""
+    return re.sub(r"\s+", " ", query or "").strip()
+
+def classify_result(result):
+    """Returns the failure class of a query result, or None if the result is usable."""
+    if isinstance(result, dict) and "error" in result:
+        return ERROR_KINDS.get(result.get("kind"), ERROR)
+    if isinstance(result, list) and len(result) > RESULT_CAP:
+        return OVER_CAP
+    if result is None or (isinstance(result, (list, dict)) and not result):
+        return EMPTY
+    if isinstance(result, list) and all(str(r).strip() in MEANINGLESS_VALUES for r in result):
+        return EMPTY
+    return None
+
+def parse_actions(spec: str) -> dict:
+    """
+    Parses "class=action,..." overrides of the default actions, e.g. "empty_result=reprompt,duplicate=stop".
+    Used as an argparse type.
+    """
+    actions = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        failure_class, _, action = item.partition("=")
+        failure_class, action = failure_class.strip(), action.strip()
+        if failure_class not in FAILURE_CLASSES:
+            raise argparse.ArgumentTypeError(f"Unknown failure class '{failure_class}', expected one of {', '.join(FAILURE_CLASSES)}")
+        if action not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"Unknown action '{action}', expected one of {', '.join(ACTIONS)}")
+        actions[failure_class] = action
+    return actions
+
+class RetryPolicy:
+    """
+    Decides how the SPARQL generation loop reacts to each failure class.
+    Re-executions are limited per question, once exhausted the LLM is re-prompted as before the policy existed.
+    Escalation switches the remaining attempts to the escalation model; without one (or once it took over)
+    the LLM is re-prompted, so runs without an escalation model keep their retries.
+    """
+
+    def __init__(self, actions: dict = None, max_reexecutions: int = 2, escalation_model: str = None, accounting: str = BASELINE_ACCOUNTING):
+        self.actions = {**DEFAULT_ACTIONS, **(actions or {})}
+        self.max_reexecutions = max_reexecutions
+        self.escalation_model = escalation_model
+        self.accounting = accounting
+
+    def decide(self, failure_class: str, reexecutions: int = 0, escalated: bool = False) -> str:
+        action = self.actions.get(failure_class, REPROMPT)
+        if action == REEXECUTE and reexecutions >= self.max_reexecutions:
+            return REPROMPT
+        if action == ESCALATE and (not self.escalation_model or escalated):
+            return REPROMPT
+        return action
+
+    def counts_attempt(self, failure_class: str) -> bool:
+        """Whether an attempt is logged and its tokens counted; the baseline silently retried answers without a query."""
+        return self.accounting == FULL_ACCOUNTING or failure_class != NO_QUERY
+
+    def marks_failed(self, failure_class: str) -> bool:
+        """The "failed" flag of a logged attempt; the baseline did not count empty results as failed."""
+        if self.accounting == FULL_ACCOUNTING:
+            return failure_class is not None
+        return failure_class not in (None, EMPTY)
+
+    def fingerprint(self) -> dict:
+        """The settings that influence the generated queries, for stage keys."""
+        return {
+            "actions": self.actions, "max_reexecutions": self.max_reexecutions, "escalation_model": self.escalation_model,
+            "accounting": self.accounting,
+        }
+
+def add_arguments(parser):
+    """Adds the retry policy flags to a stage or pipeline parser."""
+    parser.add_argument("--retry_policy", type=parse_actions, default={},
+                        help=f"Overrides of the action per failure class as class=action pairs, e.g. \"empty_result=reprompt\" (classes: {', '.join(FAILURE_CLASSES)}; actions: {', '.join(ACTIONS)}).")
+    parser.add_argument("--max_reexecutions", type=int, default=2, help="Re-executions of a query after transient endpoint failures per question.")
+    parser.add_argument("--escalation_model", type=str, help="Model asked after the generation model repeats a failed query (same provider and API key).")
+    parser.add_argument("--retry_accounting", type=str, choices=ACCOUNTINGS, default=BASELINE_ACCOUNTING,
+                        help="\"baseline\" keeps the retry, token and ENA accounting of earlier runs; \"full\" also logs and counts answers without a query and marks empty results as failed (not comparable with baseline runs).")
+
+def from_args(args) -> RetryPolicy:
+    """Builds the policy from parsed flags; matrix grid specs may give --retry_policy as a string or a dict."""
+    actions = getattr(args, "retry_policy", None)
+    if isinstance(actions, str):
+        actions = parse_actions(actions)
+    escalation_model = getattr(args, "escalation_model", None)
+    return RetryPolicy(
+        actions, getattr(args, "max_reexecutions", 2),
+        None if escalation_model in ("", "None") else escalation_model,
+        getattr(args, "retry_accounting", None) or BASELINE_ACCOUNTING,
+    )
+
+def summarize_records(data) -> dict:
+    """Sums the per-question failure class and action counts of a run and lists its accountings."""
+    failure_classes, actions, accountings = {}, {}, set()
+    for entry in data:
+        comparison = entry.get("sparql_comparison_result", {}) if isinstance(entry, dict) else {}
+        if comparison.get("retry_accounting"):
+            accountings.add(comparison["retry_accounting"])
+        for name, amount in comparison.get("failure_classes", {}).items():
+            failure_classes[name] = failure_classes.get(name, 0) + amount
+        for name, amount in comparison.get("retry_actions", {}).items():
+            actions[name] = actions.get(name, 0) + amount
+    return {"failure_classes": failure_classes, "actions": actions, "accounting": ", ".join(sorted(accountings)) or BASELINE_ACCOUNTING}
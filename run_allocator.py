@@ -0,0 +1,173 @@
+import argparse
+import contextlib
+import fcntl
+import os
+import re
+import threading
+import time
+import tracing
+from urllib.parse import urlsplit
+
+# Environment variables of the host-wide governor, set by --governor_dir for child processes or exported by the shell script
+GOVERNOR_DIR_ENV = "HOST_GOVERNOR_DIR"
+LLM_CONCURRENCY_ENV = "HOST_LLM_CONCURRENCY"
+ENDPOINT_CONCURRENCY_ENV = "HOST_ENDPOINT_CONCURRENCY"
+DEFAULT_GOVERNOR_DIR = "./cache/governor"
+
+# Polling interval while every host-wide slot is taken, doubling up to the maximum
+POLL_SECONDS = 0.05
+MAX_POLL_SECONDS = 1.0
+
+_governor = None
+_configured = False
+_lock = threading.Lock()
+
+def allocate_run(log_base: str):
+    """
+    Claims the next free run directory <log_base>_<index> and returns (index, directory).
+    The directory is created with mkdir, which fails if another run created it first; that run keeps the index
+    and this one tries the next, so runs started at the same time never share a directory.
+    """
+    parent, prefix = os.path.dirname(log_base) or ".", f"{os.path.basename(log_base)}_"
+    os.makedirs(parent, exist_ok=True)
+    while True:
+        indexes = [int(name[len(prefix):]) for name in os.listdir(parent) if name.startswith(prefix) and name[len(prefix):].isdigit()]
+        index = max(indexes, default=0) + 1
+        run_dir = f"{log_base}_{index}"
+        try:
+            os.mkdir(run_dir)
+            return index, run_dir
+        except FileExistsError:
+            continue
+
+@contextlib.contextmanager
+def file_lock(path: str, shared: bool = False):
+    """
+    Holds an flock on <path>.lock while writing (or, shared, reading) a file that several runs update.
+    The lock is released by the kernel if the process dies, so a crashed run never blocks the others.
+    """
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class HostGovernor:
+    """
+    Concurrency and pacing budgets shared by all runs on a host, kept as lock files in one directory.
+    A budget of n concurrent LLM calls is n slot files; a call holds an flock on one of them.
+    """
+
+    def __init__(self, directory: str, llm_concurrency: int = None, endpoint_concurrency: int = None):
+        self.directory = directory
+        self.limits = {"llm": llm_concurrency, "endpoint": endpoint_concurrency}
+        os.makedirs(directory, exist_ok=True)
+
+    def _try_slot(self, resource: str, limit: int):
+        for index in range(limit):
+            f = open(os.path.join(self.directory, f"{resource}.{index}.slot"), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+    @contextlib.contextmanager
+    def slot(self, resource: str):
+        """Holds one host-wide slot of a resource ("llm" or "endpoint"); a no-op without a limit for it."""
+        limit = self.limits.get(resource)
+        if not limit:
+            yield
+            return
+        f = self._try_slot(resource, limit)
+        if f is None:
+            with tracing.span("governor.wait", resource=resource):
+                delay = POLL_SECONDS
+                while f is None:
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_POLL_SECONDS)
+                    f = self._try_slot(resource, limit)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def pace(self, seconds: float, reason: str, endpoint: str = None):
+        """
+        Fixed throttle sleep shared by all runs: each call reserves the next `seconds` of the schedule of the reason
+        and endpoint and sleeps until the end of its reservation. A single run sleeps `seconds` as before, n parallel
+        runs against the same endpoint together keep the rate of a single run instead of n times that rate.
+        """
+        if tracing.sleeps_skipped():
+            tracing.sleep(seconds, reason)
+            return
+        path = os.path.join(self.directory, f"{reason}{pace_suffix(endpoint)}.pace")
+        with file_lock(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    next_free = float(f.read().strip() or 0)
+            except (OSError, ValueError):
+                next_free = 0.0
+            now = time.time()
+            next_free = max(now, next_free) + seconds
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(repr(next_free))
+        tracing.sleep(next_free - now, reason)
+
+def pace_suffix(endpoint: str = None) -> str:
+    """File name part of the pace schedule of an endpoint URL, e.g. ".dbpedia.org_sparql"; empty without an endpoint."""
+    if not endpoint:
+        return ""
+    parts = urlsplit(endpoint)
+    name = re.sub(r"[^\w.-]+", "_", (parts.netloc + parts.path) if parts.netloc else endpoint).strip("._")
+    return f".{name[:100]}" if name else ""
+
+def configure_governor(directory: str = None, llm_concurrency: int = None, endpoint_concurrency: int = None):
+    """Shares the LLM and endpoint budgets with the other runs on this host, in this process and the stage processes it starts."""
+    global _governor, _configured
+    directory = directory or DEFAULT_GOVERNOR_DIR
+    with _lock:
+        _governor = HostGovernor(directory, llm_concurrency, endpoint_concurrency)
+        _configured = True
+    os.environ[GOVERNOR_DIR_ENV] = os.path.abspath(directory)
+    for name, value in ((LLM_CONCURRENCY_ENV, llm_concurrency), (ENDPOINT_CONCURRENCY_ENV, endpoint_concurrency)):
+        if value:
+            os.environ[name] = str(value)
+        else:
+            os.environ.pop(name, None)
+
+def _env_int(name: str):
+    value = os.environ.get(name, "")
+    return int(value) if value.strip() not in ("", "None", "0") else None
+
+def governor():
+    """The host-wide governor of this process (configured or from the environment), None if runs don't share budgets."""
+    global _governor, _configured
+    if not _configured:
+        with _lock:
+            if not _configured:
+                _configured = True
+                directory = os.environ.get(GOVERNOR_DIR_ENV)
+                llm, endpoint = _env_int(LLM_CONCURRENCY_ENV), _env_int(ENDPOINT_CONCURRENCY_ENV)
+                if directory or llm or endpoint:
+                    _governor = HostGovernor(directory or DEFAULT_GOVERNOR_DIR, llm, endpoint)
+    return _governor
+
+def main():
+    parser = argparse.ArgumentParser(description="Allocate run directories for runs executing in parallel on one host.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    allocate = subparsers.add_parser("allocate", help="Create the next free <log_base>_<index> directory and print its index.")
+    allocate.add_argument("--log_base", type=str, required=True, help="Prefix of the run directories, e.g. logs/01-01-2025/KG_Agent_MK2.")
+    args = parser.parse_args()
+
+    if args.command == "allocate":
+        index, _ = allocate_run(args.log_base)
+        print(index)
+
+if __name__ == "__main__":
+    main()
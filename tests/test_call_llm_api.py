@@ -0,0 +1,33 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import call_llm_api
+import retry_policy
+
+OVER_CAP_QUERY = "SELECT ?s WHERE { ?s ?p ?o }"
+
+def test_repeated_over_cap_query_keeps_the_dropped_result(monkeypatch):
+    prompts = []
+
+    def call_llm(full_prompt, *args):
+        prompts.append(full_prompt)
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=10, total_tokens=110)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=OVER_CAP_QUERY))], usage=usage)
+
+    rows = [f"http://example.org/{i}" for i in range(retry_policy.RESULT_CAP + 1)]
+    monkeypatch.setattr(call_llm_api, "call_llm", call_llm)
+    monkeypatch.setattr(call_llm_api.Utils, "query_local_graph", lambda query, path: list(rows))
+
+    entry = {"baseline_id": "1", "baseline_question_text": "Which things exist?"}
+    call_llm_api.generate_sparql_for_entry(
+        entry, "{nlq} {ont}", "", "k", "model", 100, 0.2, "openai", True, 2, None, "/tmp/kg", "shex", "corporate_graphs", True
+    )
+
+    attempts = entry["LLM_generated_sparql_query"]
+    assert len(prompts) == 3
+    assert [attempt["failure_class"] for attempt in attempts] == [retry_policy.OVER_CAP, retry_policy.DUPLICATE, retry_policy.DUPLICATE]
+    assert all(attempt["result"] == [] for attempt in attempts)
+    assert all(rows[-1] not in prompt for prompt in prompts)
@@ -0,0 +1,39 @@
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cassette
+
+GOLD_QUERY = {"url": "http://dbpedia.org/sparql", "query": "SELECT ?x WHERE { dbr:Berlin dbo:populationTotal ?x }"}
+
+def run_stage(path, mode, stage, answer=None):
+    """One stage process: its own cassette instance and occurrence counters."""
+    cassette.set_scope(stage)
+    return cassette.Cassette(path, mode).exchange("sparql", GOLD_QUERY, lambda: answer)
+
+def test_stages_replay_their_own_response_of_the_same_request(tmp_path):
+    path = str(tmp_path / "run.cassette")
+    # The endpoint answers differently by the time the verification stage runs
+    run_stage(path, cassette.RECORD, "extract_entity_list", ["3644826"])
+    run_stage(path, cassette.RECORD, "verify_sparql", ["3664088"])
+
+    assert run_stage(path, cassette.REPLAY, "extract_entity_list") == ["3644826"]
+    assert run_stage(path, cassette.REPLAY, "verify_sparql") == ["3664088"]
+    # A stage that never sent the request gets a recorded response of another stage
+    assert run_stage(path, cassette.REPLAY, "pipeline") in (["3644826"], ["3664088"])
+
+def test_unscoped_cassette_is_migrated(tmp_path):
+    path = str(tmp_path / "old.cassette")
+    run_stage(path, cassette.RECORD, "", ["3644826"])
+    db = sqlite3.connect(path)
+    db.executescript(
+        "ALTER TABLE exchanges RENAME TO scoped;"
+        "CREATE TABLE exchanges (kind TEXT NOT NULL, digest TEXT NOT NULL, occurrence INTEGER NOT NULL, summary TEXT,"
+        " response BLOB NOT NULL, PRIMARY KEY (kind, digest, occurrence));"
+        "INSERT INTO exchanges SELECT kind, digest, occurrence, summary, response FROM scoped; DROP TABLE scoped;"
+    )
+    db.close()
+
+    assert run_stage(path, cassette.REPLAY, "verify_sparql") == ["3644826"]
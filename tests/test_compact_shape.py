@@ -0,0 +1,48 @@
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compact_shape
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Shapes written by shexer for a DBpedia shape map of generate_shape.generate_combined_shape_from_dbpedia
+ENTITIES = {"AC/DC": "http://dbpedia.org/resource/AC/DC", "Angus_Young": "http://dbpedia.org/resource/Angus_Young"}
+
+def read_shape(shape_type):
+    with open(os.path.join(DATA_DIR, f"dbpedia_question_shape.{shape_type}"), "r", encoding="utf-8") as f:
+        return f.read()
+
+def expand(prefixed, prefixes):
+    prefix, local = prefixed.split(":", 1)
+    return prefixes[prefix] + local
+
+def check_round_trip(shape_type):
+    native = read_shape(shape_type)
+    text, type_name, stats = compact_shape.prompt_shape(native, shape_type, compact_shape.COMPACT)
+    assert type_name == f"compact {shape_type}"
+    assert stats["format"] == compact_shape.COMPACT and stats["saved_tokens"] > 0
+
+    prefixes = compact_shape.parse_prefixes(text)
+    names = [line for line in text.split("\n") if line and not line.startswith(("PREFIX", "#", " "))]
+    entities = {}
+    for name in names:
+        label, entity = re.match(r"^(.*?):(\w+:.*)$", name).groups()
+        entities[label] = expand(entity, prefixes)
+    assert entities == ENTITIES
+    assert "@Angus_Young:dbr:Angus_Young" in text
+
+def test_dbpedia_shex_keeps_entity_iris():
+    check_round_trip("shex")
+
+def test_dbpedia_shacl_keeps_entity_iris():
+    check_round_trip("shacl")
+
+def test_wikidata_and_local_shape_names():
+    prefixes = {"shapes": "http://shapes.wikidata.org/", "": "http://weso.es/shapes/"}
+    assert compact_shape.shape_name("shapes:Barack_Obama:Q76", prefixes) == "Barack_Obama:Q76"
+    assert compact_shape.shape_name("<http://shapes.wikidata.org/Barack_Obama:Q76>", prefixes) == "Barack_Obama:Q76"
+    assert compact_shape.shape_name("@:Company", prefixes) == "Company"
+    assert compact_shape.shape_name("<http://weso.es/shapes/Person>", prefixes) == "Person"
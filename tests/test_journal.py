@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import StageJournal
+
+def test_append_after_torn_line_survives_resume(tmp_path):
+    path = str(tmp_path / "experiment.call_llm_api.journal.jsonl")
+    journal = StageJournal(path)
+    journal.append(1, {"answer": 1})
+    journal.append(2, {"answer": 2})
+    # Interrupted while writing question 3: a partial record without newline
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "3", "record": {"ans')
+
+    resumed = StageJournal(path, resume=True)
+    assert set(resumed.completed) == {"1", "2"}
+    resumed.append(3, {"answer": 3})
+
+    resumed_again = StageJournal(path, resume=True)
+    assert set(resumed_again.completed) == {"1", "2", "3"}
+    assert resumed_again.get(3) == {"answer": 3}
+
+def test_complete_final_record_without_newline_is_kept(tmp_path):
+    path = str(tmp_path / "experiment.verify_sparql.journal.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"id": "1", "record": {"answer": 1}}')
+
+    resumed = StageJournal(path, resume=True)
+    resumed.append(2, {"answer": 2})
+
+    resumed_again = StageJournal(path, resume=True)
+    assert resumed_again.get(1) == {"answer": 1}
+    assert resumed_again.get(2) == {"answer": 2}
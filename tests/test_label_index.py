@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extract_entity_list
+import label_index
+
+DUMP = """<http://dbpedia.org/resource/Berlin> <http://www.w3.org/2000/01/rdf-schema#label> "Berlin"@en .
+<http://dbpedia.org/resource/Berlin> <http://www.w3.org/2000/01/rdf-schema#label> "Berlin"@de .
+<http://dbpedia.org/resource/Bern> <http://www.w3.org/2000/01/rdf-schema#label> "Bern"@en .
+<http://dbpedia.org/resource/Germany> <http://dbpedia.org/ontology/capital> <http://dbpedia.org/resource/Berlin> .
+<http://dbpedia.org/resource/Germany> <http://dbpedia.org/ontology/currency> <http://dbpedia.org/resource/Euro> .
+"""
+
+def build(tmp_path):
+    dump = tmp_path / "labels_en.nt"
+    dump.write_text(DUMP, encoding="utf-8")
+    return str(dump), label_index.LabelIndex(label_index.build_index(label_index.read_labels(str(dump)), str(tmp_path / "dbpedia.labels")))
+
+def test_ntriples_popularity_counts_labelled_entities(tmp_path):
+    dump, _ = build(tmp_path)
+    labels = sorted(label_index.read_ntriples_labels(dump))
+    # Berlin: two label lines and one object occurrence; unlabelled Germany and Euro are not reported
+    assert labels == [("http://dbpedia.org/resource/Berlin", "Berlin", 3), ("http://dbpedia.org/resource/Bern", "Bern", 1)]
+
+def test_similar_matches_only_without_endpoint_fallback(tmp_path):
+    _, index = build(tmp_path)
+    assert index.resolve("berlin")["match"] == "casefold"
+    assert index.resolve("Berlinn")["match"] == "fuzzy"
+    assert index.resolve("Berlinn", fuzzy=False) is None
+
+    # With the endpoint fallback only the exact spelling pre-empts the endpoint lookup
+    assert extract_entity_list.lookup_label(index, "Berlin")["match"] == "exact"
+    assert extract_entity_list.lookup_label(index, "berlin") is None
+    assert extract_entity_list.lookup_label(index, "Berlinn") is None
+
+    assert extract_entity_list.lookup_label(index, "berlin", offline=True)["match"] == "casefold"
+    assert extract_entity_list.lookup_label(index, "Berlinn", offline=True)["entity"] == "http://dbpedia.org/resource/Berlin"
+    index.close()
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matrix
+import operational_metrics
+
+def stage_output(records, seconds, llm_calls):
+    """Records as a stage returns them: the usage of this stage only (matrix.without_usage)."""
+    records = matrix.without_usage(records)
+    for record in records:
+        usage = operational_metrics.QuestionUsage()
+        usage.wall_seconds, usage.started_at, usage.finished_at = seconds, 100.0, 100.0 + seconds
+        usage.counters = {"llm_calls": llm_calls}
+        usage.add_to(record)
+    return records
+
+def test_reused_stage_usage_is_not_counted_for_the_cell():
+    extracted = stage_output([{"baseline_id": "1"}, {"baseline_id": "2"}], 2.0, 1)
+    generated = stage_output(extracted, 5.0, 3)
+    verified = stage_output(generated, 1.0, 0)
+
+    # Entity extraction was computed by another cell, generation and verification by this one
+    data = matrix.attribute_usage(matrix.without_usage(verified), [(extracted, False), (generated, True), (verified, True)])
+    summary = operational_metrics.summarize_records(data)
+    assert summary["wall_seconds"] == 12.0
+    assert summary["llm_calls"] == 6
+    assert summary["shared_questions"] == 2
+    assert data[0]["shared_operational_metrics"]["counters"] == {"llm_calls": 1}
+
+    # A cell that reused every stage output has no usage of its own
+    data = matrix.attribute_usage(matrix.without_usage(verified), [(extracted, False), (generated, False), (verified, False)])
+    summary = operational_metrics.summarize_records(data)
+    assert summary["measured_questions"] == 0 and summary["llm_calls"] == 0
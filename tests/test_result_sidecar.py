@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import result_sidecar
+
+def test_inlined_records_no_longer_need_the_store(tmp_path):
+    sidecar = result_sidecar.ResultSidecar(str(tmp_path / "results"))
+    rows = [f"http://example.org/{i}" for i in range(20)]
+    entry = {"baseline_id": "1", "LLM_generated_sparql_query": [{"attempt": 1, "result": rows}]}
+    stored = result_sidecar.externalize_entry(entry, sidecar)
+    assert "result" not in stored["LLM_generated_sparql_query"][0]
+
+    archived = result_sidecar.inline_records([stored], sidecar)
+    assert archived[0]["LLM_generated_sparql_query"] == [{"attempt": 1, "result": rows}]
+    # Readers without a store (--result_store_dir None) accept the archived copy
+    assert result_sidecar.resolve_records(archived, None) == archived
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import results_store
+
+SUMMARY = "Model for SPARQL Generation: gpt-4o\nShape Type: shex\nNumber of Questions: 50\nF1-score: 0.50\n"
+
+def write_history(base):
+    run_dir = base / "Experiment_Results" / "run_1"
+    run_dir.mkdir(parents=True)
+    (run_dir / "experiment_nr_1_summary.txt").write_text(SUMMARY, encoding="utf-8")
+    return str(base / "Experiment_Results")
+
+def test_export_keeps_runs_missing_from_a_new_store(tmp_path):
+    history = write_history(tmp_path)
+    csv_path = os.path.join(history, "results.csv")
+    results_store.import_summaries(results_store.ResultsStore(str(tmp_path / "old.db")), history)
+    assert results_store.ResultsStore(str(tmp_path / "old.db")).export_csv(csv_path) == 1
+
+    store = results_store.ResultsStore(os.path.join(history, "results.db"))
+    with pytest.raises(ValueError):
+        store.export_csv(csv_path)
+
+    assert results_store.backfill_new_store(store, history) == 1
+    assert results_store.backfill_new_store(store, history) == 0
+    assert store.export_csv(csv_path) == 1
@@ -0,0 +1,19 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run_allocator
+
+def test_pace_schedules_are_per_endpoint(tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(run_allocator.tracing, "sleeps_skipped", lambda: False)
+    monkeypatch.setattr(run_allocator.tracing, "sleep", lambda seconds, reason: sleeps.append(round(seconds)))
+    governor = run_allocator.HostGovernor(str(tmp_path))
+
+    governor.pace(15, "wikidata_rate_limit", "https://query.wikidata.org/sparql")
+    governor.pace(1, "endpoint_throttle", "http://dbpedia.org/sparql")
+    governor.pace(1, "endpoint_throttle", "https://query.wikidata.org/sparql")
+    # A second run against DBpedia waits for the first one's reservation
+    governor.pace(1, "endpoint_throttle", "http://dbpedia.org/sparql")
+    assert sleeps == [15, 1, 1, 2]
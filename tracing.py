@@ -0,0 +1,179 @@
+import argparse
+import atexit
+import contextlib
+import contextvars
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+# Tags (question ID, attempt, ...) inherited by every span opened in the current context
+_context = contextvars.ContextVar("trace_context", default={})
+
+_events = []
+_events_lock = threading.Lock()
+_trace_path = None
+_skip_sleeps = False
+
+class _Span:
+    __slots__ = ("name", "tags", "start_us", "start")
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.start_us = time.time_ns() // 1000
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_us = (time.perf_counter() - self.start) * 1e6
+        tags = {**_context.get(), **self.tags}
+        if exc_type is not None:
+            tags["error"] = exc_type.__name__
+        event = {
+            "name": self.name, "cat": self.name.split(".")[0], "ph": "X", "ts": self.start_us, "dur": round(duration_us, 1),
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": tags,
+        }
+        with _events_lock:
+            _events.append(event)
+        return False
+
+def enabled() -> bool:
+    return _trace_path is not None
+
+def enable(trace_dir: str, process_name: str):
+    """Starts recording spans; they are written to <trace_dir>/<process_name>.trace.json when the process exits."""
+    global _trace_path
+    os.makedirs(trace_dir, exist_ok=True)
+    _trace_path = os.path.join(trace_dir, f"{process_name}.trace.json")
+    with _events_lock:
+        _events.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": process_name}})
+    atexit.register(flush)
+
+def span(name: str, **tags):
+    """Times the enclosed block as a span; a no-op unless tracing is enabled."""
+    if _trace_path is None:
+        return contextlib.nullcontext()
+    return _Span(name, tags)
+
+@contextlib.contextmanager
+def context(**tags):
+    """Adds tags to all spans opened inside the block (also by callees)."""
+    token = _context.set({**_context.get(), **tags})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+def current_context() -> dict:
+    """Tags of the current context, e.g. for log records of the question being processed."""
+    return _context.get()
+
+def tag(**tags):
+    """Updates the tags of the current context, e.g. the attempt number inside a retry loop."""
+    _context.set({**_context.get(), **tags})
+
+def sleep(seconds: float, reason: str):
+    """time.sleep recorded as a span, so fixed waits show up next to the work they throttle."""
+    with span("sleep", reason=reason, seconds=seconds):
+        if not _skip_sleeps:
+            time.sleep(seconds)
+
+def skip_sleeps():
+    """Turns sleep() into a no-op (still recorded as a span), for cassette replays that send no requests to throttle."""
+    global _skip_sleeps
+    _skip_sleeps = True
+
+def sleeps_skipped() -> bool:
+    return _skip_sleeps
+
+def flush():
+    """Writes the spans recorded so far as a Chrome trace (chrome://tracing, Perfetto)."""
+    if _trace_path is None:
+        return
+    with _events_lock:
+        events = list(_events)
+    tmp_path = f"{_trace_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    os.replace(tmp_path, _trace_path)
+
+def load_trace_events(trace_dir: str, exclude_path: str = None) -> list:
+    events = []
+    for path in sorted(glob.glob(os.path.join(trace_dir, "*.trace.json"))):
+        if exclude_path and os.path.abspath(path) == os.path.abspath(exclude_path):
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                events.extend(json.load(f)["traceEvents"])
+        except (OSError, ValueError, KeyError):
+            print(f"⚠️ Ignoring unreadable trace file {path}")
+    return events
+
+def collect_events(include_other_processes: bool = True) -> list:
+    """
+    Spans of this process plus, for stage-per-process runs, those already written by the other stages.
+    Only spans carrying all tags of the current context are returned, e.g. the spans of one matrix cell.
+    """
+    with _events_lock:
+        events = list(_events)
+    if include_other_processes and _trace_path is not None:
+        events = load_trace_events(os.path.dirname(_trace_path), exclude_path=_trace_path) + events
+    scope = _context.get()
+    if scope:
+        events = [event for event in events if all(event.get("args", {}).get(key) == value for key, value in scope.items())]
+    return events
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def latency_table(events=None) -> list:
+    """Returns one row per span name with count, p50/p95/p99/max and total duration in milliseconds."""
+    events = collect_events() if events is None else events
+    durations = {}
+    for event in events:
+        if event.get("ph") == "X":
+            durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+
+    rows = []
+    for name, values in sorted(durations.items()):
+        values.sort()
+        rows.append({
+            "span": name, "count": len(values), "p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95),
+            "p99_ms": percentile(values, 99), "max_ms": values[-1], "total_ms": sum(values),
+        })
+    return rows
+
+def format_latency_table(rows) -> str:
+    lines = [f"{'Span':<24}{'Count':>8}{'p50':>11}{'p95':>11}{'p99':>11}{'Max':>11}{'Total':>13}"]
+    for row in rows:
+        lines.append(
+            f"{row['span']:<24}{row['count']:>8}{row['p50_ms']:>11.1f}{row['p95_ms']:>11.1f}"
+            f"{row['p99_ms']:>11.1f}{row['max_ms']:>11.1f}{row['total_ms']:>13.1f}"
+        )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the per-process trace files of a run into one Chrome trace and print latency percentiles.")
+    parser.add_argument("--trace_dir", type=str, required=True, help="Directory with the *.trace.json files of a run.")
+    parser.add_argument("--output", type=str, help="Path of the merged Chrome trace (default: <trace_dir>/merged.json).")
+    args = parser.parse_args()
+
+    events = load_trace_events(args.trace_dir)
+    output = args.output or os.path.join(args.trace_dir, "merged.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    print(format_latency_table(latency_table(events)))
+    print(f"📝 Merged trace with {len(events)} events written to {output}")
+
+if __name__ == "__main__":
+    main()
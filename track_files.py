@@ -1,56 +1,210 @@
 #!/usr/bin/env python3
 import argparse
+import fnmatch
+import hashlib
+import json
 import os
 import shutil
+import sys
 from datetime import datetime
+import run_allocator
 
-def copy_files_to_log(root_dir, log_dir):
+MANIFEST_NAME = "manifest.json"
+STAT_INDEX_NAME = "stat_index.json"
+
+def hash_file(path, chunk_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def object_path(store_dir, file_hash):
+    """Location of an object in the store, fanned out by the first two hex digits."""
+    return os.path.join(store_dir, file_hash[:2], file_hash[2:])
+
+def load_ignore_patterns(root_dir, patterns, ignore_file):
+    """Combines --ignore patterns with the patterns of an ignore file (one glob per line, # for comments)."""
+    patterns = list(patterns or [])
+    ignore_file = ignore_file or os.path.join(root_dir, ".trackignore")
+    if os.path.isfile(ignore_file):
+        with open(ignore_file, "r", encoding="utf-8") as f:
+            patterns += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    return patterns
+
+def load_stat_index(store_dir):
+    """Reads the (path, size, mtime) → hash index that lets unchanged files skip re-hashing."""
+    index_path = os.path.join(store_dir, STAT_INDEX_NAME)
+    if os.path.isfile(index_path):
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            print(f"WARNING: Ignoring unreadable stat index {index_path}")
+    return {}
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def store_object(store_dir, source_path, file_hash):
+    """Adds a file to the object store unless an object with the same hash already exists."""
+    dest_path = object_path(store_dir, file_hash)
+    if os.path.exists(dest_path):
+        return False
+
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    shutil.copy2(source_path, tmp_path)
+    # Objects are immutable, which also makes hardlinked restores safe
+    os.chmod(tmp_path, 0o444)
+    os.replace(tmp_path, dest_path)
+    return True
+
+def snapshot_files(root_dir, log_dir, store_dir, ignore_patterns=None, ignore_file=None):
     """
-    Copy all files in the specified root directory to the log directory.
-    
+    Records all files of the root directory in a content-addressed object store.
+    Each distinct file content is stored once; the run only gets a manifest (path → hash, size, mtime).
+
     Args:
         root_dir (str): Path of the directory to track files from
-        log_dir (str): Path to the log directory where files should be copied
+        log_dir (str): Path to the log directory where the manifest is written
+        store_dir (str): Path of the shared object store
     """
-    # Ensure absolute paths
     root_dir = os.path.abspath(root_dir)
     log_dir = os.path.abspath(log_dir)
+    store_dir = os.path.abspath(store_dir)
 
-    # Check if root directory exists
     if not os.path.isdir(root_dir):
         print(f"ERROR: Root directory '{root_dir}' does not exist.")
-        return
-
-    # List all files in the specified root directory (non-recursive)
-    source_files = [
-        os.path.join(root_dir, f) for f in os.listdir(root_dir) if os.path.isfile(os.path.join(root_dir, f))
-    ]
+        return None
 
-    # Create log directory if it doesn't exist
+    patterns = load_ignore_patterns(root_dir, ignore_patterns, ignore_file)
     os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(store_dir, exist_ok=True)
+    stat_index = load_stat_index(store_dir)
 
-    # Create timestamp for logging
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    files = {}
+    stored = 0
+    stored_bytes = 0
+    for filename in sorted(os.listdir(root_dir)):
+        source_path = os.path.join(root_dir, filename)
+        if not os.path.isfile(source_path):
+            continue
+        if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
+            print(f"Ignoring {filename}")
+            continue
 
-    # Copy each file
-    for source_path in source_files:
         try:
-            filename = os.path.basename(source_path)
-            dest_path = os.path.join(log_dir, filename)
+            stat = os.stat(source_path)
+            cached = stat_index.get(source_path)
+            if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+                file_hash = cached["sha256"]
+            else:
+                file_hash = hash_file(source_path)
+                stat_index[source_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash}
 
-            shutil.copy2(source_path, dest_path)
-            print(f"Successfully copied {filename} to {dest_path}")
+            if store_object(store_dir, source_path, file_hash):
+                stored += 1
+                stored_bytes += stat.st_size
+
+            files[filename] = {
+                "sha256": file_hash,
+                "size": stat.st_size,
+                "mtime": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            }
+            print(f"Tracked {filename} ({file_hash[:12]})")
 
         except Exception as e:
-            print(f"Error copying {source_path}: {str(e)}")
+            print(f"Error tracking {source_path}: {str(e)}")
+
+    manifest = {
+        "root_dir": root_dir,
+        "store": store_dir,
+        "created": datetime.now().strftime("%Y-%m-%d_%H-%M-%S"),
+        "files": files,
+    }
+    manifest_path = os.path.join(log_dir, MANIFEST_NAME)
+    write_json_atomic(manifest_path, manifest)
+    # Runs tracking files at the same time merge their entries instead of overwriting each other's
+    index_path = os.path.join(store_dir, STAT_INDEX_NAME)
+    with run_allocator.file_lock(index_path):
+        write_json_atomic(index_path, {**load_stat_index(store_dir), **stat_index})
+
+    print(f"Manifest with {len(files)} files written to {manifest_path} ({stored} new objects, {stored_bytes} bytes stored)")
+    return manifest_path
+
+def load_manifest(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def restore_snapshot(manifest_path, target_dir, store_dir=None, hardlink=False):
+    """Materializes the files of a manifest from the object store, optionally as read-only hardlinks."""
+    manifest = load_manifest(manifest_path)
+    store_dir = store_dir or manifest["store"]
+    os.makedirs(target_dir, exist_ok=True)
+
+    for filename, entry in manifest["files"].items():
+        source_path = object_path(store_dir, entry["sha256"])
+        dest_path = os.path.join(target_dir, filename)
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        if hardlink:
+            try:
+                os.link(source_path, dest_path)
+                continue
+            except OSError as e:
+                print(f"WARNING: Hardlink failed for {filename} ({e}), copying instead")
+        shutil.copyfile(source_path, dest_path)
+        print(f"Restored {filename}")
+
+    print(f"Restored {len(manifest['files'])} files to {target_dir}")
+
+def verify_snapshot(manifest_path, store_dir=None):
+    """Checks that every object of a manifest exists in the store and still matches its hash."""
+    manifest = load_manifest(manifest_path)
+    store_dir = store_dir or manifest["store"]
+    problems = 0
+
+    for filename, entry in manifest["files"].items():
+        source_path = object_path(store_dir, entry["sha256"])
+        if not os.path.isfile(source_path):
+            print(f"MISSING {filename} ({entry['sha256'][:12]})")
+            problems += 1
+        elif hash_file(source_path) != entry["sha256"]:
+            print(f"CORRUPT {filename} ({entry['sha256'][:12]})")
+            problems += 1
+
+    print(f"Verified {len(manifest['files'])} files, {problems} problem(s)")
+    return problems == 0
 
 def main():
-    parser = argparse.ArgumentParser(description="Copy all files in the specified directory to a log directory")
-    parser.add_argument("--root-dir", required=True, help="Path to the directory containing files to track")
-    parser.add_argument("--output", required=True, help="Path to the output log directory")
+    parser = argparse.ArgumentParser(description="Track the files of a directory in a content-addressed store and write a per-run manifest")
+    parser.add_argument("--root-dir", help="Path to the directory containing files to track")
+    parser.add_argument("--output", help="Path to the output log directory (receives manifest.json)")
+    parser.add_argument("--store", default="./logs/.objects", help="Path to the shared content-addressed object store")
+    parser.add_argument("--ignore", action="append", default=[], help="Glob pattern of file names to skip (repeatable)")
+    parser.add_argument("--ignore-file", help="File with one ignore glob per line (default: <root-dir>/.trackignore)")
+    parser.add_argument("--restore", metavar="MANIFEST", help="Restore the files of a manifest into --target")
+    parser.add_argument("--target", help="Target directory for --restore")
+    parser.add_argument("--hardlink", action="store_true", help="Restore files as hardlinks into the store instead of copies")
+    parser.add_argument("--verify", metavar="MANIFEST", help="Verify that all objects of a manifest are present and intact")
     args = parser.parse_args()
 
-    copy_files_to_log(args.root_dir, args.output)
+    if args.verify:
+        sys.exit(0 if verify_snapshot(args.verify, args.store) else 1)
+    elif args.restore:
+        if not args.target:
+            parser.error("--target is required with --restore.")
+        restore_snapshot(args.restore, args.target, args.store, args.hardlink)
+    else:
+        if not args.root_dir or not args.output:
+            parser.error("--root-dir and --output are required to take a snapshot.")
+        if snapshot_files(args.root_dir, args.output, args.store, args.ignore, args.ignore_file) is None:
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,40 @@
 import os
-import requests
-from rdflib import Graph
+import contextlib
+import hashlib
+import json
 from typing import Union
+import threading
 import time
+import tracing
+import operational_metrics
+import endpoint_pool
+import cassette
+import event_log
+import run_allocator
+
+# Process-wide caches shared by all pipeline stages running in the same interpreter
+_http_session = None
+_llm_clients = {}
+_local_graphs = {}
+_cache_lock = threading.Lock()
+_graph_load_lock = threading.Lock()
+_graph_query_lock = threading.Lock()
+
+# Global budgets for concurrent LLM calls and endpoint requests (None = unlimited)
+_llm_semaphore = None
+_endpoint_semaphore = None
+
+def _budget_slot(semaphore, resource: str):
+    governor = run_allocator.governor()
+    if governor is None:
+        return semaphore if semaphore is not None else contextlib.nullcontext()
+    return _host_budget_slot(semaphore, governor, resource)
+
+@contextlib.contextmanager
+def _host_budget_slot(semaphore, governor, resource: str):
+    # The process slot is taken first, so threads waiting for it don't hold host-wide slots
+    with semaphore if semaphore is not None else contextlib.nullcontext(), governor.slot(resource):
+        yield
 
 class Utils:
     @staticmethod
@@ -37,21 +69,128 @@ class Utils:
             print(f"WARNING: Could not read file {file_path}: {e}")
             return ""
 
+    @staticmethod
+    def fingerprint(value) -> str:
+        """Returns a stable SHA-256 hash of a JSON-serializable value."""
+        return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def configure_concurrency(llm_concurrency: int = None, endpoint_concurrency: int = None):
+        """Limits how many LLM calls and endpoint requests may run at the same time in this process."""
+        global _llm_semaphore, _endpoint_semaphore
+        _llm_semaphore = threading.BoundedSemaphore(llm_concurrency) if llm_concurrency else None
+        _endpoint_semaphore = threading.BoundedSemaphore(endpoint_concurrency) if endpoint_concurrency else None
+
+    @staticmethod
+    def add_runtime_arguments(parser):
+        """Adds the cross-cutting runtime flags shared by all stage scripts."""
+        parser.add_argument("--trace_dir", type=str, help="Record latency spans and write a Chrome trace per process into this directory.")
+        parser.add_argument("--endpoint_pool", type=str, help="JSON file of equivalent SPARQL endpoints per dataset, requests are routed and failed over between them.")
+        parser.add_argument("--cassette", type=str, help="Cassette file the LLM, SPARQL and shexer traffic is recorded into or replayed from.")
+        parser.add_argument("--cassette_mode", type=str, choices=cassette.MODES, default=cassette.REPLAY, help="Record the traffic of a live run, or replay it without network.")
+        parser.add_argument("--event_log_dir", type=str, help="Write structured JSONL log records per process into this directory.")
+        parser.add_argument("--log_level", type=str, choices=list(event_log.LEVELS), default="info", help="Minimum level of the structured log records (debug includes prompts, queries and results).")
+        parser.add_argument("--log_sample_rate", type=float, default=0.1, help="Fraction of questions whose per-attempt debug detail is logged (default: 0.1).")
+        parser.add_argument("--governor_dir", type=str, help="Directory of the host-wide governor; runs using the same directory share the LLM and endpoint budgets and throttles.")
+        parser.add_argument("--host_llm_concurrency", type=int, help="Limit of concurrent LLM calls of all runs sharing the governor directory.")
+        parser.add_argument("--host_endpoint_concurrency", type=int, help="Limit of concurrent endpoint requests of all runs sharing the governor directory.")
+
+    @staticmethod
+    def configure_runtime(args, process_name: str):
+        """Applies the runtime flags added by add_runtime_arguments."""
+        if getattr(args, "trace_dir", None) not in (None, "", "None"):
+            tracing.enable(args.trace_dir, process_name)
+        if getattr(args, "endpoint_pool", None) not in (None, "", "None"):
+            endpoint_pool.configure(args.endpoint_pool)
+        cassette.set_scope(process_name)
+        if getattr(args, "cassette", None) not in (None, "", "None"):
+            cassette.configure(args.cassette, args.cassette_mode)
+        if getattr(args, "event_log_dir", None) not in (None, "", "None"):
+            event_log.configure(args.event_log_dir, process_name, args.log_level, args.log_sample_rate)
+        if any(getattr(args, key, None) not in (None, "", "None") for key in ("governor_dir", "host_llm_concurrency", "host_endpoint_concurrency")):
+            run_allocator.configure_governor(
+                None if args.governor_dir in (None, "", "None") else args.governor_dir, args.host_llm_concurrency, args.host_endpoint_concurrency
+            )
+
+    @staticmethod
+    def llm_slot():
+        """Context manager holding one slot of the LLM concurrency budget (and of the host-wide budget, see run_allocator.py)."""
+        return _budget_slot(_llm_semaphore, "llm")
+
+    @staticmethod
+    def endpoint_slot():
+        """Context manager holding one slot of the endpoint concurrency budget (and of the host-wide budget, see run_allocator.py)."""
+        return _budget_slot(_endpoint_semaphore, "endpoint")
+
+    @staticmethod
+    def throttle(seconds: float, reason: str, endpoint: str = None):
+        """
+        Fixed throttle sleep; with a host-wide governor, parallel runs against the same endpoint share its schedule
+        instead of each sleeping on its own.
+        """
+        governor = run_allocator.governor()
+        if governor is None:
+            tracing.sleep(seconds, reason)
+        else:
+            governor.pace(seconds, reason, endpoint)
+
+    @staticmethod
+    def get_http_session():
+        """Returns the process-wide requests session so endpoint connections are pooled and reused."""
+        import requests
+
+        global _http_session
+        with _cache_lock:
+            if _http_session is None:
+                _http_session = requests.Session()
+            return _http_session
+
+    @staticmethod
+    def get_llm_client(api_key: str, llm_provider: str):
+        """
+        Returns a cached OpenAI-compatible client for the given provider and API key.
+        With a cassette (--cassette), a stand-in that records or replays the completions of the client.
+        """
+        def client():
+            from openai import OpenAI
+
+            key = (api_key, llm_provider)
+            with _cache_lock:
+                if key not in _llm_clients:
+                    _llm_clients[key] = OpenAI(api_key=api_key, base_url=Utils.resolve_llm_provider(llm_provider))
+                return _llm_clients[key]
+
+        if cassette.active() is not None:
+            return cassette.llm_client(client, llm_provider)
+        return client()
+
+    @staticmethod
+    def public_endpoint(dataset_type: str, default_url: str):
+        """
+        Returns the endpoint pool used for entity lookups and shape extraction of a dataset type.
+        It can be overridden with <DATASET_TYPE>_SPARQL_ENDPOINT (e.g. DBPEDIA_SPARQL_ENDPOINT, comma-separated for several
+        mirrors) or the group of the dataset type in the --endpoint_pool file, for example to add a mirror or a local mock.
+        """
+        return endpoint_pool.dataset_pool(dataset_type, default_url)
+
     @staticmethod
     def query_sparql_endpoint(sparql_query: str, endpoint_url: str, max_retries: int = 15, backoff_factor: float = 1.5) -> Union[list, dict]:
         """
         Executes a SPARQL query against a remote endpoint and returns the result values.
-        Implements retry logic in case of 502/503/504 errors.
+        The request goes to the best endpoint of the endpoint's pool and fails over to its mirrors;
+        implements retry logic in case of 502/503/504 errors of all of them.
 
         Args:
             sparql_query: The SPARQL query string.
-            endpoint_url: The URL of the SPARQL endpoint.
+            endpoint_url: The URL of the SPARQL endpoint (or comma-separated equivalent endpoints).
             max_retries: Maximum number of retry attempts.
             backoff_factor: Exponential backoff factor in seconds.
 
         Returns:
             A list of result values (as strings), or a dictionary with {"error": "..."}.
         """
+        import requests
+
         headers = {
             "User-Agent": "SPARQLQueryBot/1.0 (contact: example@example.com)"
         }
@@ -60,9 +199,10 @@ class Utils:
             "format": "json"
         }
 
+        pool = endpoint_pool.pool_for(endpoint_url)
         for attempt in range(1, max_retries + 1):
             try:
-                response = requests.get(endpoint_url, headers=headers, params=data, timeout=20)
+                response = pool.get(data, headers=headers, timeout=20, http_attempt=attempt)
                 response.raise_for_status()
                 json_response = response.json()
 
@@ -78,27 +218,59 @@ class Utils:
 
             except requests.exceptions.HTTPError as http_err:
                 # Retry on transient errors
-                if response.status_code in [502, 503, 504]:
-                    if attempt < max_retries:
-                        sleep_time = backoff_factor ** attempt
-                        print(f"[Retry {attempt}/{max_retries}] HTTP {response.status_code}: Retrying in {sleep_time:.1f}s...")
-                        time.sleep(sleep_time)
-                        continue
-                    elif response.status_code == 400:
-                        return {
-                            "error": "Bad Request (400)",
-                            "message": str(http_err),
-                            "query": sparql_query,
-                            "endpoint": endpoint_url
-                        }                    
-                else:
-                    return {"error": f"HTTPError: {http_err}"}
+                if response.status_code in [502, 503, 504] and attempt < max_retries:
+                    sleep_time = backoff_factor ** attempt
+                    print(f"[Retry {attempt}/{max_retries}] HTTP {response.status_code}: Retrying in {sleep_time:.1f}s...")
+                    event_log.warning("endpoint.retry", endpoint=endpoint_url, status=response.status_code, http_attempt=attempt, sleep_seconds=sleep_time)
+                    tracing.sleep(sleep_time, "endpoint_backoff")
+                    continue
+                if response.status_code == 400:
+                    return {
+                        "error": "Bad Request (400)",
+                        "message": str(http_err),
+                        "query": sparql_query,
+                        "endpoint": endpoint_url,
+                        "kind": "syntax",
+                        "status": 400,
+                    }
+                return {"error": f"HTTPError: {http_err}", "kind": Utils.http_error_kind(response), "status": response.status_code}
+
+            except requests.exceptions.Timeout as e:
+                return {"error": f"RequestException: {e}", "kind": "timeout"}
 
             except requests.exceptions.RequestException as e:
                 # Handle other types of network-related errors
-                return {"error": f"RequestException: {e}"}
+                return {"error": f"RequestException: {e}", "kind": "transient"}
 
-        return {"error": "Failed to retrieve response after multiple attempts."}
+        return {"error": "Failed to retrieve response after multiple attempts.", "kind": "transient"}
+
+    @staticmethod
+    def http_error_kind(response) -> str:
+        """
+        Classifies a failed endpoint response for the retry policy: "timeout", "transient" or "http".
+        Wikidata and Virtuoso report query timeouts as HTTP 500 with the reason in the body.
+        """
+        body = response.text[:2000].lower() if response.text else ""
+        if response.status_code in (408, 504) or "timeoutexception" in body or "timed out" in body or "estimated execution time" in body:
+            return "timeout"
+        if response.status_code in (429, 502, 503):
+            return "transient"
+        return "http"
+
+    @staticmethod
+    def count_endpoint_request(sparql_query: str, response):
+        """Adds one endpoint request and its payload sizes to the operational metrics of the current question."""
+        operational_metrics.count("endpoint_queries")
+        operational_metrics.count("bytes_sent", operational_metrics.payload_size(sparql_query))
+        operational_metrics.count("bytes_received", len(response.content))
+
+    @staticmethod
+    def count_llm_call(messages, completion):
+        """Adds one LLM call and the sizes of its prompt and answer to the operational metrics of the current question."""
+        operational_metrics.count("llm_calls")
+        operational_metrics.count("bytes_sent", sum(operational_metrics.payload_size(message["content"]) for message in messages))
+        if completion.choices:
+            operational_metrics.count("bytes_received", operational_metrics.payload_size(completion.choices[0].message.content))
 
     @staticmethod
     def guess_rdf_format(file_path: str) -> str:
@@ -112,6 +284,56 @@ class Utils:
         else:
             return "turtle"  # default fallback
 
+    @staticmethod
+    def list_rdf_files(graph_folder: str) -> list:
+        """Returns the sorted paths of all RDF files (.ttl, .rdf, .nt) in a folder."""
+        return sorted(
+            os.path.join(graph_folder, fname)
+            for fname in os.listdir(graph_folder)
+            if fname.endswith((".ttl", ".rdf", ".nt"))
+        )
+
+    @staticmethod
+    def hash_files(file_paths: list, chunk_size: int = 1 << 20) -> str:
+        """
+        Computes a SHA-256 fingerprint over the names and contents of the given files.
+        The order of file_paths is irrelevant, renaming or editing any file changes the hash.
+        """
+        digest = hashlib.sha256()
+        for path in sorted(file_paths):
+            digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    digest.update(chunk)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def load_local_graph(graph_folder: str):
+        """
+        Loads all RDF files of a folder into one rdflib Graph.
+        The graph is cached per folder and reloaded only if the file listing or modification times change.
+        """
+        rdf_files = Utils.list_rdf_files(graph_folder)
+        signature = tuple((fpath, os.path.getmtime(fpath), os.path.getsize(fpath)) for fpath in rdf_files)
+
+        # Serialize loading so concurrent stages parse the same graph only once
+        with _graph_load_lock:
+            cached = _local_graphs.get(graph_folder)
+            operational_metrics.cache("graph", bool(cached and cached[0] == signature))
+            if cached and cached[0] == signature:
+                return cached[1]
+
+            from rdflib import Graph
+
+            g = Graph()
+            with tracing.span("graph.load", graph=graph_folder, files=len(rdf_files)):
+                for fpath in rdf_files:
+                    g.parse(fpath, format=Utils.guess_rdf_format(fpath))
+
+            _local_graphs[graph_folder] = (signature, g)
+            return g
+
     @staticmethod
     def query_local_graph(sparql_query: str, graph_folder: str) -> list:
         """
@@ -125,41 +347,30 @@ class Utils:
             List of stringified query result values or {"error": "..."} on failure.
         """
         try:
-            g = Graph()
-
-            for fname in os.listdir(graph_folder):
-                if fname.endswith((".ttl", ".rdf", ".nt")):
-                    fpath = os.path.join(graph_folder, fname)
-                    fmt = Utils.guess_rdf_format(fpath)
-                    g.parse(fpath, format=fmt)
+            g = Utils.load_local_graph(graph_folder)
 
             if len(g) == 0:
-                return {"error": "No RDF triples were loaded from the folder."}
+                return {"error": "No RDF triples were loaded from the folder.", "kind": "graph"}
 
-            qres = g.query(sparql_query)
-            return [str(val) for row in qres for val in row]
+            # rdflib's SPARQL parser is not thread-safe, so local queries are serialized
+            operational_metrics.count("graph_queries")
+            with _graph_query_lock, tracing.span("graph.query"):
+                qres = g.query(sparql_query)
+                return [str(val) for row in qres for val in row]
 
         except Exception as e:
-            return {"error": str(e)}
+            # rdflib reports unparsable queries as pyparsing exceptions
+            kind = "syntax" if type(e).__name__ in ("ParseException", "ParseSyntaxException") else "evaluation"
+            return {"error": str(e), "kind": kind}
         
     @staticmethod
     def is_faulty_result(result):
-        # Case 1: SPARQL or API error structure
-        if isinstance(result, dict) and "error" in result:
-            return True
-
-        # Case 2: Result is None, empty list, or empty dict
-        if result is None or (isinstance(result, (list, dict)) and not result):
-            return False
-
-        # Case 3: All-zero or meaningless values
-        if isinstance(result, list) and all(str(r).strip() in {"0", "0.0", "", "null", "None"} for r in result):
-            return False
-
-        # Everything else is assumed valid
-        return False
+        """
+        Tells whether a query result is an error. Empty and all-null results are not faulty;
+        see retry_policy.classify_result for the failure class of any result.
+        """
+        return isinstance(result, dict) and "error" in result
 
-    
     @staticmethod
     def resolve_llm_provider(llm_provider: str) -> str:
         """Resolves the LLM provider to a specific string."""
@@ -1,8 +1,16 @@
 import json
 import argparse
-import time
 import math
+import tracing
+import operational_metrics
+import retry_policy
+import endpoint_pool
 from utility import Utils
+from journal import StageJournal
+import result_sidecar
+import multilingual
+import event_log
+import compact_shape
 
 def compare_sparql_results(entry):
     """Compares baseline and LLM-generated SPARQL query responses using TP/FP/FN classification."""
@@ -12,10 +20,6 @@ def compare_sparql_results(entry):
     llm_queries = entry.get("LLM_generated_sparql_query", [])
     llm_entities = set(llm_queries[-1]["result"]) if llm_queries else set()
 
-    # Log preview
-    print(f"First 5 baseline_entities: {list(baseline_entities)[:5] if baseline_entities else 'None'}")
-    print(f"First 5 llm_entities: {list(llm_entities)[:5] if llm_entities else 'None'}")
-
     # Case: no valid baseline -> skip
     if not baseline_entities:
         classification = "Invalid"
@@ -34,6 +38,9 @@ def compare_sparql_results(entry):
 
     print(f"Question ID: {question_id}")
     print(f"Classification: {classification}")
+    event_log.info("verify.classification", question_id=question_id, classification=classification,
+                   baseline_results=len(baseline_entities), llm_results=len(llm_entities))
+    event_log.detail("verify.results", question_id, question_id=question_id, baseline_entities=baseline_entities, llm_entities=llm_entities)
 
     return classification
 
@@ -80,55 +87,95 @@ def compute_effort_normalized_accuracy(f1_score, token_summary, total_questions)
     )
     return ena * 100
 
-def process_json(json_path, sparql_endpoint_url, is_local_graph, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index):
-    """Processes the JSON file, compares SPARQL query results, and appends the comparison results to the JSON file."""
-
-    with open(json_path, "r", encoding="utf-8") as file:
-        data = json.load(file)
-
-    tp = 0
-    fp = 0
-    fn = 0
-    invalid = 0
-
-    for entry in data:
-        question_id = entry.get("baseline_id", "unknown")
-
-        # Baseline SPARQL query
-        baseline_query = entry.get("baseline_sparql_query")
-        baseline_question_text = entry.get("baseline_question_text")
-        print(f"\nbaseline_question_text: {baseline_question_text}")
-        print(f"baseline_sparql_query: {baseline_query}")
+def execute_baseline_query(baseline_query, sparql_endpoint_url, is_local_graph, local_graph_location):
+    if is_local_graph:
+        return Utils.query_local_graph(baseline_query, local_graph_location)
+    return Utils.query_sparql_endpoint(baseline_query, sparql_endpoint_url)
+
+def verify_entry(entry, sparql_endpoint_url, is_local_graph, local_graph_location, gold_answers=None, drift_check=False):
+    """
+    Re-executes the baseline query of one entry, classifies the LLM result and stores the classification.
+    If the question is in gold_answers, the embedded gold answers are used instead and the baseline
+    query is only executed as a drift check (drift_check=True).
+    """
+    question_id = entry.get("baseline_id", "unknown")
+    gold_values = gold_answers.get(str(question_id)) if gold_answers is not None else None
+    if gold_answers is not None:
+        operational_metrics.cache("gold_answers", gold_values is not None)
 
-        # LLM-generated SPARQL query
-        llm_queries = entry.get("LLM_generated_sparql_query", [])
-        llm_query = llm_queries[-1]["query"] if llm_queries else None
-        print(f"llm_generated_sparql_query: {llm_query}")
+    # Baseline SPARQL query
+    baseline_query = entry.get("baseline_sparql_query")
+    baseline_question_text = entry.get("baseline_question_text")
 
-        # Execute baseline query
-        if baseline_query:
-            print(f"🔍 Executing baseline SPARQL query for question ID {question_id}...")
-            if is_local_graph:
-                response = Utils.query_local_graph(baseline_query, local_graph_location)
-                entry["baseline_sparql_query_response"] = response
+    # LLM-generated SPARQL query
+    llm_queries = entry.get("LLM_generated_sparql_query", [])
+    llm_query = llm_queries[-1]["query"] if llm_queries else None
+    event_log.detail(
+        "verify.question", question_id, question_id=question_id, baseline_question_text=baseline_question_text,
+        baseline_sparql_query=baseline_query, llm_generated_sparql_query=llm_query,
+    )
 
-            else:
-                response = Utils.query_sparql_endpoint(baseline_query, sparql_endpoint_url)
-                entry["baseline_sparql_query_response"] = response
-                
-        else:
-            print(f"⚠️ No baseline SPARQL query for question ID {question_id}")
+    # Ensure nested dict exists before assigning
+    if "sparql_comparison_result" not in entry:
+        entry["sparql_comparison_result"] = {}
+
+    # Execute baseline query
+    if gold_values is not None:
+        print(f"🏅 Using embedded gold answers for question ID {question_id}")
+        entry["baseline_sparql_query_response"] = gold_values
+        if drift_check and baseline_query:
+            import gold_answers as gold
+            live_response = execute_baseline_query(baseline_query, sparql_endpoint_url, is_local_graph, local_graph_location)
+            drift = gold.compare_with_live(gold_values, live_response)
+            entry["sparql_comparison_result"]["gold_drift"] = drift
+            if drift["drifted"]:
+                print(f"⚠️ Live results of question ID {question_id} drifted from the gold answers: {drift}")
+
+    elif baseline_query:
+        print(f"🔍 Executing baseline SPARQL query for question ID {question_id}...")
+        entry["baseline_sparql_query_response"] = execute_baseline_query(baseline_query, sparql_endpoint_url, is_local_graph, local_graph_location)
 
-        # Result comparison and accuracy calculation
-        classification = compare_sparql_results(entry)
+    else:
+        print(f"⚠️ No baseline SPARQL query for question ID {question_id}")
 
-        # Ensure nested dict exists before assigning
-        if "sparql_comparison_result" not in entry:
-            entry["sparql_comparison_result"] = {}
+    # Result comparison and accuracy calculation
+    classification = compare_sparql_results(entry)
 
-        entry["sparql_comparison_result"]["is_correct"] = classification
+    entry["sparql_comparison_result"]["is_correct"] = classification
+    verify_languages(entry)
+    return classification
 
+def verify_languages(entry):
+    """Classifies the result of every language of a multilingual record against the shared baseline response."""
+    for language in multilingual.languages_of(entry):
+        view = multilingual.language_view(entry, language)
+        if not view.get("LLM_generated_sparql_query"):
+            continue
+        print(f"🌐 Language {language}:")
+        view.setdefault("sparql_comparison_result", {})["is_correct"] = compare_sparql_results(view)
+        multilingual.store_view(entry, language, view)
+
+def count_extraction_tokens(data):
+    """Sums the entity extraction tokens of all questions (shares of batched calls included); not part of ENA."""
+    totals = {"prompt_tokens": 0.0, "completion_tokens": 0.0, "total_tokens": 0.0, "questions": 0}
+    for entry in data:
+        tokens = entry.get("entity_extraction_tokens")
+        if not tokens:
+            continue
+        totals["questions"] += 1
+        for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            totals[name] += tokens.get(name, 0)
+    return totals
+
+def classification_scores(data):
+    """Counts the TP/FP/FN/Invalid classifications of entries and derives precision, recall, F1 and execution accuracy."""
+    tp = 0
+    fp = 0
+    fn = 0
+    invalid = 0
 
+    for entry in data:
+        classification = entry.get("sparql_comparison_result", {}).get("is_correct")
         if classification == "TP":
             tp += 1
         elif classification == "FP":
@@ -137,9 +184,6 @@ def process_json(json_path, sparql_endpoint_url, is_local_graph, local_graph_loc
             fn += 1
         elif classification == "Invalid":
             invalid += 1
-        
-        # Optional sleep to avoid overloading endpoint
-        time.sleep(1)
 
     precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
     recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
@@ -148,17 +192,87 @@ def process_json(json_path, sparql_endpoint_url, is_local_graph, local_graph_loc
     # Final accuracy and output
     execution_accuracy = (tp * 100)/ (tp + fp + fn) if (tp + fp + fn) > 0 else 0.0
 
+    return {
+        "tp": tp, "fp": fp, "fn": fn, "invalid": invalid,
+        "precision": precision, "recall": recall, "f1_score": f1_score, "execution_accuracy": execution_accuracy,
+    }
+
+def compute_language_metrics(data):
+    """Language → scores, token usage and ENA of the multilingual records; empty for single-language runs."""
+    languages = {}
+    for language, views in multilingual.split_by_language(data).items():
+        scores = classification_scores(views)
+        token_summary = count_total_tokens(views)
+        languages[language] = {
+            **scores,
+            "questions": len(views),
+            "avg_total_tokens": token_summary["total_tokens"] / len(views),
+            "avg_retries": token_summary["avg_retries_per_question"],
+            "ena_score": compute_effort_normalized_accuracy(scores["f1_score"], token_summary, len(views)),
+        }
+    return languages
+
+def compute_metrics(data):
+    """Computes TP/FP/FN counts, precision, recall, F1, execution accuracy and ENA from classified entries."""
+    drift_checked = 0
+    drifted = 0
+
+    for entry in data:
+        drift = entry.get("sparql_comparison_result", {}).get("gold_drift")
+        if drift and drift.get("drifted") is not None:
+            drift_checked += 1
+            drifted += int(drift["drifted"])
+
+    scores = classification_scores(data)
+    tp, fp, fn, invalid = scores["tp"], scores["fp"], scores["fn"], scores["invalid"]
+    precision, recall, f1_score, execution_accuracy = scores["precision"], scores["recall"], scores["f1_score"], scores["execution_accuracy"]
+
     # Count token usage
     token_summary = count_total_tokens(data)
 
     ena_score = compute_effort_normalized_accuracy(f1_score, token_summary, len(data))
-    
+
+    # Wall-clock time, calls, bytes and cache hits recorded by the stages
+    operations = operational_metrics.summarize_records(data)
+    operations["time_normalized_ena"] = operational_metrics.time_normalized_accuracy(ena_score, operations["avg_wall_seconds_per_question"])
+
+    # Partial answer overlap and bootstrap confidence intervals of F1, EA and ENA
+    import evaluation
+    evaluation_result = evaluation.evaluate_run(data, stored_classifications=True)
+
+    return {
+        "tp": tp,
+        "fp": fp,
+        "fn": fn,
+        "invalid": invalid,
+        "precision": precision,
+        "recall": recall,
+        "f1_score": f1_score,
+        "execution_accuracy": execution_accuracy,
+        "token_summary": token_summary,
+        "ena_score": ena_score,
+        "operations": operations,
+        "entity_extraction_tokens": count_extraction_tokens(data),
+        "shape_serialization": compact_shape.summarize_records(data),
+        "retry_policy": retry_policy.summarize_records(data),
+        "endpoints": endpoint_pool.snapshot(),
+        "languages": compute_language_metrics(data),
+        "num_entries": len(data),
+        "gold_drift": {"checked": drift_checked, "drifted": drifted},
+        "partial_precision": evaluation_result["partial_precision"],
+        "partial_recall": evaluation_result["partial_recall"],
+        "confidence_intervals": evaluation_result["confidence_intervals"],
+    }
+
+def write_summary(summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index):
+    """Writes the fixed-width evaluation summary for a run."""
+    token_summary = metrics["token_summary"]
+    num_entries = metrics["num_entries"]
+
     if baseline_run:
         shape_type = "None"
         annotation = "None"
 
-    # Save everything to a summary.txt file
-    summary_path = json_path.replace(".json", "_summary.txt")
     with open(summary_path, "w", encoding="utf-8") as f:
         f.write("==== SPARQL Evaluation Summary ====\n\n")
         f.write(f"LLM Provider for SPARQL Generation:   {llm_provider_sparql_generation}\n")
@@ -180,31 +294,175 @@ def process_json(json_path, sparql_endpoint_url, is_local_graph, local_graph_loc
         f.write(f"Total Prompt Tokens:                  {token_summary['prompt_tokens']}\n")
         f.write(f"Total Completion Tokens:              {token_summary['completion_tokens']}\n")
         f.write(f"Total Tokens:                         {token_summary['total_tokens']}\n\n")
-        f.write(f"Average Prompt Tokens per Q:          {token_summary['prompt_tokens']/len(data):.2f}\n")
-        f.write(f"Average Completion Tokens per Q:      {token_summary['completion_tokens']/len(data):.2f}\n")
-        f.write(f"Average Total Tokens per Q:           {token_summary['total_tokens']/len(data):.2f}\n\n")
+        f.write(f"Average Prompt Tokens per Q:          {token_summary['prompt_tokens']/num_entries:.2f}\n")
+        f.write(f"Average Completion Tokens per Q:      {token_summary['completion_tokens']/num_entries:.2f}\n")
+        f.write(f"Average Total Tokens per Q:           {token_summary['total_tokens']/num_entries:.2f}\n\n")
+        extraction_tokens = metrics.get("entity_extraction_tokens")
+        if extraction_tokens and extraction_tokens["questions"]:
+            f.write(f"Entity Extraction Tokens:             {extraction_tokens['total_tokens']:.0f}\n")
+            f.write(f"Avg. Entity Extraction Tokens per Q:  {extraction_tokens['total_tokens']/extraction_tokens['questions']:.2f}\n\n")
+        # Estimated sizes of the shape in the SPARQL generation prompts (characters / compact_shape.CHARS_PER_TOKEN)
+        shape_serialization = metrics.get("shape_serialization")
+        if shape_serialization and shape_serialization["questions"]:
+            f.write("==== Shape Serialization ====\n\n")
+            f.write(f"Shape Format:                         {shape_serialization['format']}\n")
+            f.write(f"Avg. Native Shape Tokens per Q:       {shape_serialization['avg_native_tokens']:.2f}\n")
+            f.write(f"Avg. Prompt Shape Tokens per Q:       {shape_serialization['avg_prompt_tokens']:.2f}\n")
+            f.write(f"Avg. Shape Tokens Saved per Q:        {shape_serialization['avg_saved_tokens']:.2f}\n")
+            f.write(f"Shape Token Savings:                  {shape_serialization['saved_ratio']:.2%}\n\n")
         f.write("==== Simple Metrics ====\n\n")
         f.write(f"Total Retries:                        {token_summary['total_retries']}\n")
         f.write(f"Avg. Retries per Q:                   {token_summary['avg_retries_per_question']:.2f}\n\n")
-        f.write(f"True Positives (TP):                  {tp}\n")
-        f.write(f"False Positives (FP):                 {fp}\n")
-        f.write(f"False Negatives (FN):                 {fn}\n")
-        f.write(f"Invalid Baseline Entries:             {invalid}\n\n")
+        f.write(f"True Positives (TP):                  {metrics['tp']}\n")
+        f.write(f"False Positives (FP):                 {metrics['fp']}\n")
+        f.write(f"False Negatives (FN):                 {metrics['fn']}\n")
+        f.write(f"Invalid Baseline Entries:             {metrics['invalid']}\n\n")
         f.write("==== Advanced Metrics ====\n\n")
-        f.write(f"Precision:                            {precision:.2f}\n")
-        f.write(f"Recall:                               {recall:.2f}\n")
-        f.write(f"F1-score:                             {f1_score:.2f}\n")
-        f.write(f"Execution Accuracy (TP rate):         {execution_accuracy:.2f}\n")
-        f.write(f"Effort-Normalized Accuracy (ENA):     {ena_score:.2f}\n")
+        f.write(f"Precision:                            {metrics['precision']:.2f}\n")
+        f.write(f"Recall:                               {metrics['recall']:.2f}\n")
+        f.write(f"F1-score:                             {metrics['f1_score']:.2f}\n")
+        f.write(f"Execution Accuracy (TP rate):         {metrics['execution_accuracy']:.2f}\n")
+        f.write(f"Effort-Normalized Accuracy (ENA):     {metrics['ena_score']:.2f}\n")
+
+        languages = metrics.get("languages")
+        if languages:
+            # The metrics above are those of the primary (first) language of each question
+            f.write("\n==== Languages ====\n\n")
+            f.write(f"{'Language':<10}{'Qs':>6}{'TP':>6}{'FP':>6}{'FN':>6}{'Precision':>11}{'Recall':>8}{'F1':>7}{'EA':>8}{'ENA':>8}{'Avg. Tokens':>13}\n")
+            for language, scores in languages.items():
+                f.write(f"{language:<10}{scores['questions']:>6}{scores['tp']:>6}{scores['fp']:>6}{scores['fn']:>6}{scores['precision']:>11.2f}"
+                        f"{scores['recall']:>8.2f}{scores['f1_score']:>7.2f}{scores['execution_accuracy']:>8.2f}{scores['ena_score']:>8.2f}{scores['avg_total_tokens']:>13.2f}\n")
+
+        operations = metrics.get("operations")
+        if operations and (operations["measured_questions"] or operations.get("shared_questions")):
+            f.write("\n==== Operational Metrics ====\n\n")
+            if operations.get("shared_questions"):
+                f.write(f"Qs with Stages Shared by Other Cells: {operations['shared_questions']} (their usage is not counted here)\n")
+            f.write(f"Wall-Clock Seconds (sum over Qs):     {operations['wall_seconds']:.2f}\n")
+            f.write(f"Avg. Wall-Clock Seconds per Q:        {operations['avg_wall_seconds_per_question']:.2f}\n")
+            f.write(f"Run Wall-Clock Seconds:               {operations['run_wall_seconds']:.2f}\n")
+            f.write(f"Throughput (Qs/min):                  {operations['throughput_qpm']:.2f}\n")
+            f.write(f"LLM Calls:                            {operations['llm_calls']}\n")
+            f.write(f"Endpoint Queries:                     {operations['endpoint_queries']}\n")
+            f.write(f"Local Graph Queries:                  {operations['graph_queries']}\n")
+            f.write(f"Bytes Sent:                           {operations['bytes_sent']}\n")
+            f.write(f"Bytes Received:                       {operations['bytes_received']}\n")
+            f.write(f"Cache Hit Rate:                       {operations['cache_hit_rate']:.2f}\n")
+            for cache_name, hit_rate in operations["cache_hit_rates"].items():
+                f.write(f"{'  ' + cache_name.replace('_', ' ').title() + ' Cache Hit Rate:':<38}{hit_rate:.2f}\n")
+            f.write(f"Time-Normalized ENA (T-ENA):          {operations['time_normalized_ena']:.2f}\n")
+
+        retry_summary = metrics.get("retry_policy")
+        # Runs with full accounting count retries and tokens differently, so they always name their accounting
+        accounting = (retry_summary or {}).get("accounting", retry_policy.BASELINE_ACCOUNTING)
+        if retry_summary and (retry_summary["failure_classes"] or accounting != retry_policy.BASELINE_ACCOUNTING):
+            f.write("\n==== Retry Policy ====\n\n")
+            f.write(f"Retry Accounting:                     {accounting}\n")
+            for failure_class in retry_policy.FAILURE_CLASSES:
+                if failure_class in retry_summary["failure_classes"]:
+                    f.write(f"{failure_class.replace('_', ' ').title() + ' Failures:':<38}{retry_summary['failure_classes'][failure_class]}\n")
+            for action in retry_policy.ACTIONS:
+                f.write(f"{action.title() + ' Decisions:':<38}{retry_summary['actions'].get(action, 0)}\n")
+
+        # Pools with mirrors only; the state covers the requests of this process
+        pools = {name: endpoints for name, endpoints in (metrics.get("endpoints") or {}).items() if len(endpoints) > 1}
+        if pools:
+            f.write("\n==== Endpoint Pool ====\n\n")
+            for name, endpoints in pools.items():
+                for endpoint in endpoints:
+                    f.write(f"{name}: {endpoint['url']} ({endpoint['state']}): {endpoint['requests']} requests, "
+                            f"{endpoint['failures']} failures, EWMA latency {endpoint['latency_ms']} ms\n")
+
+        intervals = metrics.get("confidence_intervals")
+        if intervals:
+            f.write(f"\n==== Bootstrap {intervals['confidence'] * 100:.0f}% Confidence Intervals ({intervals['resamples']} resamples) ====\n\n")
+            f.write(f"F1-score:                             [{intervals['f1_score']['low']:.2f}, {intervals['f1_score']['high']:.2f}]\n")
+            f.write(f"Execution Accuracy (TP rate):         [{intervals['execution_accuracy']['low']:.2f}, {intervals['execution_accuracy']['high']:.2f}]\n")
+            f.write(f"Effort-Normalized Accuracy (ENA):     [{intervals['ena_score']['low']:.2f}, {intervals['ena_score']['high']:.2f}]\n")
+            f.write(f"Partial Precision (macro):            {metrics['partial_precision']:.2f}\n")
+            f.write(f"Partial Recall (macro):               {metrics['partial_recall']:.2f}\n")
+
+        gold_drift = metrics.get("gold_drift", {})
+        if gold_drift.get("checked"):
+            f.write("\n==== Gold Answer Drift ====\n\n")
+            f.write(f"Questions Checked Live:               {gold_drift['checked']}\n")
+            f.write(f"Questions Drifted:                    {gold_drift['drifted']}\n")
+
+        latency_rows = tracing.latency_table() if tracing.enabled() else []
+        if latency_rows:
+            f.write("\n==== Latency (ms) ====\n\n")
+            f.write(tracing.format_latency_table(latency_rows) + "\n")
+
+    print(f"\n📊 Execution Accuracy: {metrics['execution_accuracy']:.2f}")
+    print(f"📝 Summary written to: {summary_path}")
+
+def store_results(results_db, data, summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index):
+    """Appends the run and its per-question rows to the results store (skipped if no results_db is given)."""
+    if not results_db:
+        return
+    import results_store
+
+    run = results_store.run_row(summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index)
+    results_store.ResultsStore(results_db).record_run(run, data)
+    print(f"🗄️ Results stored in: {results_db}")
+
+def queries_endpoint(entry, is_local_graph, gold_answers=None, drift_check=False):
+    """Tells whether verifying the entry sends a request to the remote endpoint (and therefore needs throttling)."""
+    if is_local_graph:
+        return False
+    return gold_answers is None or str(entry.get("baseline_id")) not in gold_answers or drift_check
+
+def verify_records(data, sparql_endpoint_url, is_local_graph, local_graph_location, journal=None, gold_answers=None, drift_check=False, sidecar=None):
+    """
+    Verifies all in-memory experiment records and returns the computed metrics.
+    If a journal is given, verified records are appended to it and already journaled questions are skipped.
+    With gold_answers, questions are verified against the embedded answers without endpoint calls.
+    Results referenced in the result sidecar are loaded before the records are compared.
+    """
+    for entry in data:
+        question_id = entry.get("baseline_id", "unknown")
+        if journal is not None and journal.is_completed(question_id):
+            entry.update(journal.get(question_id))
+            result_sidecar.resolve_entry(entry, sidecar)
+            print(f"♻️ Skipping question ID {question_id}, already verified")
+            continue
+
+        result_sidecar.resolve_entry(entry, sidecar)
+        with tracing.context(question_id=question_id), operational_metrics.measure() as usage:
+            verify_entry(entry, sparql_endpoint_url, is_local_graph, local_graph_location, gold_answers, drift_check)
+
+            # Optional sleep to avoid overloading endpoint
+            if queries_endpoint(entry, is_local_graph, gold_answers, drift_check):
+                Utils.throttle(1, "endpoint_throttle", sparql_endpoint_url)
+        usage.add_to(entry)
+        if journal is not None:
+            journal.append(question_id, result_sidecar.externalize_entry(entry, sidecar))
+
+    return compute_metrics(data)
+
+def process_json(json_path, sparql_endpoint_url, is_local_graph, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index, resume=False, results_db=None, gold_cache_dir=None, drift_check=False, result_store_dir=None):
+    """Processes the JSON file, compares SPARQL query results, and appends the comparison results to the JSON file."""
 
+    with tracing.span("file.read", path=json_path), open(json_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
 
+    gold_answers = None
+    if gold_cache_dir:
+        import gold_answers as gold
+        gold_answers = gold.load_gold_answers(benchmark_dataset, gold_cache_dir)
 
-    print(f"\n📊 Execution Accuracy: {execution_accuracy:.2f}")
-    print(f"📝 Summary written to: {summary_path}")
+    sidecar = result_sidecar.open_sidecar(result_store_dir)
+    journal = StageJournal(StageJournal.path_for(json_path, "verify_sparql"), resume)
+    metrics = verify_records(data, sparql_endpoint_url, is_local_graph, local_graph_location, journal, gold_answers, drift_check, sidecar)
+
+    # Save everything to a summary.txt file
+    summary_path = json_path.replace(".json", "_summary.txt")
+    write_summary(summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index)
+    store_results(results_db, data, summary_path, metrics, sparql_endpoint_url, local_graph_location, num_questions, max_retries, log_dir, llm_provider_sparql_generation, llm_provider_entity_extraction, model_entity_extraction, model_sparql_generation, benchmark_dataset, shape_type, dataset_type, annotation, baseline_run, run_index)
 
     # Save updated dataset
-    with open(json_path, "w", encoding="utf-8") as file:
-        json.dump(data, file, indent=4, ensure_ascii=False)
+    with tracing.span("file.write", path=json_path), open(json_path, "w", encoding="utf-8") as file:
+        json.dump(result_sidecar.externalize_records(data, sidecar), file, indent=4, ensure_ascii=False)
 
     print(f"✅ All queries executed and results saved to {json_path}")
 
@@ -228,7 +486,17 @@ if __name__ == "__main__":
     parser.add_argument("--annotation", type=str, help="Annotation type for the dataset.")
     parser.add_argument("--baseline_run", type=Utils.str_to_bool, help="Indicates if this is a baseline run.")
     parser.add_argument("--run_index", type=str, help="Run ID for the current execution.")
+    parser.add_argument("--resume", type=Utils.str_to_bool, default=False, help="Skip questions already completed in the stage journal.")
+    parser.add_argument("--results_db", type=str, help="SQLite results store the run is appended to (default: none).")
+    parser.add_argument("--gold_answers", type=Utils.str_to_bool, default=False, help="Verify against the benchmark's embedded answers instead of re-executing the gold queries.")
+    parser.add_argument("--gold_cache_dir", type=str, default="./cache/gold", help="Directory of the gold answer indexes.")
+    parser.add_argument("--result_store_dir", type=str, default="./cache/results", help="Content-addressed store for query results referenced from the JSON (\"None\" keeps results inline).")
+    parser.add_argument("--gold_drift_check", type=Utils.str_to_bool, default=False, help="With --gold_answers, also re-execute the gold queries and report drift.")
+    Utils.add_runtime_arguments(parser)
 
     args = parser.parse_args()
-    
-    process_json(args.json_path, args.sparql_endpoint_url, args.is_local_graph, args.local_graph_location, args.num_questions, args.max_retries, args.log_dir, args.llm_provider_sparql_generation, args.llm_provider_entity_extraction, args.model_entity_extraction, args.model_sparql_generation, args.benchmark_dataset, args.shape_type, args.dataset_type, args.annotation, args.baseline_run, args.run_index)
+    Utils.configure_runtime(args, "verify_sparql")
+    if args.gold_answers and not args.benchmark_dataset:
+        parser.error("--benchmark_dataset is required with --gold_answers.")
+
+    process_json(args.json_path, args.sparql_endpoint_url, args.is_local_graph, args.local_graph_location, args.num_questions, args.max_retries, args.log_dir, args.llm_provider_sparql_generation, args.llm_provider_entity_extraction, args.model_entity_extraction, args.model_sparql_generation, args.benchmark_dataset, args.shape_type, args.dataset_type, args.annotation, args.baseline_run, args.run_index, args.resume, args.results_db, args.gold_cache_dir if args.gold_answers else None, args.gold_drift_check, args.result_store_dir)